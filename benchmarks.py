@@ -0,0 +1,882 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for  Macro Recorder
+Run: python benchmarks.py <name> [--events N]
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+from array import array
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows; only the 'mapped' benchmark needs it
+    resource = None
+
+import delta_codec
+from event_editor import EventEditor
+from event_index import EventIndex, parse_query
+from event_store import COLUMNS, EventStore, MOUSE_MOVE, MOUSE_CLICK, KEY_PRESS, KEY_RELEASE, seconds_to_us
+from capture_buffer import CaptureRing, CaptureDrain
+from path_simplifier import OnlineMoveSimplifier, simplify_moves
+from playback import PlaybackEngine, LoopSchedule, TIMING_MODES, OVERRUN_POLICIES
+from clock import DEFAULT_CLOCK, NS_PER_SECOND, VirtualClock
+from input_backends import NullBackend, SyntheticBackend
+from macro_recorder import MacroRecorder
+from macro_file import load_events, save_events
+from recording_journal import RecordingJournal, recover_journal
+
+
+def generate_event_dicts(count, seed=1):
+    """Generate a synthetic recording shaped like a real anti-AFK capture (mostly mouse moves)"""
+    rng = random.Random(seed)
+    events = []
+    timestamp = 0.0
+    x, y = 960, 540
+    for _ in range(count):
+        timestamp += rng.uniform(0.001, 0.016)
+        roll = rng.random()
+        if roll < 0.9:
+            x += rng.randint(-5, 5)
+            y += rng.randint(-5, 5)
+            events.append({'type': 'mouse_move', 'timestamp': timestamp, 'x': x, 'y': y})
+        elif roll < 0.95:
+            events.append({'type': 'mouse_click', 'timestamp': timestamp, 'x': x, 'y': y,
+                           'button': 'left', 'pressed': roll < 0.925})
+        else:
+            events.append({'type': 'key_press' if roll < 0.975 else 'key_release',
+                           'timestamp': timestamp, 'key': rng.choice('wasd')})
+    return events
+
+
+def generate_event_store(count, seed=1):
+    """Same shape as generate_event_dicts, appended straight into an EventStore"""
+    rng = random.Random(seed)
+    store = EventStore()
+    left = store.intern_button('left')
+    key_ids = [store.intern_key(k) for k in 'wasd']
+    timestamp = 0
+    x, y = 960, 540
+    for _ in range(count):
+        timestamp += rng.randint(1_000, 16_000)
+        roll = rng.random()
+        if roll < 0.9:
+            x += rng.randint(-5, 5)
+            y += rng.randint(-5, 5)
+            store.append_raw(MOUSE_MOVE, timestamp, x, y)
+        elif roll < 0.95:
+            store.append_raw(MOUSE_CLICK, timestamp, x, y, button_id=left, pressed=int(roll < 0.925))
+        else:
+            store.append_raw(KEY_PRESS if roll < 0.975 else KEY_RELEASE, timestamp,
+                             key_id=rng.choice(key_ids))
+    return store
+
+
+def _measure(builder, count):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = builder(count)
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def bench_memory(args):
+    """Memory held by a list of event dicts vs. an EventStore"""
+    count = args.events
+    _, dict_bytes, dict_time = _measure(generate_event_dicts, count)
+    store, store_bytes, store_time = _measure(generate_event_store, count)
+    print(f"📊 {count:,} events")
+    print(f"   list of dicts: {dict_bytes / 1e6:8.1f} MB  ({dict_bytes / count:6.1f} B/event, built in {dict_time:.2f}s)")
+    print(f"   EventStore   : {store_bytes / 1e6:8.1f} MB  ({store_bytes / count:6.1f} B/event, built in {store_time:.2f}s)")
+    print(f"   columns only : {store.nbytes() / 1e6:8.1f} MB")
+    print(f"   reduction    : {dict_bytes / max(store_bytes, 1):.1f}x")
+
+
+def bench_capture(args):
+    """Stress the capture ring: synthetic listener callbacks at a fixed rate (default 20k events/s)"""
+    rate = args.rate
+    total = int(rate * args.seconds)
+    store = EventStore()
+    ring = CaptureRing(args.capacity)
+    
+    def sink(batch):
+        append = store.append_raw
+        for item in batch:
+            append(item[0], int(item[1] * 1_000_000), item[2], item[3])
+    
+    drain = CaptureDrain([ring], sink)
+    push_times = []
+    
+    def producer():
+        started = time.perf_counter()
+        for i in range(total):
+            # Pace like a mouse hook firing at `rate` Hz, sleeping in small slices when ahead
+            if i % 100 == 0:
+                ahead = started + i / rate - time.perf_counter()
+                if ahead > 0:
+                    time.sleep(ahead)
+            t0 = time.perf_counter()
+            ring.push((MOUSE_MOVE, t0, i & 1023, i >> 10))
+            push_times.append(time.perf_counter() - t0)
+    
+    drain.start()
+    started = time.perf_counter()
+    thread = threading.Thread(target=producer)
+    thread.start()
+    thread.join()
+    elapsed = time.perf_counter() - started
+    drain.stop()
+    
+    stats = drain.stats()
+    push_times.sort()
+    print(f"📊 Pushed {total:,} events in {elapsed:.2f}s ({total / elapsed:,.0f} events/s)")
+    print(f"   stored      : {len(store):,}")
+    print(f"   overflow    : {stats['overflow']:,}")
+    print(f"   high-water  : {stats['high_water']:,} / {ring.capacity:,}")
+    print(f"   batches     : {stats['batches']:,} (max {stats['max_batch']:,} events)")
+    print(f"   push p50/p99/max: {push_times[len(push_times) // 2] * 1e6:.2f} / "
+          f"{push_times[int(len(push_times) * 0.99)] * 1e6:.2f} / {push_times[-1] * 1e6:.2f} µs")
+    if len(store) + stats['overflow'] != total:
+        print("❌ Stored + dropped does not match pushed!")
+
+
+def bench_simplify(args):
+    """Compression ratio and cost of mouse path simplification (post pass and online)"""
+    store = generate_event_store(args.events)
+    for tolerance_px, tolerance_ms in ((1.0, 10.0), (2.0, 30.0), (5.0, 60.0)):
+        started = time.perf_counter()
+        simplified, stats = simplify_moves(store, tolerance_px, tolerance_ms)
+        elapsed = time.perf_counter() - started
+        print(f"📊 post   {tolerance_px:4.1f}px/{tolerance_ms:4.0f}ms: {len(store):,} -> {len(simplified):,} events, "
+              f"moves {stats['ratio']:.1f}x smaller in {elapsed:.2f}s")
+    
+    online_store = EventStore()
+    simplifier = OnlineMoveSimplifier(online_store)
+    started = time.perf_counter()
+    for i in range(len(store)):
+        if store.types[i] == MOUSE_MOVE:
+            simplifier.add(store.timestamps[i], store.x[i], store.y[i])
+        else:
+            simplifier.flush()
+            online_store.append_raw(store.types[i], store.timestamps[i])
+    simplifier.flush()
+    elapsed = time.perf_counter() - started
+    print(f"📊 online  2.0px/  30ms: moves {simplifier.stats()['ratio']:.1f}x smaller in {elapsed:.2f}s "
+          f"({elapsed / len(store) * 1e6:.1f} µs/event)")
+
+
+class _StubMouse:
+    """Stand-in controller that accepts calls without touching the OS"""
+    position = (0, 0)
+    
+    def press(self, button):
+        pass
+    
+    def release(self, button):
+        pass
+    
+    def scroll(self, dx, dy):
+        pass
+
+
+class _StubKeyboard:
+    def press(self, key):
+        pass
+    
+    def release(self, key):
+        pass
+
+
+def _legacy_string_to_key(key_string):
+    # Mirrors the old string_to_key, which rebuilt its lookup table on every call
+    special_keys = {name: name.upper() for name in (
+        'alt', 'alt_l', 'alt_r', 'backspace', 'caps_lock', 'cmd', 'cmd_l', 'cmd_r', 'ctrl', 'ctrl_l',
+        'ctrl_r', 'delete', 'down', 'end', 'enter', 'esc', 'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7',
+        'f8', 'f9', 'f10', 'f11', 'f12', 'home', 'left', 'page_down', 'page_up', 'right', 'shift',
+        'shift_l', 'shift_r', 'space', 'tab', 'up')}
+    return special_keys.get(key_string, key_string)
+
+
+class _LegacyButton:
+    left, right, middle = 'LEFT', 'RIGHT', 'MIDDLE'
+
+
+def _legacy_dispatch(events):
+    """The pre-compile play_sequence loop body, minus the sleeps"""
+    for event in events:
+        mouse_controller = _StubMouse()
+        keyboard_controller = _StubKeyboard()
+        if event['type'] == 'mouse_move':
+            mouse_controller.position = (event['x'], event['y'])
+        elif event['type'] == 'mouse_click':
+            mouse_controller.position = (event['x'], event['y'])
+            button = getattr(_LegacyButton, event['button'])
+            if event['pressed']:
+                mouse_controller.press(button)
+            else:
+                mouse_controller.release(button)
+        elif event['type'] == 'mouse_scroll':
+            mouse_controller.position = (event['x'], event['y'])
+            mouse_controller.scroll(event['dx'], event['dy'])
+        elif event['type'] == 'key_press':
+            keyboard_controller.press(_legacy_string_to_key(event['key']))
+        elif event['type'] == 'key_release':
+            keyboard_controller.release(_legacy_string_to_key(event['key']))
+
+
+def bench_dispatch(args):
+    """Per-event dispatch cost: legacy interpreter loop vs. compiled PlaybackPlan"""
+    events = generate_event_dicts(args.events)
+    store = EventStore(events)
+    engine = PlaybackEngine(_StubMouse(), _StubKeyboard(), _legacy_string_to_key,
+                            lambda name: getattr(_LegacyButton, name))
+    
+    started = time.perf_counter()
+    _legacy_dispatch(events)
+    legacy = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    engine.compile(store)
+    compile_time = time.perf_counter() - started
+    
+    # Zero every timestamp so each step is due immediately and only dispatch is measured
+    store.timestamps = array('q', bytes(8 * len(store)))
+    plan = engine.compile(store)
+    started = time.perf_counter()
+    engine.run(plan, DEFAULT_CLOCK)
+    compiled = time.perf_counter() - started
+    
+    count = len(events)
+    print(f"📊 {count:,} events")
+    print(f"   legacy dispatch : {legacy / count * 1e9:7.0f} ns/event")
+    print(f"   compile (once)  : {compile_time / count * 1e9:7.0f} ns/event")
+    print(f"   plan dispatch   : {compiled / count * 1e9:7.0f} ns/event  ({legacy / compiled:.1f}x faster)")
+
+
+def bench_timing(args):
+    """Playback lateness and CPU use: power-saving sleeps vs. precise sleep+spin"""
+    count = min(args.events, 500)
+    store = EventStore()
+    for i in range(count):
+        # One event every 7 ms, off the 1 ms grid most OS timers round to
+        store.append_raw(MOUSE_MOVE, i * 7_000, i & 1023, 0)
+    engine = PlaybackEngine(_StubMouse(), _StubKeyboard(), _legacy_string_to_key,
+                            lambda name: getattr(_LegacyButton, name))
+    plan = engine.compile(store)
+    
+    print(f"📊 {count:,} events at 7 ms spacing ({plan.duration_ns / 1e9:.1f}s per run)")
+    for mode in TIMING_MODES:
+        engine.set_timing(mode)
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        engine.run(plan, DEFAULT_CLOCK)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        summary = engine.last_stats.summary()
+        print(f"   {mode:<12}: p50 {summary['p50_ms']:.3f} ms · p99 {summary['p99_ms']:.3f} ms · "
+              f"max {summary['max_ms']:.3f} ms · CPU {cpu / elapsed * 100:.0f}%")
+        print("      " + "  ".join(f"{label}: {hits}" for label, hits in summary['histogram']))
+
+
+def bench_loop(args):
+    """A day of looping on a virtual clock: fixed-delay drift vs. fixed-rate start error"""
+    period_s = 60.0
+    iterations = int(86_400 / period_s)
+    rng = random.Random(1)
+    # Runs usually take ~1.5s; one in fifty stalls past the period
+    durations = [rng.uniform(61, 130) if rng.random() < 0.02 else rng.uniform(1.0, 2.0)
+                 for _ in range(iterations)]
+    
+    clock = VirtualClock()
+    for duration in durations:
+        clock.advance(duration)
+        clock.sleep(period_s)
+    drift_s = clock.now_ns() / NS_PER_SECOND - iterations * period_s
+    print(f"📊 {iterations:,} iterations, {period_s:g}s period")
+    print(f"   fixed_delay         : last start {drift_s:8.1f}s behind the grid")
+    
+    for policy in OVERRUN_POLICIES:
+        clock = VirtualClock()
+        schedule = LoopSchedule(int(period_s * NS_PER_SECOND), clock.now_ns(), policy)
+        runs = 0
+        while clock.now_ns() < iterations * period_s * NS_PER_SECOND:
+            schedule.started(clock.now_ns())
+            clock.advance(durations[runs % iterations])
+            runs += 1
+            clock.wait_until(schedule.advance(clock.now_ns()))
+        stats = schedule.stats()
+        print(f"   fixed_rate/{policy:<9}: {runs:,} runs, start error mean {stats['mean_error_ms']:8.1f} ms, "
+              f"max {stats['max_error_ms'] / 1000:6.1f}s, overruns {stats['overruns']}, skipped {stats['skipped']}")
+
+
+def bench_warp(args):
+    """Compile cost and resulting run length of time-warped plans (the warp adds no per-event work at play time)"""
+    store = generate_event_store(args.events)
+    engine = PlaybackEngine(_StubMouse(), _StubKeyboard(), _legacy_string_to_key,
+                            lambda name: getattr(_LegacyButton, name))
+    print(f"📊 {len(store):,} events, recorded length {store.duration:.0f}s")
+    for speed, max_gap_s, compressed_gap_s in ((1.0, None, None), (5.0, None, None),
+                                               (1.0, 0.01, 0.005), (5.0, 0.01, 0.005)):
+        started = time.perf_counter()
+        plan = engine.compile(store, speed, max_gap_s, compressed_gap_s)
+        elapsed = time.perf_counter() - started
+        gaps = f"gaps >{max_gap_s * 1000:g}ms -> {compressed_gap_s * 1000:g}ms" if max_gap_s else "no gap compression"
+        print(f"   {speed:4.1f}x, {gaps:<26}: plays in {plan.duration_ns / NS_PER_SECOND:7.1f}s, "
+              f"compiled in {elapsed / len(store) * 1e9:5.0f} ns/event")
+
+
+class _CountingMouse(_StubMouse):
+    """Stub controller that counts injected calls"""
+    
+    def __init__(self):
+        self.calls = 0
+        self._position = (0, 0)
+    
+    @property
+    def position(self):
+        return self._position
+    
+    @position.setter
+    def position(self, value):
+        self.calls += 1
+        self._position = value
+    
+    def press(self, button):
+        self.calls += 1
+    
+    def release(self, button):
+        self.calls += 1
+
+
+def bench_coalesce(args):
+    """Injected calls and CPU time with mouse moves coalesced to a maximum rate"""
+    # A 1000 Hz mouse hook with a click every ~2 seconds
+    store = EventStore()
+    left = store.intern_button('left')
+    rng = random.Random(1)
+    x, y = 960, 540
+    for i in range(args.events):
+        x += rng.randint(-3, 3)
+        y += rng.randint(-3, 3)
+        if i % 2000 == 1999:
+            store.append_raw(MOUSE_CLICK, i * 1_000, x, y, button_id=left, pressed=1)
+            store.append_raw(MOUSE_CLICK, i * 1_000 + 500, x, y, button_id=left, pressed=0)
+        else:
+            store.append_raw(MOUSE_MOVE, i * 1_000, x, y)
+    
+    print(f"📊 {len(store):,} events over {store.duration:.0f}s (1000 Hz mouse)")
+    for rate in (None, 240, 120, 60):
+        mouse_controller = _CountingMouse()
+        engine = PlaybackEngine(mouse_controller, _StubKeyboard(), _legacy_string_to_key,
+                                lambda name: getattr(_LegacyButton, name))
+        plan = engine.compile(store, max_move_rate=rate)
+        cpu_started = time.process_time()
+        # Virtual clock: no real waiting, so CPU time is pure dispatch cost
+        engine.run(plan, VirtualClock())
+        cpu = time.process_time() - cpu_started
+        label = f"{rate} Hz" if rate else "every move"
+        print(f"   {label:<10}: {mouse_controller.calls:8,} injected calls, CPU {cpu * 1000:7.1f} ms")
+
+
+def bench_headless(args):
+    """Record from the synthetic source and play into the null sink: no display or pynput needed"""
+    backend = SyntheticBackend(mouse_rate=args.rate, key_rate=5)
+    recorder = MacroRecorder(backend=backend)
+    recorder.start_recording()
+    time.sleep(args.seconds + 2.0)  # stop_recording trims the last 2 seconds
+    recorder.stop_recording()
+    capture = recorder.get_capture_stats()
+    print(f"📊 Recorded {len(recorder.events):,} events at {args.rate:,} Hz "
+          f"(overflow {capture['overflow']}, high-water {capture['high_water']})")
+    
+    # Timing accuracy: play in real time and compare each injected action to its deadline
+    for mode in TIMING_MODES:
+        recorder.set_timing_mode(mode)
+        backend.clear()
+        cpu_started = time.process_time()
+        recorder.play_macro()
+        cpu = time.process_time() - cpu_started
+        summary = recorder.get_playback_stats()
+        print(f"   {mode:<12}: {len(backend.actions):,} actions, p50 {summary['p50_ms']:.3f} ms, "
+              f"p99 {summary['p99_ms']:.3f} ms, max {summary['max_ms']:.3f} ms, CPU {cpu:.2f}s")
+    
+    # Throughput: every event due immediately
+    recorder.events.timestamps = array('q', bytes(8 * len(recorder.events)))
+    recorder.events.version += 1
+    backend.clear()
+    started = time.perf_counter()
+    recorder.play_macro()
+    elapsed = time.perf_counter() - started
+    print(f"   throughput  : {len(backend.actions) / elapsed:,.0f} injected actions/s")
+
+
+def _stop_latency(start, stop, rounds):
+    """Start a blocking call in a thread, stop it after a moment and time how long it takes to return"""
+    latencies = []
+    for _ in range(rounds):
+        thread = threading.Thread(target=start)
+        thread.start()
+        time.sleep(0.05 + random.random() * 0.1)
+        started = time.perf_counter()
+        stop()
+        thread.join()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000
+
+
+def bench_stop(args):
+    """Stop latency of playback waits: event-based waits vs. the old 0.1 s polling"""
+    rounds = 20
+    # Two events a minute apart, so a run is always stopped inside a gap
+    gap_recorder = MacroRecorder(backend=NullBackend())
+    gap_recorder.events.append_raw(MOUSE_MOVE, 0, 0, 0)
+    gap_recorder.events.append_raw(MOUSE_MOVE, 60_000_000, 1, 1)
+    # One event looped every minute, so it is stopped in the repeat wait
+    loop_recorder = MacroRecorder(backend=NullBackend())
+    loop_recorder.events.append_raw(MOUSE_MOVE, 0, 0, 0)
+    
+    flag = {'stop': False}
+    
+    def legacy_wait():
+        flag['stop'] = False
+        waited = 0.0
+        while not flag['stop'] and waited < 60:
+            time.sleep(0.1)
+            waited += 0.1
+    
+    scenarios = (
+        ("legacy 0.1s polling", legacy_wait, lambda: flag.update(stop=True)),
+        ("gap inside a run", gap_recorder.play_macro, gap_recorder.stop_all),
+        ("repeat interval wait", lambda: loop_recorder.play_macro(repeat_interval=60, loop=True),
+         loop_recorder.stop_all),
+        ("trigger wait", lambda: gap_recorder.play_macro_with_trigger('f1'), gap_recorder.stop_all),
+    )
+    results = []
+    # The recorder reports every run on stdout; keep the table readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, start, stop in scenarios:
+            results.append((name,) + _stop_latency(start, stop, rounds))
+    
+    print(f"📊 Stop latency over {rounds} stops each")
+    for name, p50, worst in results:
+        verdict = "✅" if worst < 5 else "❌"
+        print(f"   {verdict} {name:<22}: p50 {p50:7.2f} ms, max {worst:7.2f} ms")
+
+
+def bench_trigger(args):
+    """Trigger-to-first-event latency: armed trigger + playback worker vs. thread-and-compile per trigger"""
+    rounds = 50
+    backend = NullBackend()
+    recorder = MacroRecorder(backend=backend)
+    for i in range(args.events if args.events < 100_000 else 20_000):
+        recorder.events.append_raw(MOUSE_MOVE, i * 1_000, i & 1023, 0)
+    
+    def first_action_latency(target):
+        backend.clear()
+        trigger_ns = DEFAULT_CLOCK.now_ns()
+        # The thread stands in for the input hook thread that sees the trigger key
+        hook = threading.Thread(target=target)
+        hook.start()
+        while not backend.actions:
+            time.sleep(0)
+        latency = (backend.actions[0][0] - trigger_ns) / 1e6
+        recorder.stop_all()
+        hook.join()
+        done = threading.Event()
+        recorder.playback_worker.submit(done.set)
+        done.wait()
+        return latency
+    
+    def armed():
+        recorder.arm_trigger()
+        return first_action_latency(recorder.fire_trigger)
+    
+    def legacy():
+        # Old path: the trigger callback compiles and plays in a freshly started thread
+        recorder._plan = None
+        return first_action_latency(recorder.play_macro)
+    
+    print(f"📊 Trigger to first event, {rounds} triggers, {len(recorder.events):,}-event macro")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [(name, sorted(run() for _ in range(rounds))) for name, run in
+                   (("thread + compile per trigger", legacy), ("armed trigger + worker", armed))]
+    for name, latencies in results:
+        print(f"   {name:<28}: p50 {latencies[rounds // 2]:6.2f} ms, p99 {latencies[int(rounds * 0.99)]:6.2f} ms")
+    print(f"   recorder report            : {recorder.get_trigger_latency()}")
+
+
+def bench_fileformat(args):
+    """Save/load time and file size: pretty-printed JSON vs. binary .mrec"""
+    store = generate_event_store(args.events)
+    store.append({'type': 'delay', 'timestamp_us': store.timestamps[-1], 'duration': 1.5,
+                  'description': 'round-trip check'})
+    expected = store.to_dicts(integer_timestamps=True)
+    print(f"📊 {len(store):,} events")
+    with tempfile.TemporaryDirectory() as folder:
+        for label, filename in (("JSON ", "macro.json"), (".mrec", "macro.mrec")):
+            path = os.path.join(folder, filename)
+            started = time.perf_counter()
+            save_events(store, path)
+            saved = time.perf_counter()
+            loaded = load_events(path)
+            finished = time.perf_counter()
+            lossless = loaded.to_dicts(integer_timestamps=True) == expected
+            print(f"   {label}: {os.path.getsize(path) / 1e6:7.1f} MB, save {saved - started:6.2f}s, "
+                  f"load {finished - saved:6.2f}s, round-trip {'ok' if lossless else 'MISMATCH'}")
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux (bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _FastForwardClock(VirtualClock):
+    """Virtual clock that jumps to each deadline without keeping a list of sleeps"""
+    
+    def wait_until(self, deadline_ns, stop_event=None, spin_margin_ns=0):
+        if stop_event is not None and stop_event.is_set():
+            return False
+        with self._lock:
+            self._now_ns = max(self._now_ns, deadline_ns)
+        return True
+
+
+def _write_macro(path, count):
+    save_events(generate_event_store(count), path)
+
+
+def _play_from_file(path, mapped, results):
+    """Child process: open a macro file, play it once into counting stubs, report peak RSS"""
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    store = load_events(path, mapped=mapped)
+    opened = time.perf_counter()
+    engine = PlaybackEngine(_CountingMouse(), _StubKeyboard(), _legacy_string_to_key,
+                            lambda name: getattr(_LegacyButton, name))
+    plan = engine.stream(store) if mapped else engine.compile(store)
+    engine.run(plan, _FastForwardClock())
+    played = time.perf_counter()
+    results.put((baseline, _peak_rss_mb(), opened - started, played - opened, engine.mouse_controller.calls))
+
+
+def bench_mapped(args):
+    """Peak RSS and time to open + play a .mrec file: full load + compile vs. memory-mapped stream"""
+    if resource is None:
+        print("❌ Peak RSS needs the resource module (Unix only)")
+        return
+    count = max(args.events, 1_000_000)
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "macro.mrec")
+        # Built in a child too: peak RSS is inherited across fork/exec, so this process stays small
+        writer = context.Process(target=_write_macro, args=(path, count))
+        writer.start()
+        writer.join()
+        print(f"📊 {count:,} events, {os.path.getsize(path) / 1e6:.1f} MB .mrec, played once (virtual clock)")
+        for label, mapped in (("load + compile", False), ("mmap + stream ", True)):
+            # Fresh process per mode so the peaks do not mix
+            results = context.Queue()
+            child = context.Process(target=_play_from_file, args=(path, mapped, results))
+            child.start()
+            baseline, peak, open_time, play_time, calls = results.get()
+            child.join()
+            print(f"   {label}: peak RSS {peak:7.1f} MB (+{peak - baseline:6.1f} MB), "
+                  f"open {open_time:6.3f}s, play {play_time:6.2f}s, {calls:,} mouse calls")
+
+
+def bench_journal(args):
+    """Recording into memory vs. a streaming journal, and recovery from journals cut at random points"""
+    print(f"📊 Synthetic input at {args.rate:,} Hz for {args.seconds:.0f}s")
+    with tempfile.TemporaryDirectory() as folder:
+        for journal_format in (None, 'jsonl', 'binary'):
+            recorder = MacroRecorder(backend=SyntheticBackend(mouse_rate=args.rate, key_rate=5))
+            recorder.set_journal(folder if journal_format else None, journal_format or 'binary')
+            with contextlib.redirect_stdout(io.StringIO()):
+                recorder.start_recording()
+                # Largest number of rows held in memory while recording
+                held = 0
+                deadline = time.perf_counter() + args.seconds + 2.0
+                while time.perf_counter() < deadline:
+                    held = max(held, len(recorder.events))
+                    time.sleep(0.05)
+                started = time.perf_counter()
+                recorder.stop_recording()
+                stop_time = time.perf_counter() - started
+            capture = recorder.get_capture_stats()
+            line = (f"   {journal_format or 'memory':<7}: {len(recorder.events):8,} events, overflow {capture['overflow']}, "
+                    f"max rows in memory {held:8,}, stop {stop_time * 1000:6.0f} ms")
+            journal = recorder.last_journal_stats
+            if journal_format and journal:
+                line += (f", {journal['bytes'] / 1e6:5.1f} MB in {journal['flushes']} flushes, "
+                         f"max queued {journal['max_queued']}, blocked {journal['blocked_s'] * 1000:.0f} ms")
+            print(line)
+        
+        # Crash recovery: cut a finished journal at random byte offsets and rebuild it
+        store = generate_event_store(min(args.events, 200_000))
+        rng = random.Random(1)
+        for journal_format, extension in (('jsonl', '.jsonl'), ('binary', '.mrj')):
+            path = os.path.join(folder, "crash" + extension)
+            journal = RecordingJournal(path)
+            journal.start()
+            for start in range(0, len(store), 500):
+                journal.append(store[start:start + 500])
+            journal.close()
+            with open(path, 'rb') as f:
+                data = f.read()
+            expected = store.to_dicts(integer_timestamps=True)
+            recovered, intact, started = [], 0, time.perf_counter()
+            for _ in range(20):
+                cut = rng.randrange(len(data))
+                with open(path, 'wb') as f:
+                    f.write(data[:cut])
+                partial, info = recover_journal(path)
+                recovered.append(info['events'])
+                intact += partial.to_dicts(integer_timestamps=True) == expected[:info['events']]
+            elapsed = (time.perf_counter() - started) / 20
+            print(f"   {journal_format:<7} crash: 20 random cuts, {intact}/20 recovered a clean prefix, "
+                  f"mean {sum(recovered) / 20:,.0f} of {len(store):,} events, {elapsed * 1000:.0f} ms per recovery")
+
+
+def bench_compress(args):
+    """Codec x level x macro size matrix: file size, save and load time for JSON and .mrec"""
+    matrix = [(None, None), ('.gz', 1), ('.gz', 6), ('.gz', 9), ('.xz', 0), ('.xz', 6), ('.xz', 9)]
+    with tempfile.TemporaryDirectory() as folder:
+        for count in sorted({10_000, min(args.events, 100_000)}):
+            store = generate_event_store(count)
+            print(f"📊 {count:,} events")
+            for extension in ('.json', '.mrec'):
+                plain = None
+                for codec, level in matrix:
+                    path = os.path.join(folder, "macro" + extension + (codec or ''))
+                    started = time.perf_counter()
+                    save_events(store, path, level)
+                    saved = time.perf_counter()
+                    load_events(path)
+                    loaded = time.perf_counter()
+                    size = os.path.getsize(path)
+                    plain = plain or size
+                    label = f"{extension}{codec or ''}" + (f" -{level}" if codec else "")
+                    print(f"   {label:<12}: {size / 1e6:7.2f} MB ({plain / size:5.1f}x), "
+                          f"save {(saved - started) * 1000:7.0f} ms, load {(loaded - saved) * 1000:7.0f} ms")
+
+
+def bench_delta(args):
+    """Delta/varint encoding vs fixed records: size and load time, in memory and on disk"""
+    store = generate_event_store(args.events)
+    columns = sum(getattr(store, name).itemsize * len(store) for name, _ in COLUMNS)
+    started = time.perf_counter()
+    packed = store.pack_delta()
+    packed_time = time.perf_counter() - started
+    started = time.perf_counter()
+    unpacked = EventStore.unpack_delta(packed)
+    unpacked_time = time.perf_counter() - started
+    assert unpacked.to_dicts() == store.to_dicts()
+    print(f"📊 {len(store):,} events (numpy {'on' if delta_codec.numpy is not None else 'off'})")
+    print(f"   in memory : columns {columns / 1e6:7.2f} MB, pack_delta {len(packed) / 1e6:7.2f} MB "
+          f"({columns / len(packed):4.1f}x), pack {packed_time * 1000:6.0f} ms, unpack {unpacked_time * 1000:6.0f} ms")
+    with tempfile.TemporaryDirectory() as folder:
+        for label, extension, encoding in (('json', '.json', None), ('records', '.mrec', 'records'),
+                                           ('delta', '.mrec', 'delta'), ('delta .gz', '.mrec.gz', 'delta')):
+            path = os.path.join(folder, "macro" + extension)
+            started = time.perf_counter()
+            save_events(store, path, encoding=encoding or 'records')
+            saved = time.perf_counter()
+            load_events(path)
+            loaded = time.perf_counter()
+            print(f"   {label:<10}: {os.path.getsize(path) / 1e6:7.2f} MB, save {(saved - started) * 1000:6.0f} ms, "
+                  f"load {(loaded - saved) * 1000:6.0f} ms")
+
+
+def bench_cache(args):
+    """Switch between a few saved macros: load + compile time with and without the macro cache"""
+    count = min(args.events, 200_000)
+    with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()) as log:
+        paths = []
+        for i, extension in enumerate(('.json', '.json.gz', '.mrec.xz')):
+            paths.append(os.path.join(folder, f"macro{i}{extension}"))
+            save_events(generate_event_store(count, seed=i), paths[-1])
+        results = []
+        for budget_mb in (0, 512):
+            recorder = MacroRecorder(backend=NullBackend())
+            recorder.set_cache_budget(budget_mb)
+            timings = []
+            for path in paths * 3:
+                started = time.perf_counter()
+                recorder.load_macro(path)
+                recorder.compile()
+                timings.append(time.perf_counter() - started)
+            results.append((budget_mb, timings, recorder.get_cache_stats()))
+    print(f"📊 {len(paths)} macros x {count:,} events, each loaded and compiled 3 times in turn")
+    for budget_mb, timings, stats in results:
+        first, repeat = timings[:len(paths)], timings[len(paths):]
+        print(f"   budget {budget_mb:>4} MB: first load {sum(first) / len(first) * 1000:7.1f} ms, "
+              f"repeat {sum(repeat) / len(repeat) * 1000:7.1f} ms · hits {stats['hits']} misses {stats['misses']} "
+              f"plan hits {stats['plan_hits']} · {stats['bytes'] / 1e6:.0f} MB held")
+
+
+class _EditedMacro:
+    """Stands in for the recorder: EventEditor only needs .events"""
+
+    def __init__(self, events):
+        self.events = events
+
+
+def bench_bulk(args):
+    """Bulk edits on a multi-range selection: one EventEditor call vs one store edit per row/range"""
+    store = generate_event_store(args.events)
+    # 1000 selected ranges of 10 events spread over the macro
+    ranges = [(start, start + 10) for start in range(0, len(store) - 10, len(store) // 1000)][:1000]
+    selected = [i for start, stop in ranges for i in range(start, stop)]
+
+    legacy = store.copy()
+    started = time.perf_counter()
+    for i in selected:
+        event = legacy[i]
+        event['timestamp'] += 0.5
+        legacy[i] = event
+    legacy_shift = time.perf_counter() - started
+    started = time.perf_counter()
+    for start, stop in reversed(ranges):
+        del legacy[start:stop]
+    legacy_delete = time.perf_counter() - started
+
+    editor = EventEditor(_EditedMacro(store.copy()))
+    timings = {}
+    for name, edit in (
+        ('shift time', lambda: editor.shift_time(ranges, 0.5)),
+        ('offset coords', lambda: editor.offset_coords(ranges, 10, -10)),
+        ('change key', lambda: editor.change_key(ranges, 'z')),
+        ('delete', lambda: editor.remove_ranges(ranges)),
+    ):
+        started = time.perf_counter()
+        edit()
+        timings[name] = time.perf_counter() - started
+    started = time.perf_counter()
+    while editor.undo():
+        pass
+    undo_all = time.perf_counter() - started
+
+    print(f"📊 {len(store):,} events, {len(ranges)} selected ranges ({len(selected):,} events)")
+    print(f"   per-row shift time   {legacy_shift * 1000:8.1f} ms · per-range delete {legacy_delete * 1000:8.1f} ms")
+    for name, seconds in timings.items():
+        print(f"   bulk {name:<15} {seconds * 1000:8.1f} ms")
+    stats = editor.history.stats()
+    print(f"   undo all {undo_all * 1000:.1f} ms · history held {stats['bytes'] / 1e6:.1f} MB "
+          f"for {len(timings)} edits · store {store.nbytes() / 1e6:.1f} MB")
+
+
+def bench_index(args):
+    """Editor search: indexed queries vs a linear scan over the events, and the cost of keeping the index current"""
+    store = generate_event_store(args.events)
+    editor = EventEditor(_EditedMacro(store))
+    index = EventIndex(editor)
+    started = time.perf_counter()
+    index.rebuild()
+    build = time.perf_counter() - started
+    duration_s = store.timestamps[-1] / 1e6 if len(store) else 0
+    queries = (
+        'type:click',
+        f't:{duration_s * 0.4:.2f}-{duration_s * 0.42:.2f}',
+        'x:100-200 y:100-200',
+        f'type:click t:0-{duration_s / 2:.2f} area:top-left',
+        'key:w',
+    )
+
+    print(f"📊 {len(store):,} events · index built in {build * 1000:.0f} ms")
+    for text in queries:
+        criteria = parse_query(text, (1920, 1080))
+        started = time.perf_counter()
+        matches = index.query(**criteria)
+        indexed = time.perf_counter() - started
+        started = time.perf_counter()
+        scanned = _scan(store, **criteria)
+        scan = time.perf_counter() - started
+        assert scanned == matches, text
+        print(f"   {text:<40} {len(matches):>9,} matches · index {indexed * 1000:7.1f} ms · scan {scan * 1000:8.1f} ms")
+
+    edits = 200
+    rng = random.Random(2)
+    started = time.perf_counter()
+    for _ in range(edits):
+        row = rng.randrange(len(editor))
+        event = store[row]
+        if 'x' in event:
+            event['x'] += 5
+        editor.update(row, [event])
+    per_edit = (time.perf_counter() - started) / edits
+    started = time.perf_counter()
+    index.query(**parse_query('x:100-200 y:100-200'))
+    after = time.perf_counter() - started
+    print(f"   single-row edit with index kept current {per_edit * 1e6:.0f} µs · "
+          f"next query {after * 1000:.1f} ms · rebuilds {index.rebuilds}")
+
+
+def _scan(store, types=None, start_s=None, end_s=None, x_range=None, y_range=None, keys=None):
+    """Linear scan over the event dicts with the same semantics as EventIndex.query()"""
+    matches = []
+    for position in range(len(store)):
+        event = store[position]
+        if types is not None and event['type'] not in types:
+            continue
+        timestamp = seconds_to_us(event['timestamp'])
+        if (start_s is not None and timestamp < seconds_to_us(start_s)) or (end_s is not None and timestamp > seconds_to_us(end_s)):
+            continue
+        if x_range is not None or y_range is not None:
+            if 'x' not in event:
+                continue
+            (x_low, x_high), (y_low, y_high) = x_range or (None, None), y_range or (None, None)
+            if ((x_low is not None and event['x'] < x_low) or (x_high is not None and event['x'] > x_high)
+                    or (y_low is not None and event['y'] < y_low) or (y_high is not None and event['y'] > y_high)):
+                continue
+        if keys is not None and event.get('key') not in keys:
+            continue
+        matches.append(position)
+    return matches
+
+
+BENCHMARKS = {
+    'memory': bench_memory,
+    'capture': bench_capture,
+    'simplify': bench_simplify,
+    'dispatch': bench_dispatch,
+    'timing': bench_timing,
+    'loop': bench_loop,
+    'warp': bench_warp,
+    'coalesce': bench_coalesce,
+    'headless': bench_headless,
+    'stop': bench_stop,
+    'trigger': bench_trigger,
+    'fileformat': bench_fileformat,
+    'mapped': bench_mapped,
+    'journal': bench_journal,
+    'compress': bench_compress,
+    'delta': bench_delta,
+    'cache': bench_cache,
+    'bulk': bench_bulk,
+    'index': bench_index,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Macro Recorder benchmarks")
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--events', type=int, default=500_000, help="number of synthetic events")
+    parser.add_argument('--rate', type=int, default=20_000, help="capture: synthetic callbacks per second")
+    parser.add_argument('--seconds', type=float, default=5.0, help="capture: stress duration")
+    parser.add_argument('--capacity', type=int, default=65536, help="capture: ring capacity")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    main()
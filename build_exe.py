@@ -48,7 +48,22 @@ a = Analysis(
         'gui.hotkey_manager',
         'gui.movement_display',
         'gui.editable_movements',
+        'gui.event_table',
         'scheduler',
+        'event_store',
+        'capture_buffer',
+        'path_simplifier',
+        'clock',
+        'playback',
+        'input_backends',
+        'macro_file',
+        'recording_journal',
+        'delta_codec',
+        'macro_library',
+        'macro_cache',
+        'macro_tools',
+        'event_editor',
+        'event_index',
         'tkinter',
         'tkinter.ttk'
     ],
@@ -0,0 +1,134 @@
+"""
+Capture Buffer for  Macro Recorder
+Decouples the input hook threads from event storage
+"""
+import heapq
+import threading
+from operator import itemgetter
+
+
+class CaptureRing:
+    """Fixed-capacity, preallocated single-producer/single-consumer ring buffer.
+
+    The producer (a listener callback) only writes ``_head`` and the consumer
+    (the drain thread) only writes ``_tail``. A slot is filled before ``_head``
+    is advanced, so under the GIL the consumer never sees a half-written slot
+    and neither side needs a lock. When the ring is full the item is dropped
+    and counted in ``overflow_count`` instead of blocking the hook thread.
+    """
+
+    def __init__(self, capacity=65536):
+        # Round up to a power of two so slot lookup is a mask instead of a modulo
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self._mask = size - 1
+        self._slots = [None] * size
+        self._head = 0
+        self._tail = 0
+        self.overflow_count = 0
+        self.high_water = 0
+
+    def push(self, item):
+        """Add an item; returns False (and counts an overflow) if the ring is full"""
+        head = self._head
+        used = head - self._tail
+        if used >= self.capacity:
+            self.overflow_count += 1
+            return False
+        self._slots[head & self._mask] = item
+        self._head = head + 1
+        if used >= self.high_water:
+            self.high_water = used + 1
+        return True
+
+    def drain(self):
+        """Remove and return every item currently in the ring, oldest first"""
+        tail = self._tail
+        count = self._head - tail
+        if count <= 0:
+            return []
+        start = tail & self._mask
+        end = start + count
+        if end <= self.capacity:
+            batch = self._slots[start:end]
+        else:
+            batch = self._slots[start:] + self._slots[:end - self.capacity]
+        self._tail = tail + count
+        return batch
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'pushed': self._head,
+            'pending': self._head - self._tail,
+            'overflow': self.overflow_count,
+            'high_water': self.high_water,
+        }
+
+
+class CaptureDrain:
+    """Background thread that moves captured items from rings into storage in batches.
+
+    Items are tuples whose second element is the capture timestamp. Each ring
+    has a single producer, so its batch is already time-ordered; batches from
+    several rings are merged by timestamp before being handed to ``sink``.
+    """
+
+    def __init__(self, rings, sink, interval=0.01):
+        self.rings = list(rings)
+        self.sink = sink
+        self.interval = interval
+        self.batches = 0
+        self.max_batch = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="CaptureDrainThread", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and flush whatever is still buffered"""
+        self._stop_event.set()
+        thread = self._thread
+        self._thread = None
+        if thread and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=2.0)
+        self.drain_once()
+
+    def drain_once(self):
+        """Drain all rings once; returns the number of items delivered"""
+        batches = [batch for batch in (ring.drain() for ring in self.rings) if batch]
+        if not batches:
+            return 0
+        if len(batches) == 1:
+            batch = batches[0]
+        else:
+            batch = list(heapq.merge(*batches, key=itemgetter(1)))
+        self.sink(batch)
+        self.batches += 1
+        if len(batch) > self.max_batch:
+            self.max_batch = len(batch)
+        return len(batch)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.drain_once()
+            except Exception as e:
+                print(f"Capture drain error: {e}")
+
+    def stats(self):
+        return {
+            'rings': [ring.stats() for ring in self.rings],
+            'batches': self.batches,
+            'max_batch': self.max_batch,
+            'overflow': sum(ring.overflow_count for ring in self.rings),
+            'high_water': max((ring.high_water for ring in self.rings), default=0),
+        }
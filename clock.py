@@ -0,0 +1,87 @@
+"""
+Clock Abstraction for  Macro Recorder
+Single monotonic nanosecond time source shared by recording, playback and scheduling
+"""
+import threading
+import time
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_US = 1_000
+
+
+class MonotonicClock:
+    """Real clock: monotonic, high resolution and immune to wall-clock/NTP adjustments"""
+
+    def now_ns(self):
+        return time.perf_counter_ns()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait_until(self, deadline_ns, stop_event=None, spin_margin_ns=0):
+        """Sleep until deadline_ns; returns False as soon as stop_event (if any) is set.
+
+        Blocks in ``stop_event.wait`` instead of polling, so a stop lands within
+        the OS wakeup latency no matter how far away the deadline is. With a
+        spin margin the blocking wait stops that far before the deadline and
+        the rest is spent yielding in a loop, which avoids the 1-10 ms sleep
+        overshoot of loaded systems at the cost of some CPU.
+        """
+        now_ns = time.perf_counter_ns
+        wait = time.sleep if stop_event is None else stop_event.wait
+        while True:
+            remaining_ns = deadline_ns - now_ns() - spin_margin_ns
+            if remaining_ns <= 0:
+                break
+            if wait(remaining_ns / NS_PER_SECOND):
+                return False
+        if stop_event is None:
+            while now_ns() < deadline_ns:
+                time.sleep(0)
+            return True
+        is_set = stop_event.is_set
+        while now_ns() < deadline_ns:
+            if is_set():
+                return False
+            time.sleep(0)
+        return not is_set()
+
+
+class VirtualClock:
+    """Manually driven clock for deterministic timing tests.
+
+    ``sleep`` advances virtual time instantly instead of blocking, and every
+    requested sleep is recorded so tests can assert on playback timing.
+    """
+
+    def __init__(self, start_ns=0):
+        self._now_ns = start_ns
+        self._lock = threading.Lock()
+        self.sleeps = []
+
+    def now_ns(self):
+        with self._lock:
+            return self._now_ns
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.sleeps.append(seconds)
+            self.advance(seconds)
+
+    def wait_until(self, deadline_ns, stop_event=None, spin_margin_ns=0):
+        if stop_event is not None and stop_event.is_set():
+            return False
+        with self._lock:
+            remaining_ns = deadline_ns - self._now_ns
+            if remaining_ns > 0:
+                self.sleeps.append(remaining_ns / NS_PER_SECOND)
+                self._now_ns = deadline_ns
+        return True
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now_ns += int(round(seconds * NS_PER_SECOND))
+
+
+DEFAULT_CLOCK = MonotonicClock()
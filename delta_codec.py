@@ -0,0 +1,120 @@
+"""
+Delta Codec for  Macro Recorder
+Zigzag varint encoding of event columns, with timestamps and coordinates stored as deltas
+"""
+import struct
+from array import array
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, it vectorizes encoding and decoding
+    numpy = None
+
+# Columns stored as the difference from the previous row: time moves forward by
+# a few ms and the cursor by a few pixels, so the deltas fit in one or two bytes
+DELTA_COLUMNS = ('timestamps', 'x', 'y')
+
+# Byte length of one encoded column
+BLOCK_HEADER = struct.Struct('<I')
+
+
+def encode_column(values, delta=False):
+    """Encode an integer array as zigzag varints (of the deltas when delta=True)"""
+    if numpy is not None and len(values):
+        return _encode_numpy(values, delta)
+    out = bytearray()
+    append = out.append
+    previous = 0
+    for value in values:
+        if delta:
+            value, previous = value - previous, value
+        # Zigzag: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ... so small negatives stay small
+        value = value << 1 if value >= 0 else (~value << 1) | 1
+        while value >= 0x80:
+            append((value & 0x7f) | 0x80)
+            value >>= 7
+        append(value)
+    return bytes(out)
+
+
+def decode_column(data, count, typecode, delta=False):
+    """Decode count zigzag varints back into an array of the given typecode"""
+    if numpy is not None:
+        values = _decode_numpy(data, count, delta)
+        return array(typecode, values.astype(typecode).tobytes())
+    values = array(typecode)
+    append = values.append
+    value = shift = previous = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        value = (value >> 1) ^ -(value & 1)
+        if delta:
+            previous += value
+            value = previous
+        append(value)
+        value = shift = 0
+    if len(values) != count or shift:
+        raise ValueError(f"Corrupt varint column: expected {count} values, got {len(values)}")
+    return values
+
+
+def encode_block(name, values):
+    """One column as a length-prefixed varint block"""
+    encoded = encode_column(values, name in DELTA_COLUMNS)
+    return BLOCK_HEADER.pack(len(encoded)) + encoded
+
+
+def read_block(read, name, count, typecode):
+    """Read and decode one length-prefixed block through a read(size) callable"""
+    raw = read(BLOCK_HEADER.size)
+    if len(raw) < BLOCK_HEADER.size:
+        raise ValueError(f"Truncated varint column '{name}'")
+    size, = BLOCK_HEADER.unpack(raw)
+    data = read(size)
+    if len(data) < size:
+        raise ValueError(f"Truncated varint column '{name}'")
+    return decode_column(data, count, typecode, name in DELTA_COLUMNS)
+
+
+def _encode_numpy(values, delta):
+    signed = numpy.frombuffer(values, dtype=values.typecode).astype(numpy.int64)
+    if delta:
+        signed = numpy.diff(signed, prepend=0)
+    zigzag = ((signed << 1) ^ (signed >> 63)).view(numpy.uint64)
+    # Bytes per value: 7 payload bits each
+    lengths = numpy.ones(len(zigzag), dtype=numpy.intp)
+    for k in range(1, 10):
+        lengths += zigzag >= numpy.uint64(1 << (7 * k))
+    offsets = numpy.cumsum(lengths) - lengths
+    out = numpy.empty(int(lengths[-1] + offsets[-1]), dtype=numpy.uint8)
+    for k in range(int(lengths.max())):
+        has_byte = lengths > k
+        payload = (zigzag[has_byte] >> numpy.uint64(7 * k)) & numpy.uint64(0x7f)
+        more = (lengths[has_byte] > k + 1).astype(numpy.uint64) << numpy.uint64(7)
+        out[offsets[has_byte] + k] = payload | more
+    return out.tobytes()
+
+
+def _decode_numpy(data, count, delta):
+    raw = numpy.frombuffer(data, dtype=numpy.uint8)
+    # A byte without the continuation bit ends a value
+    ends = numpy.flatnonzero(raw < 0x80)
+    if len(ends) != count or (len(raw) and (not count or ends[-1] != len(raw) - 1)):
+        raise ValueError(f"Corrupt varint column: expected {count} values, got {len(ends)}")
+    if len(raw) == count:
+        # Every value fits in one byte
+        zigzag = raw.astype(numpy.uint64)
+    else:
+        starts = numpy.empty(count, dtype=numpy.intp)
+        starts[:1] = 0
+        starts[1:] = ends[:-1] + 1
+        byte_index = numpy.arange(len(raw)) - numpy.repeat(starts, ends - starts + 1)
+        shifted = (raw & 0x7f).astype(numpy.uint64) << (byte_index * 7).astype(numpy.uint64)
+        zigzag = numpy.add.reduceat(shifted, starts) if count else shifted
+    values = (zigzag >> numpy.uint64(1)).view(numpy.int64) ^ -(zigzag & numpy.uint64(1)).view(numpy.int64)
+    if delta:
+        values = numpy.cumsum(values)
+    return values
@@ -0,0 +1,634 @@
+"""
+Event Editor for  Macro Recorder
+Edits the recorder's events through operations that report exactly what changed
+"""
+from array import array
+from collections import deque
+from contextlib import contextmanager
+
+from event_store import TYPE_FIELDS, US_PER_SECOND
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, bulk edits fall back to plain loops
+    numpy = None
+
+# Change kinds passed to listeners
+INSERT = 'insert'
+REMOVE = 'remove'
+MOVE = 'move'
+UPDATE = 'update'
+RESET = 'reset'
+
+# Default memory budget of the undo/redo history
+DEFAULT_HISTORY_BYTES = 32 * 1024 * 1024
+
+# Bookkeeping counted per recorded change on top of its ids and rows
+CHANGE_OVERHEAD = 256
+
+
+class EventChange:
+    """One edit, as seen by listeners.
+
+    insert: ``count`` rows now start at ``index``
+    remove: ``count`` rows starting at ``index`` are gone; ``old`` holds them
+    move:   ``count`` rows moved from ``index`` so that they now start at ``target``
+    update: ``count`` rows starting at ``index`` changed in place; ``old`` holds the previous rows
+    reset:  the event list was replaced or changed outside the editor; nothing else is known
+
+    ``ids`` are the stable ids of the affected rows and ``old`` is an
+    EventStore cut from the edited one (see EventStore.insert_rows).
+    """
+
+    __slots__ = ('kind', 'index', 'count', 'target', 'ids', 'old')
+
+    def __init__(self, kind, index=0, count=0, target=None, ids=None, old=None):
+        self.kind = kind
+        self.index = index
+        self.count = count
+        self.target = target
+        self.ids = ids
+        self.old = old
+
+    def __repr__(self):
+        return f"EventChange({self.kind!r}, index={self.index}, count={self.count}, target={self.target})"
+
+
+def merge_ranges(ranges, length=None):
+    """Sort (start, stop) ranges, clip them to length and merge overlapping or touching ones"""
+    merged = []
+    for start, stop in sorted(ranges):
+        if length is not None:
+            start, stop = max(0, start), min(stop, length)
+        if start >= stop:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _view(column, start, stop):
+    """Writable numpy view of column[start:stop]"""
+    return numpy.frombuffer(column, dtype=column.typecode)[start:stop]
+
+
+def _type_mask(rows, field):
+    """Which rows have an event type that stores field (numpy bool array or list)"""
+    codes = [code for code, name in enumerate(rows.type_names) if field in TYPE_FIELDS.get(name, ())]
+    if numpy is not None:
+        return numpy.isin(_view(rows.types, 0, len(rows)), codes)
+    codes = set(codes)
+    return [type_code in codes for type_code in rows.types]
+
+
+def _transform(column, start, stop, function, mask=None):
+    """Replace column[start:stop] by function(values), where mask allows.
+
+    With numpy, function gets an int64 array and must work elementwise (a
+    constant result is broadcast); without it function is called per value.
+    """
+    if numpy is not None:
+        view = _view(column, start, stop)
+        result = numpy.broadcast_to(function(view.astype(numpy.int64)), view.shape)
+        if mask is None:
+            view[:] = result
+        else:
+            view[mask] = result[mask]
+        return
+    values = column[start:stop]
+    for i, value in enumerate(values):
+        if mask is None or mask[i]:
+            values[i] = function(value)
+    column[start:stop] = values
+
+
+def _is_range_removal(changes):
+    """Several removes, each entirely before the previous one (as made by remove_ranges)"""
+    return len(changes) > 1 and all(
+        change.kind == REMOVE for change in changes
+    ) and all(later.index + later.count <= earlier.index for earlier, later in zip(changes, changes[1:]))
+
+
+def _is_range_insertion(changes):
+    """Several inserts, each entirely after the previous one (the inverse of a range removal)"""
+    return len(changes) > 1 and all(
+        change.kind == INSERT for change in changes
+    ) and all(later.index >= earlier.index + earlier.count for earlier, later in zip(changes, changes[1:]))
+
+
+def change_nbytes(change):
+    """Memory an EventChange keeps alive in the history"""
+    size = CHANGE_OVERHEAD
+    if change.ids is not None:
+        size += change.ids.itemsize * len(change.ids)
+    if change.old is not None:
+        size += change.old.nbytes()
+    return size
+
+
+class EditHistory:
+    """Undo and redo stacks of edits, kept within a byte budget.
+
+    An edit is a tuple of EventChanges, each of which carries what is needed
+    to invert it: inserts and moves only positions and ids, removes and
+    updates the affected rows as a cut of the store (their columns, no
+    lookup tables). Nothing else of the macro is copied, so the cost of an
+    edit is proportional to the rows it touched. Once the stacks pass
+    ``max_bytes`` the oldest undo steps are dropped, then the redo steps.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_HISTORY_BYTES):
+        self.max_bytes = max_bytes
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.nbytes = 0
+        self.dropped = 0
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def push(self, changes, redo=False):
+        """Record an applied edit; a new edit (not an undo/redo) clears the redo stack"""
+        entry = (tuple(changes), sum(change_nbytes(change) for change in changes))
+        if not redo:
+            self._drop_redo()
+        if entry[1] > self.max_bytes:
+            # Too big to keep: older steps cannot be replayed past it either
+            self.clear()
+            self.dropped += 1
+            return
+        self.undo_stack.append(entry)
+        self.nbytes += entry[1]
+        self._trim()
+
+    def push_redo(self, changes):
+        entry = (tuple(changes), sum(change_nbytes(change) for change in changes))
+        self.redo_stack.append(entry)
+        self.nbytes += entry[1]
+        self._trim()
+
+    def pop_undo(self):
+        changes, size = self.undo_stack.pop()
+        self.nbytes -= size
+        return changes
+
+    def pop_redo(self):
+        changes, size = self.redo_stack.pop()
+        self.nbytes -= size
+        return changes
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.nbytes = 0
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._trim()
+
+    def _drop_redo(self):
+        while self.redo_stack:
+            self.pop_redo()
+
+    def _trim(self):
+        while self.nbytes > self.max_bytes and self.undo_stack:
+            self.nbytes -= self.undo_stack.popleft()[1]
+            self.dropped += 1
+        while self.nbytes > self.max_bytes and self.redo_stack:
+            self.nbytes -= self.redo_stack.pop(0)[1]
+            self.dropped += 1
+
+    def stats(self):
+        return {
+            'undo_steps': len(self.undo_stack),
+            'redo_steps': len(self.redo_stack),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'dropped': self.dropped,
+        }
+
+
+class EventEditor:
+    """Edit API over ``recorder.events`` with stable event ids.
+
+    Every event carries an id (``ids`` runs parallel to the store) that stays
+    the same while events around it are inserted, removed or moved, so a view
+    can keep pointing at an event instead of at a list position. Each
+    operation mutates the store and then hands the listeners the list of
+    changes it made (one change for a single-row edit, several for a bulk
+    delete or an undo of a group), which lets them patch just the affected
+    rows. The store is only guaranteed to match the last change of a list.
+
+    Recording, loading or simplifying replace ``recorder.events`` outside the
+    editor; ``sync()`` notices (store identity or version changed), hands out
+    fresh ids and sends a reset, which also clears the undo history.
+
+    Edits are recorded in ``history``; ``undo()`` applies the inverse of the
+    last edit through the same operations, so listeners see it as ordinary
+    changes and the inverse of the undo becomes the redo step.
+    """
+
+    def __init__(self, recorder, history_bytes=DEFAULT_HISTORY_BYTES):
+        self.recorder = recorder
+        self.store = None
+        self.ids = array('q')
+        self.history = EditHistory(history_bytes)
+        self._version = None
+        self._next_id = 0
+        self._listeners = []
+        # Changes of the edit in progress (see group()); None when recording is off (during undo/redo)
+        self._group = None
+        self._group_depth = 0
+        self._recording = True
+        self.sync()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------------- Listeners ---------------- #
+    def add_listener(self, listener):
+        """Call listener(changes) after every edit, with the list of EventChanges it made"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _emit(self, change):
+        self._version = self.store.version
+        if change.kind == RESET:
+            self.history.clear()
+            if self._group is not None:
+                # Changes made so far were to a store that is gone
+                self._group.clear()
+            self._notify([change])
+        elif self._group is not None:
+            self._group.append(change)
+        else:
+            self._finish([change])
+        return change
+
+    def _finish(self, changes):
+        if self._recording:
+            self.history.push(changes)
+        self._notify(changes)
+
+    def _notify(self, changes):
+        for listener in list(self._listeners):
+            listener(changes)
+
+    # ---------------- Undo / redo ---------------- #
+    @contextmanager
+    def group(self):
+        """Treat every change made inside the block as one edit: one undo step, one notification"""
+        if self._group_depth == 0:
+            self._group = []
+        self._group_depth += 1
+        try:
+            yield
+        finally:
+            self._group_depth -= 1
+            if self._group_depth == 0:
+                changes, self._group = self._group, None
+                if changes:
+                    self._finish(changes)
+
+    def can_undo(self):
+        self.sync()
+        return self.history.can_undo()
+
+    def can_redo(self):
+        self.sync()
+        return self.history.can_redo()
+
+    def undo(self):
+        """Revert the last edit; returns its inverse changes, or None if there is nothing to undo"""
+        if not self.can_undo():
+            return None
+        inverse = self._replay(self.history.pop_undo())
+        self.history.push_redo(inverse)
+        return inverse
+
+    def redo(self):
+        """Apply the last undone edit again"""
+        if not self.can_redo():
+            return None
+        inverse = self._replay(self.history.pop_redo())
+        self.history.push(inverse, redo=True)
+        return inverse
+
+    def set_history_budget(self, max_bytes):
+        self.history.set_max_bytes(max_bytes)
+
+    def _replay(self, changes):
+        """Apply the inverse of changes, last first, without recording them as a new edit"""
+        self._recording = False
+        try:
+            with self.group():
+                if _is_range_removal(changes):
+                    # remove_ranges: put every range back in one pass
+                    return self._insert_pieces([(c.index, c.old, c.ids) for c in reversed(changes)])
+                if _is_range_insertion(changes):
+                    return self.remove_ranges([(c.index, c.index + c.count) for c in changes])
+                return [self._invert(change) for change in reversed(changes)]
+        finally:
+            self._recording = True
+
+    def _invert(self, change):
+        if change.kind == INSERT:
+            return self.remove(change.index, change.count)
+        if change.kind == REMOVE:
+            return self.insert_rows(change.index, change.old, change.ids)
+        if change.kind == MOVE:
+            return self.move(change.target, change.count, change.index)
+        return self.update_rows(change.index, change.old)
+
+    # ---------------- Ids ---------------- #
+    def sync(self):
+        """Pick up changes made outside the editor; True if the listeners got a reset"""
+        store = self.recorder.events
+        if store is self.store and store.version == self._version:
+            return False
+        self.store = store
+        self.ids = self._new_ids(len(store))
+        self._emit(EventChange(RESET, 0, len(store)))
+        return True
+
+    def _new_ids(self, count):
+        ids = array('q', range(self._next_id, self._next_id + count))
+        self._next_id += count
+        return ids
+
+    def index_of(self, event_id):
+        """Current index of the event with this id, or None if it was removed"""
+        try:
+            return self.ids.index(event_id)
+        except ValueError:
+            return None
+
+    def _check_range(self, index, count):
+        if count < 0 or not 0 <= index <= index + count <= len(self.store):
+            raise IndexError("event index out of range")
+
+    # ---------------- Operations ---------------- #
+    def insert(self, index, events):
+        """Insert event dicts before index (index == len appends)"""
+        self.sync()
+        events = list(events)
+        self._check_range(index, 0)
+        for offset, event in enumerate(events):
+            self.store.insert(index + offset, event)
+        ids = self._new_ids(len(events))
+        self.ids[index:index] = ids
+        return self._emit(EventChange(INSERT, index, len(events), ids=ids))
+
+    def insert_rows(self, index, rows, ids=None):
+        """Insert rows cut from this store (e.g. a change's ``old``), optionally under their old ids"""
+        self.sync()
+        self._check_range(index, 0)
+        if ids is None:
+            ids = self._new_ids(len(rows))
+        self.store.insert_rows(index, rows)
+        self.ids[index:index] = ids
+        return self._emit(EventChange(INSERT, index, len(rows), ids=array('q', ids)))
+
+    def remove(self, index, count=1):
+        """Remove count events starting at index"""
+        self.sync()
+        self._check_range(index, count)
+        old = self.store.cut(index, index + count)
+        ids = self.ids[index:index + count]
+        del self.store[index:index + count]
+        del self.ids[index:index + count]
+        return self._emit(EventChange(REMOVE, index, count, ids=ids, old=old))
+
+    def move(self, index, count, target):
+        """Move count events starting at index so that they start at target afterwards"""
+        self.sync()
+        self._check_range(index, count)
+        self._check_range(target, count)
+        rows = self.store.cut(index, index + count)
+        ids = self.ids[index:index + count]
+        del self.store[index:index + count]
+        del self.ids[index:index + count]
+        self.store.insert_rows(target, rows)
+        self.ids[target:target] = ids
+        return self._emit(EventChange(MOVE, index, count, target=target, ids=ids))
+
+    def update(self, index, events):
+        """Replace the events starting at index with event dicts"""
+        self.sync()
+        events = list(events)
+        self._check_range(index, len(events))
+        old = self.store.cut(index, index + len(events))
+        for offset, event in enumerate(events):
+            self.store[index + offset] = event
+        return self._emit(EventChange(UPDATE, index, len(events), ids=self.ids[index:index + len(events)], old=old))
+
+    def update_rows(self, index, rows):
+        """Overwrite rows starting at index with rows cut from this store"""
+        self.sync()
+        self._check_range(index, len(rows))
+        old = self.store.cut(index, index + len(rows))
+        self.store.write_rows(index, rows)
+        return self._emit(EventChange(UPDATE, index, len(rows), ids=self.ids[index:index + len(rows)], old=old))
+
+    def duplicate(self, index, count=1):
+        """Insert a copy of count events right after them"""
+        self.sync()
+        self._check_range(index, count)
+        return self.insert_rows(index + count, self.store.cut(index, index + count))
+
+    def clear(self):
+        """Remove every event"""
+        self.sync()
+        return self.remove(0, len(self.store))
+
+    # ---------------- Bulk edits ---------------- #
+    # Each runs as one pass over the columns (vectorized when numpy is
+    # available), one undo step and one notification, whatever the number of
+    # rows or ranges; undo keeps only the rows in the ranges. Ranges are
+    # (start, stop) index pairs and the methods return the changes made.
+    def remove_ranges(self, ranges):
+        """Remove several ranges of events in one pass over the store"""
+        self.sync()
+        ranges = merge_ranges(ranges, len(self.store))
+        if not ranges:
+            return []
+        # Described as removes from the last range to the first, so each index
+        # is valid right after the previous change (undo replays them that way)
+        changes = [EventChange(REMOVE, start, stop - start, ids=self.ids[start:stop],
+                               old=self.store.cut(start, stop))
+                   for start, stop in reversed(ranges)]
+        self.store.delete_ranges(ranges)
+        ids = array('q')
+        kept = 0
+        for start, stop in ranges:
+            ids += self.ids[kept:start]
+            kept = stop
+        ids += self.ids[kept:]
+        self.ids = ids
+        with self.group():
+            for change in changes:
+                self._emit(change)
+        return changes
+
+    def shift_time(self, ranges, delta_s, ripple=False):
+        """Add delta_s seconds to the timestamps in ranges (never below 0).
+
+        With ripple every event from the first range on is shifted, so the
+        gaps to the events after the selection are kept.
+        """
+        delta_us = int(round(delta_s * US_PER_SECOND))
+
+        def apply(rows):
+            _transform(rows.timestamps, 0, len(rows), lambda t: _clamp_time(t + delta_us))
+
+        self.sync()
+        if ripple:
+            ranges = merge_ranges(ranges, len(self.store))[:1]
+            ranges = [(ranges[0][0], len(self.store))] if ranges else []
+        return self._bulk_update(ranges, apply)
+
+    def scale_time(self, start, stop, factor, ripple=False):
+        """Stretch (factor > 1) or compress the timing of events start..stop around the first one.
+
+        With ripple the events after the range move by as much as its end did.
+        """
+        if factor < 0:
+            raise ValueError("time scale factor must not be negative")
+        self.sync()
+        start, stop = max(0, start), min(stop, len(self.store))
+        count = stop - start
+        if count <= 0:
+            return []
+
+        def apply(rows):
+            origin = rows.timestamps[0]
+            end = rows.timestamps[count - 1]
+            _transform(rows.timestamps, 0, count, lambda t: origin + _round((t - origin) * factor))
+            moved = rows.timestamps[count - 1] - end
+            if count < len(rows):
+                _transform(rows.timestamps, count, len(rows), lambda t: _clamp_time(t + moved))
+
+        return self._bulk_update([(start, len(self.store) if ripple else stop)], apply)
+
+    def offset_coords(self, ranges, dx, dy):
+        """Move the x/y of mouse events in ranges by (dx, dy) pixels"""
+        dx, dy = int(round(dx)), int(round(dy))
+
+        def apply(rows):
+            mask = _type_mask(rows, 'x')
+            _transform(rows.x, 0, len(rows), lambda v: v + dx, mask)
+            _transform(rows.y, 0, len(rows), lambda v: v + dy, mask)
+
+        return self._bulk_update(ranges, apply)
+
+    def scale_coords(self, ranges, sx, sy, origin=None):
+        """Scale the x/y of mouse events in ranges around origin (default: top-left of those events)"""
+
+        def apply(rows):
+            mask = _type_mask(rows, 'x')
+            ox, oy = origin if origin is not None else _min_corner(rows, mask)
+            _transform(rows.x, 0, len(rows), lambda v: ox + _round((v - ox) * sx), mask)
+            _transform(rows.y, 0, len(rows), lambda v: oy + _round((v - oy) * sy), mask)
+
+        return self._bulk_update(ranges, apply)
+
+    def change_key(self, ranges, new_key, old_key=None):
+        """Set the key of key events in ranges to new_key (only those pressing old_key, if given)"""
+        self.sync()
+        if old_key is not None and old_key not in self.store.key_names:
+            return []
+        new_id = self.store.intern_key(new_key)
+        old_id = self.store.key_names.index(old_key) if old_key is not None else None
+
+        def apply(rows):
+            mask = _type_mask(rows, 'key')
+            if old_id is not None:
+                if numpy is not None:
+                    mask &= _view(rows.keys, 0, len(rows)) == old_id
+                else:
+                    mask = [m and key == old_id for m, key in zip(mask, rows.keys)]
+            _transform(rows.keys, 0, len(rows), lambda key: new_id, mask)
+
+        return self._bulk_update(ranges, apply)
+
+    def _bulk_update(self, ranges, apply):
+        """Gather the rows in ranges into one store, let apply(rows) edit its columns in one go,
+        then write each range back as an update (all one edit)"""
+        self.sync()
+        ranges = merge_ranges(ranges, len(self.store))
+        if not ranges:
+            return []
+        rows = self.store.cut(*ranges[0])
+        for start, stop in ranges[1:]:
+            rows.insert_rows(len(rows), self.store.cut(start, stop))
+        apply(rows)
+        changes = []
+        offset = 0
+        with self.group():
+            for start, stop in ranges:
+                changes.append(self.update_rows(start, rows.cut(offset, offset + stop - start)))
+                offset += stop - start
+        return changes
+
+    def _insert_pieces(self, pieces):
+        """Put back (index, rows, ids) pieces in one pass over the store.
+
+        Indices are ascending and each counts the pieces before it as already
+        inserted, i.e. the pieces read like a series of inserts (the inverse of
+        remove_ranges).
+        """
+        self.sync()
+        at = []
+        inserted = 0
+        for index, rows, ids in pieces:
+            at.append(index - inserted)
+            inserted += len(rows)
+            self._check_range(at[-1], 0)
+        self.store.insert_pieces([(position, rows) for position, (_, rows, _) in zip(at, pieces)])
+        ids = array('q')
+        kept = 0
+        for position, (_, _, piece_ids) in zip(at, pieces):
+            ids += self.ids[kept:position]
+            ids += array('q', piece_ids)
+            kept = position
+        ids += self.ids[kept:]
+        self.ids = ids
+        changes = [EventChange(INSERT, index, len(rows), ids=array('q', piece_ids)) for index, rows, piece_ids in pieces]
+        with self.group():
+            for change in changes:
+                self._emit(change)
+        return changes
+
+
+def _round(value):
+    """Round a (numpy or plain) number to integer values"""
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return numpy.rint(value).astype(numpy.int64)
+    return int(round(value))
+
+
+def _clamp_time(value):
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return numpy.maximum(value, 0)
+    return max(0, value)
+
+
+def _min_corner(rows, mask):
+    """Smallest x and y among the masked rows"""
+    corner = []
+    for column in (rows.x, rows.y):
+        if numpy is not None:
+            values = _view(column, 0, len(rows))[mask]
+            corner.append(int(values.min()) if values.size else 0)
+        else:
+            values = [value for value, m in zip(column, mask) if m]
+            corner.append(min(values) if values else 0)
+    return tuple(corner)
@@ -0,0 +1,424 @@
+"""
+Event Index for  Macro Recorder
+Answers editor searches (type, time range, screen region, key) from prebuilt indexes
+"""
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from event_editor import INSERT, REMOVE, MOVE, RESET
+from event_store import EVENT_TYPES, TYPE_FIELDS, seconds_to_us
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, queries fall back to plain loops
+    numpy = None
+
+# Side of a spatial grid cell in pixels
+GRID_CELL_PX = 64
+
+# Edits touching more rows than this mark the index stale instead of patching it entry by entry
+REBUILD_AFTER = 256
+
+# Short names accepted by type: in queries
+TYPE_ALIASES = {
+    'move': 'mouse_move',
+    'click': 'mouse_click',
+    'scroll': 'mouse_scroll',
+    'press': 'key_press',
+    'release': 'key_release',
+}
+
+AREAS = ('top-left', 'top-right', 'bottom-left', 'bottom-right')
+
+
+def parse_query(text, screen_size=None):
+    """Turn query bar text into EventIndex.query() keyword arguments.
+
+    Tokens (all optional, combined with AND):
+      type:click,move     event types (full names or move/click/scroll/press/release)
+      t:30-90             time range in seconds; t:30- and t:-90 leave one side open
+      x:0-960  y:0-540    screen region in pixels
+      area:top-right      a quadrant of the screen (needs screen_size)
+      key:a,space         key events for these keys
+    """
+    criteria = {}
+    for token in text.split():
+        name, _, value = token.partition(':')
+        name = name.lower()
+        if not value:
+            raise ValueError(f"Expected name:value, got '{token}'")
+        if name == 'type':
+            types = []
+            for part in value.lower().split(','):
+                event_type = TYPE_ALIASES.get(part, part)
+                if event_type not in EVENT_TYPES:
+                    raise ValueError(f"Unknown event type '{part}'")
+                types.append(event_type)
+            criteria['types'] = types
+        elif name in ('t', 'time'):
+            criteria['start_s'], criteria['end_s'] = _parse_span(value, float)
+        elif name in ('x', 'y'):
+            low, high = _parse_span(value, int)
+            criteria[f'{name}_range'] = (low, high)
+        elif name == 'area':
+            if value not in AREAS:
+                raise ValueError(f"Unknown area '{value}' (use {', '.join(AREAS)})")
+            if not screen_size:
+                raise ValueError("area: needs the screen size")
+            width, height = screen_size
+            vertical, horizontal = value.split('-')
+            criteria['x_range'] = (0, width // 2 - 1) if horizontal == 'left' else (width // 2, None)
+            criteria['y_range'] = (0, height // 2 - 1) if vertical == 'top' else (height // 2, None)
+        elif name == 'key':
+            criteria['keys'] = value.split(',')
+        else:
+            raise ValueError(f"Unknown query field '{name}'")
+    return criteria
+
+
+def _parse_span(value, convert):
+    """'a-b', 'a-' or '-b' -> (a, b) with None for an open side"""
+    low, separator, high = value.partition('-')
+    if not separator:
+        raise ValueError(f"Expected a range like 10-20, got '{value}'")
+    return (convert(low) if low else None), (convert(high) if high else None)
+
+
+def positions_to_ranges(positions):
+    """Sorted row indices -> (start, stop) ranges of consecutive rows"""
+    if not len(positions):
+        return []
+    if numpy is not None:
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        breaks = numpy.flatnonzero(numpy.diff(positions) != 1) + 1
+        starts = numpy.concatenate(([positions[0]], positions[breaks]))
+        stops = numpy.concatenate((positions[breaks - 1] + 1, [positions[-1] + 1]))
+        return list(zip(starts.tolist(), stops.tolist()))
+    ranges = []
+    for position in positions:
+        if ranges and ranges[-1][1] == position:
+            ranges[-1][1] = position + 1
+        else:
+            ranges.append([position, position + 1])
+    return [tuple(r) for r in ranges]
+
+
+def _to_array(values):
+    result = array('q')
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        result.frombytes(values.astype(numpy.int64).tobytes())
+    else:
+        result.extend(values)
+    return result
+
+
+class EventIndex:
+    """Search indexes over an EventEditor's events.
+
+    * per-type posting lists: type code -> ids of the events of that type
+    * a timestamp index: every event's timestamp, sorted, with the matching ids
+    * a spatial grid: GRID_CELL_PX cells -> ids of the mouse events inside
+
+    Entries are stable event ids (see EventEditor), so inserting, removing or
+    moving rows never renumbers the index; only the touched events are added
+    or dropped, from the editor's change notifications. Ids are turned into
+    row indices at query time through a map that is rebuilt (one vectorized
+    pass) only after rows were inserted, removed or moved.
+
+    A query takes its candidates from whichever index narrows it most, then
+    checks every condition on those candidates only. Large edits and resets
+    just mark the index stale; it is rebuilt on the next query.
+    """
+
+    def __init__(self, editor, cell_size=GRID_CELL_PX):
+        self.editor = editor
+        self.cell_size = cell_size
+        self._by_type = {}
+        self._time_keys = array('q')
+        self._time_ids = array('q')
+        self._cells = {}
+        self._positions = None
+        self._stale = True
+        self.rebuilds = 0
+        editor.add_listener(self._on_changes)
+
+    # ---------------- Building ---------------- #
+    def rebuild(self):
+        """Build every index from the editor's current events"""
+        store = self.editor.store
+        self._by_type = {}
+        self._cells = {}
+        if numpy is not None:
+            self._rebuild_numpy(store)
+        else:
+            self._rebuild_python(store)
+        self._positions = None
+        self._stale = False
+        self.rebuilds += 1
+
+    def _rebuild_numpy(self, store):
+        columns = store.as_numpy()
+        ids = numpy.frombuffer(self.editor.ids, dtype=numpy.int64)
+        types = columns['types']
+        timestamps = columns['timestamps'].astype(numpy.int64)
+        order = numpy.argsort(timestamps, kind='stable')
+        self._time_keys = _to_array(timestamps[order])
+        self._time_ids = _to_array(ids[order])
+        for type_code in numpy.unique(types).tolist():
+            self._by_type[type_code] = _to_array(numpy.sort(ids[types == type_code]))
+
+        spatial = numpy.isin(types, self._coordinate_codes(store))
+        cell_x = columns['x'][spatial].astype(numpy.int64) // self.cell_size
+        cell_y = columns['y'][spatial].astype(numpy.int64) // self.cell_size
+        cell_ids = ids[spatial]
+        order = numpy.lexsort((cell_ids, cell_y, cell_x))
+        cell_x, cell_y, cell_ids = cell_x[order], cell_y[order], cell_ids[order]
+        if len(cell_ids):
+            starts = numpy.flatnonzero(numpy.concatenate(([True], (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1]))))
+            stops = numpy.append(starts[1:], len(cell_ids))
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                self._cells[(int(cell_x[start]), int(cell_y[start]))] = _to_array(cell_ids[start:stop])
+
+    def _rebuild_python(self, store):
+        entries = sorted(zip(store.timestamps, self.editor.ids))
+        self._time_keys = array('q', (timestamp for timestamp, _ in entries))
+        self._time_ids = array('q', (event_id for _, event_id in entries))
+        spatial = set(self._coordinate_codes(store))
+        for event_id, type_code, x, y in sorted(zip(self.editor.ids, store.types, store.x, store.y)):
+            self._by_type.setdefault(type_code, array('q')).append(event_id)
+            if type_code in spatial:
+                self._cells.setdefault(self._cell(x, y), array('q')).append(event_id)
+
+    def _ensure(self):
+        self.editor.sync()
+        if self._stale:
+            self.rebuild()
+
+    @staticmethod
+    def _coordinate_codes(store):
+        return [code for code, name in enumerate(store.type_names) if 'x' in TYPE_FIELDS.get(name, ())]
+
+    def _cell(self, x, y):
+        return x // self.cell_size, y // self.cell_size
+
+    # ---------------- Incremental updates ---------------- #
+    def _on_changes(self, changes):
+        if self._stale:
+            return
+        touched = sum(change.count for change in changes if change.kind != MOVE)
+        if any(change.kind == RESET for change in changes) or touched > REBUILD_AFTER:
+            self._stale = True
+            self._positions = None
+            return
+        if any(change.kind in (INSERT, REMOVE, MOVE) for change in changes):
+            self._positions = None
+        spatial = set(self._coordinate_codes(self.editor.store))
+
+        if len(changes) == 1:
+            # The store matches this change, so new values can be read by position
+            change = changes[0]
+            if change.old is not None:
+                for offset, event_id in enumerate(change.ids):
+                    self._remove_entry(event_id, _row(change.old, offset), spatial)
+            if change.kind != REMOVE and change.kind != MOVE:
+                for offset, event_id in enumerate(change.ids):
+                    self._add_entry(event_id, _row(self.editor.store, change.index + offset), spatial)
+            return
+
+        # Several changes: the store only matches the last one. Drop what the
+        # index holds for every touched event (its values before the first
+        # change that touched it), then add the survivors with their final values.
+        indexed = {}
+        for change in changes:
+            if change.kind == MOVE:
+                continue
+            for offset, event_id in enumerate(change.ids):
+                if event_id not in indexed:
+                    indexed[event_id] = _row(change.old, offset) if change.kind != INSERT else None
+        for event_id, row in indexed.items():
+            if row is not None:
+                self._remove_entry(event_id, row, spatial)
+        positions = self._positions_of(list(indexed))
+        for event_id, position in zip(indexed, positions):
+            if position >= 0:
+                self._add_entry(event_id, _row(self.editor.store, position), spatial)
+
+    def _add_entry(self, event_id, row, spatial):
+        type_code, timestamp, x, y = row
+        insort(self._by_type.setdefault(type_code, array('q')), event_id)
+        at = bisect_right(self._time_keys, timestamp)
+        self._time_keys.insert(at, timestamp)
+        self._time_ids.insert(at, event_id)
+        if type_code in spatial:
+            insort(self._cells.setdefault(self._cell(x, y), array('q')), event_id)
+
+    def _remove_entry(self, event_id, row, spatial):
+        type_code, timestamp, x, y = row
+        _discard(self._by_type.get(type_code), event_id)
+        low, high = bisect_left(self._time_keys, timestamp), bisect_right(self._time_keys, timestamp)
+        try:
+            # array.index only takes start/stop from Python 3.10
+            at = self._time_ids[low:high].index(event_id) + low
+        except ValueError:
+            pass
+        else:
+            del self._time_keys[at]
+            del self._time_ids[at]
+        if type_code in spatial:
+            _discard(self._cells.get(self._cell(x, y)), event_id)
+
+    # ---------------- Ids -> rows ---------------- #
+    def _positions_of(self, event_ids):
+        """Row index of each id (-1 for ids that are gone)"""
+        ids = self.editor.ids
+        if numpy is not None:
+            if self._positions is None:
+                current = numpy.frombuffer(ids, dtype=numpy.int64)
+                base = int(current.min()) if len(current) else 0
+                positions = numpy.full(int(current.max()) - base + 1 if len(current) else 0, -1, dtype=numpy.int64)
+                positions[current - base] = numpy.arange(len(current))
+                self._positions = (base, positions)
+            base, positions = self._positions
+            wanted = numpy.asarray(event_ids, dtype=numpy.int64) - base
+            inside = (wanted >= 0) & (wanted < len(positions))
+            result = numpy.full(len(wanted), -1, dtype=numpy.int64)
+            result[inside] = positions[wanted[inside]]
+            return result
+        if self._positions is None:
+            self._positions = {event_id: position for position, event_id in enumerate(ids)}
+        return [self._positions.get(event_id, -1) for event_id in event_ids]
+
+    # ---------------- Queries ---------------- #
+    def query(self, types=None, start_s=None, end_s=None, x_range=None, y_range=None, keys=None):
+        """Row indices (ascending list) of the events matching every given condition.
+
+        types: event type names; start_s/end_s: inclusive time bounds in
+        seconds; x_range/y_range: inclusive (low, high) pixel bounds, either
+        side None for open; keys: key names (key events only).
+        """
+        self._ensure()
+        store = self.editor.store
+        type_codes = None
+        if types is not None:
+            type_codes = [store.type_names.index(name) for name in types if name in store.type_names]
+        if keys is not None:
+            key_codes = [code for code, name in enumerate(store.type_names) if 'key' in TYPE_FIELDS.get(name, ())]
+            type_codes = key_codes if type_codes is None else [code for code in type_codes if code in key_codes]
+        region = x_range is not None or y_range is not None
+        if region:
+            coordinate_codes = self._coordinate_codes(store)
+            type_codes = coordinate_codes if type_codes is None else [code for code in type_codes if code in coordinate_codes]
+        start_us = seconds_to_us(start_s) if start_s is not None else None
+        end_us = seconds_to_us(end_s) if end_s is not None else None
+
+        candidates = self._candidates(type_codes, start_us, end_us, x_range, y_range)
+        key_ids = None
+        if keys is not None:
+            key_ids = [store.key_names.index(key) for key in keys if key in store.key_names]
+        return self._filter(candidates, type_codes, start_us, end_us, x_range, y_range, key_ids)
+
+    def _candidates(self, type_codes, start_us, end_us, x_range, y_range):
+        """Ids from the most selective index (None: every event)"""
+        options = []
+        if type_codes is not None:
+            postings = [self._by_type.get(code, array('q')) for code in type_codes]
+            options.append((sum(len(posting) for posting in postings), lambda: _concat(postings)))
+        if start_us is not None or end_us is not None:
+            low = bisect_left(self._time_keys, start_us) if start_us is not None else 0
+            high = bisect_right(self._time_keys, end_us) if end_us is not None else len(self._time_keys)
+            options.append((max(0, high - low), lambda: self._time_ids[low:high]))
+        if x_range is not None or y_range is not None:
+            cells = self._cells_in(x_range or (None, None), y_range or (None, None))
+            options.append((sum(len(cell) for cell in cells), lambda: _concat(cells)))
+        if not options:
+            return None
+        return min(options, key=lambda option: option[0])[1]()
+
+    def _cells_in(self, x_range, y_range):
+        def cell_span(low, high):
+            return (None if low is None else low // self.cell_size,
+                    None if high is None else high // self.cell_size)
+
+        (x_low, x_high), (y_low, y_high) = cell_span(*x_range), cell_span(*y_range)
+        return [ids for (cell_x, cell_y), ids in self._cells.items()
+                if (x_low is None or cell_x >= x_low) and (x_high is None or cell_x <= x_high)
+                and (y_low is None or cell_y >= y_low) and (y_high is None or cell_y <= y_high)]
+
+    def _filter(self, candidates, type_codes, start_us, end_us, x_range, y_range, key_ids):
+        """Exact check of every condition on the candidate rows"""
+        store = self.editor.store
+        if numpy is not None:
+            if candidates is None:
+                positions = numpy.arange(len(store), dtype=numpy.int64)
+            else:
+                positions = self._positions_of(numpy.frombuffer(candidates, dtype=numpy.int64)
+                                               if isinstance(candidates, array) else candidates)
+                positions = numpy.sort(positions[positions >= 0])
+            columns = store.as_numpy()
+            keep = numpy.ones(len(positions), dtype=bool)
+            if type_codes is not None:
+                keep &= numpy.isin(columns['types'][positions], type_codes)
+            for column, low, high in (('timestamps', start_us, end_us),
+                                      ('x',) + tuple(x_range or (None, None)),
+                                      ('y',) + tuple(y_range or (None, None))):
+                if low is not None:
+                    keep &= columns[column][positions] >= low
+                if high is not None:
+                    keep &= columns[column][positions] <= high
+            if key_ids is not None:
+                keep &= numpy.isin(columns['keys'][positions], key_ids)
+            return positions[keep].tolist()
+
+        if candidates is None:
+            positions = range(len(store))
+        else:
+            positions = sorted(position for position in self._positions_of(candidates) if position >= 0)
+        type_codes = set(type_codes) if type_codes is not None else None
+        key_ids = set(key_ids) if key_ids is not None else None
+        x_low, x_high = x_range or (None, None)
+        y_low, y_high = y_range or (None, None)
+        result = []
+        for position in positions:
+            if type_codes is not None and store.types[position] not in type_codes:
+                continue
+            timestamp = store.timestamps[position]
+            if (start_us is not None and timestamp < start_us) or (end_us is not None and timestamp > end_us):
+                continue
+            x, y = store.x[position], store.y[position]
+            if (x_low is not None and x < x_low) or (x_high is not None and x > x_high):
+                continue
+            if (y_low is not None and y < y_low) or (y_high is not None and y > y_high):
+                continue
+            if key_ids is not None and store.keys[position] not in key_ids:
+                continue
+            result.append(position)
+        return result
+
+    def stats(self):
+        return {
+            'types': {self.editor.store.type_names[code]: len(ids) for code, ids in self._by_type.items()},
+            'timestamps': len(self._time_keys),
+            'cells': len(self._cells),
+            'stale': self._stale,
+            'rebuilds': self.rebuilds,
+        }
+
+
+def _row(rows, index):
+    """The indexed values of one row: type code, timestamp, x, y"""
+    return rows.types[index], rows.timestamps[index], rows.x[index], rows.y[index]
+
+
+def _discard(ids, event_id):
+    if ids is None:
+        return
+    at = bisect_left(ids, event_id)
+    if at < len(ids) and ids[at] == event_id:
+        del ids[at]
+
+
+def _concat(arrays):
+    result = array('q')
+    for ids in arrays:
+        result += ids
+    return result
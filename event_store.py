@@ -0,0 +1,478 @@
+"""
+Columnar Event Store for  Macro Recorder
+Keeps recorded events in typed arrays instead of one dict per event
+"""
+import json
+import struct
+from array import array
+from bisect import bisect_right
+
+from delta_codec import encode_block, read_block
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, the store works on plain arrays
+    numpy = None
+
+# Built-in event types, in type-code order
+EVENT_TYPES = ('mouse_move', 'mouse_click', 'mouse_scroll', 'key_press', 'key_release', 'delay')
+MOUSE_MOVE, MOUSE_CLICK, MOUSE_SCROLL, KEY_PRESS, KEY_RELEASE, DELAY = range(len(EVENT_TYPES))
+
+# Fields stored in columns for each event type; anything else goes to the extras table
+TYPE_FIELDS = {
+    'mouse_move': ('x', 'y'),
+    'mouse_click': ('x', 'y', 'button', 'pressed'),
+    'mouse_scroll': ('x', 'y', 'dx', 'dy'),
+    'key_press': ('key',),
+    'key_release': ('key',),
+    'delay': (),
+}
+
+# Column name -> array typecode
+COLUMNS = (
+    ('types', 'B'),
+    ('timestamps', 'q'),
+    ('x', 'i'),
+    ('y', 'i'),
+    ('dx', 'i'),
+    ('dy', 'i'),
+    ('keys', 'i'),
+    ('buttons', 'b'),
+    ('pressed', 'b'),
+    ('extras', 'i'),
+)
+
+US_PER_SECOND = 1_000_000
+
+# pack_delta header: event count, size of the JSON tables that follow
+PACKED_HEADER = struct.Struct('<QI')
+
+
+def seconds_to_us(seconds):
+    """Convert float seconds to integer microseconds"""
+    return int(round(float(seconds) * US_PER_SECOND))
+
+
+class EventStore:
+    """Array-backed event list with a dict-compatible interface.
+
+    Each event is one row across the columns in COLUMNS. Strings (event types,
+    key names, button names) are interned into small tables and stored as ids.
+    Rare fields such as a delay's duration/description live in a side table
+    referenced by the ``extras`` column. Indexing returns a fresh dict, so code
+    written against the old list of dicts keeps working; assigning a dict back
+    through ``store[i] = event`` writes it into the columns.
+    """
+
+    def __init__(self, events=None):
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+        self.type_names = list(EVENT_TYPES)
+        self.key_names = []
+        self.button_names = []
+        self._type_ids = {name: i for i, name in enumerate(self.type_names)}
+        self._key_ids = {}
+        self._button_ids = {}
+        self._extras = []
+        # Bumped on every mutation so derived data (e.g. a compiled playback plan) can tell it is stale
+        self.version = 0
+
+        if events:
+            self.extend(events)
+
+    @classmethod
+    def from_columns(cls, columns, type_names, key_names, button_names, extras):
+        """Build a store from ready-made column arrays and their lookup tables"""
+        store = cls()
+        for name, typecode in COLUMNS:
+            column = columns[name]
+            if not isinstance(column, array) or column.typecode != typecode:
+                column = array(typecode, column)
+            setattr(store, name, column)
+        store.type_names = list(type_names)
+        store.key_names = list(key_names)
+        store.button_names = list(button_names)
+        store._type_ids = {name: i for i, name in enumerate(store.type_names)}
+        store._key_ids = {name: i for i, name in enumerate(store.key_names)}
+        store._button_ids = {name: i for i, name in enumerate(store.button_names)}
+        store._extras = list(extras)
+        return store
+
+    @classmethod
+    def unpack_delta(cls, data):
+        """Rebuild a store from pack_delta() bytes"""
+        count, table_size = PACKED_HEADER.unpack_from(data)
+        offset = PACKED_HEADER.size + table_size
+        tables = json.loads(bytes(data[PACKED_HEADER.size:offset]))
+        view = memoryview(data)
+
+        def read(size):
+            nonlocal offset
+            chunk = view[offset:offset + size]
+            offset += size
+            return chunk
+
+        columns = {name: read_block(read, name, count, typecode) for name, typecode in COLUMNS}
+        return cls.from_columns(columns, tables['type_names'], tables['key_names'],
+                                tables['button_names'], tables['extras'])
+
+    def pack_delta(self):
+        """Serialize the store to compact bytes.
+
+        The lookup tables are stored as JSON, then every column as zigzag
+        varints, with timestamps and coordinates as deltas (see delta_codec).
+        """
+        extras, extras_column = self.compact_extras()
+        tables = json.dumps({
+            'type_names': self.type_names,
+            'key_names': self.key_names,
+            'button_names': self.button_names,
+            'extras': extras,
+        }, separators=(',', ':')).encode('utf-8')
+        blocks = [encode_block(name, extras_column if name == 'extras' else getattr(self, name))
+                  for name, _ in COLUMNS]
+        return b''.join([PACKED_HEADER.pack(len(self), len(tables)), tables] + blocks)
+
+    # ---------------- Interning ---------------- #
+    def intern_type(self, name):
+        type_id = self._type_ids.get(name)
+        if type_id is None:
+            type_id = len(self.type_names)
+            if type_id > 255:
+                raise ValueError("Too many distinct event types")
+            self.type_names.append(name)
+            self._type_ids[name] = type_id
+        return type_id
+
+    def intern_key(self, name):
+        if name is None:
+            return -1
+        key_id = self._key_ids.get(name)
+        if key_id is None:
+            key_id = len(self.key_names)
+            self.key_names.append(name)
+            self._key_ids[name] = key_id
+        return key_id
+
+    def intern_button(self, name):
+        if name is None:
+            return -1
+        button_id = self._button_ids.get(name)
+        if button_id is None:
+            button_id = len(self.button_names)
+            if button_id > 127:
+                raise ValueError("Too many distinct mouse buttons")
+            self.button_names.append(name)
+            self._button_ids[name] = button_id
+        return button_id
+
+    def _add_extra(self, extra):
+        if not extra:
+            return -1
+        self._extras.append(extra)
+        return len(self._extras) - 1
+
+    # ---------------- Row encoding ---------------- #
+    def append_raw(self, type_code, timestamp_us, x=0, y=0, dx=0, dy=0, key_id=-1, button_id=-1, pressed=-1, extra_id=-1):
+        """Append one event from already-encoded column values (no dict created)"""
+        self.types.append(type_code)
+        self.timestamps.append(timestamp_us)
+        self.x.append(x)
+        self.y.append(y)
+        self.dx.append(dx)
+        self.dy.append(dy)
+        self.keys.append(key_id)
+        self.buttons.append(button_id)
+        self.pressed.append(pressed)
+        self.extras.append(extra_id)
+        self.version += 1
+
+    def _encode(self, event):
+        """Turn an event dict into a tuple of column values"""
+        event_type = event.get('type', 'delay')
+        fields = TYPE_FIELDS.get(event_type, ())
+        if 'timestamp_us' in event:
+            timestamp_us = int(event['timestamp_us'])
+        else:
+            timestamp_us = seconds_to_us(event.get('timestamp', 0))
+
+        pressed = event.get('pressed') if 'pressed' in fields else None
+        extra = {k: v for k, v in event.items()
+                 if k not in fields and k not in ('type', 'timestamp', 'timestamp_us')}
+
+        return (
+            self.intern_type(event_type),
+            timestamp_us,
+            int(round(event.get('x', 0))) if 'x' in fields else 0,
+            int(round(event.get('y', 0))) if 'y' in fields else 0,
+            int(event.get('dx', 0)) if 'dx' in fields else 0,
+            int(event.get('dy', 0)) if 'dy' in fields else 0,
+            self.intern_key(event.get('key')) if 'key' in fields else -1,
+            self.intern_button(event.get('button')) if 'button' in fields else -1,
+            -1 if pressed is None else int(bool(pressed)),
+            self._add_extra(extra),
+        )
+
+    def _decode(self, index, integer_timestamps=False):
+        """Build the event dict for a row"""
+        event_type = self.type_names[self.types[index]]
+        if integer_timestamps:
+            event = {'type': event_type, 'timestamp_us': self.timestamps[index]}
+        else:
+            event = {'type': event_type, 'timestamp': self.timestamps[index] / US_PER_SECOND}
+        for field in TYPE_FIELDS.get(event_type, ()):
+            if field == 'x':
+                event['x'] = self.x[index]
+            elif field == 'y':
+                event['y'] = self.y[index]
+            elif field == 'dx':
+                event['dx'] = self.dx[index]
+            elif field == 'dy':
+                event['dy'] = self.dy[index]
+            elif field == 'key':
+                key_id = self.keys[index]
+                event['key'] = self.key_names[key_id] if key_id >= 0 else None
+            elif field == 'button':
+                button_id = self.buttons[index]
+                event['button'] = self.button_names[button_id] if button_id >= 0 else None
+            elif field == 'pressed':
+                event['pressed'] = self.pressed[index] == 1
+        extra_id = self.extras[index]
+        if extra_id >= 0:
+            event.update(self._extras[extra_id])
+        return event
+
+    def _columns(self):
+        return [getattr(self, name) for name, _ in COLUMNS]
+
+    def _write_row(self, index, row):
+        for column, value in zip(self._columns(), row):
+            column[index] = value
+        self.version += 1
+
+    def _insert_row(self, index, row):
+        for column, value in zip(self._columns(), row):
+            column.insert(index, value)
+        self.version += 1
+
+    # ---------------- List interface ---------------- #
+    def __len__(self):
+        return len(self.types)
+
+    def __iter__(self):
+        for i in range(len(self.types)):
+            yield self._decode(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._slice(index)
+        return self._decode(self._normalize_index(index))
+
+    def __setitem__(self, index, event):
+        self._write_row(self._normalize_index(index), self._encode(event))
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice):
+            index = self._normalize_index(index)
+        for column in self._columns():
+            del column[index]
+        self.version += 1
+
+    def _normalize_index(self, index):
+        length = len(self.types)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("event index out of range")
+        return index
+
+    def _slice(self, index):
+        result = EventStore()
+        result.type_names = list(self.type_names)
+        result._type_ids = dict(self._type_ids)
+        result.key_names = list(self.key_names)
+        result._key_ids = dict(self._key_ids)
+        result.button_names = list(self.button_names)
+        result._button_ids = dict(self._button_ids)
+        result._extras = list(self._extras)
+        for name, _ in COLUMNS:
+            setattr(result, name, getattr(self, name)[index])
+        return result
+
+    def delete_ranges(self, ranges):
+        """Remove several ascending, non-overlapping (start, stop) row ranges in one pass"""
+        kept = []
+        position = 0
+        for start, stop in ranges:
+            if start > position:
+                kept.append((position, start))
+            position = max(position, stop)
+        kept.append((position, len(self.types)))
+        for name, typecode in COLUMNS:
+            column = getattr(self, name)
+            result = array(typecode)
+            for start, stop in kept:
+                result += column[start:stop]
+            setattr(self, name, result)
+        self.version += 1
+
+    def insert_pieces(self, pieces):
+        """Insert several (index, rows) pieces, ascending indices into the current rows, in one pass"""
+        for name, typecode in COLUMNS:
+            column = getattr(self, name)
+            result = array(typecode)
+            position = 0
+            for index, rows in pieces:
+                result += column[position:index]
+                result += getattr(rows, name)
+                position = index
+            result += column[position:]
+            setattr(self, name, result)
+        self.version += 1
+
+    def cut(self, start, stop):
+        """Rows start..stop as a store that shares this store's lookup tables.
+
+        Costs only the column bytes, unlike a slice, which copies the tables.
+        Meant to be kept aside and put back with insert_rows/write_rows (e.g.
+        for undo); interning new strings into the cut would change this
+        store's tables too.
+        """
+        result = EventStore()
+        result.type_names = self.type_names
+        result._type_ids = self._type_ids
+        result.key_names = self.key_names
+        result._key_ids = self._key_ids
+        result.button_names = self.button_names
+        result._button_ids = self._button_ids
+        result._extras = self._extras
+        for name, _ in COLUMNS:
+            setattr(result, name, getattr(self, name)[start:stop])
+        return result
+
+    def take(self, indices):
+        """Return a new store holding only the rows at the given (ascending) indices"""
+        result = self._slice(slice(0, 0))
+        for name, typecode in COLUMNS:
+            column = getattr(self, name)
+            setattr(result, name, array(typecode, [column[i] for i in indices]))
+        return result
+
+    def copy(self):
+        """Return an independent copy of the store (with only the extras its rows use)"""
+        result = self._slice(slice(None))
+        extras, result.extras = result.compact_extras()
+        result._extras = [dict(extra) for extra in extras]
+        return result
+
+    def compact_extras(self):
+        """(extras table, extras column) with only the table entries that rows still use.
+
+        Overwriting or deleting an event leaves its extras in the table, since
+        rows cut earlier (e.g. kept for undo) may still refer to them; copies
+        and saved files are written from this instead. The store is unchanged.
+        """
+        column = self.extras
+        if numpy is not None:
+            ids = self.as_numpy()['extras']
+            used = numpy.unique(ids[ids >= 0])
+            if len(used) == len(self._extras):
+                return self._extras, column
+            # Index -1 (no extras) lands on the last slot, which stays -1
+            remap = numpy.full(len(self._extras) + 1, -1, dtype=numpy.int32)
+            remap[used] = numpy.arange(len(used), dtype=numpy.int32)
+            compacted = array('i')
+            compacted.frombytes(remap[ids].astype(numpy.int32).tobytes())
+            return [self._extras[i] for i in used.tolist()], compacted
+        used = sorted(set(column) - {-1})
+        if len(used) == len(self._extras):
+            return self._extras, column
+        remap = {old: new for new, old in enumerate(used)}
+        remap[-1] = -1
+        return [self._extras[i] for i in used], array('i', (remap[i] for i in column))
+
+    def append(self, event):
+        self._insert_row(len(self.types), self._encode(event))
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def insert(self, index, event):
+        length = len(self.types)
+        if index < 0:
+            index = max(0, index + length)
+        self._insert_row(min(index, length), self._encode(event))
+
+    def insert_rows(self, index, rows):
+        """Insert every row of a store taken from this one (a slice or take()) at index.
+
+        The rows' ids into the lookup tables are used as-is; the tables only
+        ever grow, so rows cut from this store earlier are still valid here.
+        """
+        for name, _ in COLUMNS:
+            getattr(self, name)[index:index] = getattr(rows, name)
+        self.version += 1
+
+    def write_rows(self, index, rows):
+        """Overwrite len(rows) rows starting at index with rows taken from this store"""
+        stop = index + len(rows)
+        if not 0 <= index <= stop <= len(self.types):
+            raise IndexError("event index out of range")
+        for name, _ in COLUMNS:
+            getattr(self, name)[index:stop] = getattr(rows, name)
+        self.version += 1
+
+    def clear(self):
+        # The extras table is kept, like the lookup tables: cuts share it and
+        # their ids must stay valid. copy() and saving drop unused entries.
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+        self.version += 1
+
+    def to_dicts(self, integer_timestamps=False):
+        """Materialize every event as a dict (for JSON export).
+
+        With integer_timestamps the dicts carry 'timestamp_us' (int) instead of
+        'timestamp' (float seconds), which is what macro files store.
+        """
+        return list(self.iter_dicts(integer_timestamps))
+
+    def iter_dicts(self, integer_timestamps=False):
+        """Like to_dicts, one event at a time"""
+        for i in range(len(self.types)):
+            yield self._decode(i, integer_timestamps)
+
+    def rows(self):
+        """Iterate encoded rows as tuples of column values, in COLUMNS order"""
+        return zip(*self._columns())
+
+    # ---------------- Queries ---------------- #
+    @property
+    def duration(self):
+        """Timestamp of the last event in seconds"""
+        if not self.timestamps:
+            return 0
+        return self.timestamps[-1] / US_PER_SECOND
+
+    def type_name(self, index):
+        return self.type_names[self.types[index]]
+
+    def remove_after(self, cutoff_us):
+        """Remove trailing events later than cutoff_us; returns how many were removed"""
+        index = bisect_right(self.timestamps, cutoff_us)
+        removed = len(self.types) - index
+        if removed > 0:
+            del self[index:]
+        return removed
+
+    def nbytes(self):
+        """Approximate memory held by the columns (excluding the small lookup tables)"""
+        return sum(column.itemsize * len(column) for column in self._columns())
+
+    def as_numpy(self):
+        """Return zero-copy numpy views of every column, keyed by column name"""
+        if numpy is None:
+            raise RuntimeError("numpy is not installed")
+        return {name: numpy.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode)
+                for name, _ in COLUMNS}
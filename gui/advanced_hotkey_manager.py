@@ -31,6 +31,9 @@ class AdvancedHotkeyManager:
         # Track recent key combinations
         self.recent_combinations = []
         self.combination_timeout = 0.5  # seconds
+        
+        # One-shot playback trigger armed on this listener: (combination, callback)
+        self.trigger = None
     
     def set_hotkeys(self, start_rec, stop_rec, trigger, stop_play):
         """Update hotkey configuration"""
@@ -41,6 +44,17 @@ class AdvancedHotkeyManager:
             'stop_playing': stop_play.lower()
         }
     
+    def register_trigger(self, hotkey, callback):
+        """Call callback (from the listener thread) the next time hotkey is pressed.
+
+        The callback must return quickly; it takes precedence over configured hotkeys.
+        """
+        self.trigger = (hotkey.lower(), callback)
+    
+    def clear_trigger(self):
+        """Disarm a registered trigger"""
+        self.trigger = None
+    
     def start_listening(self):
         """Start the global hotkey listener"""
         if self.listener:
@@ -73,6 +87,13 @@ class AdvancedHotkeyManager:
             combination = self._get_active_combination(key)
             
             if combination:
+                # An armed playback trigger wins over the configured hotkeys
+                trigger = self.trigger
+                if trigger and self._combinations_match(combination, trigger[0]):
+                    self.trigger = None
+                    trigger[1]()
+                    return True
+                
                 # Check against configured hotkeys
                 for hotkey_name, hotkey_combo in self.hotkeys.items():
                     if self._combinations_match(combination, hotkey_combo):
@@ -170,7 +191,8 @@ class AdvancedHotkeyManager:
             if (not self.gui_controller.is_playing and 
                 not self.gui_controller.is_recording and 
                 self.gui_controller.recorder.events):
-                self.gui_controller.root.after(0, self.gui_controller.start_auto_playback)
+                trigger_ns = self.gui_controller.recorder.clock.now_ns()
+                self.gui_controller.root.after(0, lambda: self.gui_controller.start_auto_playback(trigger_ns))
         
         elif hotkey_name == 'stop_playing':
             if self.gui_controller.is_playing:
@@ -3,6 +3,7 @@ Modular GUI Components for  Macro Recorder
 """
 import customtkinter as ctk
 from tkinter import ttk, messagebox
+import os
 import uuid
 from datetime import datetime
 from .gui_styles import ThemeManager, StyleHelper
@@ -121,6 +122,22 @@ class SettingsPanel:
         self.scheduler_enabled_var = None
         self.schedules = []
         self.scheduler_tree = None
+        # Playback timing state
+        self.timing_mode_var = None
+        self.spin_margin_var = None
+        self.loop_mode_var = None
+        self.overrun_policy_var = None
+        self.speed_var = None
+        self.gap_threshold_var = None
+        self.compressed_gap_var = None
+        self.move_rate_var = None
+        self.playback_stats_label = None
+        # Library state
+        self.library_folder_var = None
+        self.library_search_var = None
+        self.library_sort_var = None
+        self.library_tree = None
+        self.library_info_label = None
         
     def create(self):
         """Create the settings panel"""
@@ -146,6 +163,8 @@ class SettingsPanel:
         general_tab = tabview.add("General")
         hotkeys_tab = tabview.add("Hotkeys")
         scheduler_tab = tabview.add("Scheduler")
+        playback_tab = tabview.add("Playback")
+        library_tab = tabview.add("Library")
         
         # General tab
         self._create_trigger_section(general_tab)
@@ -159,6 +178,12 @@ class SettingsPanel:
         # Scheduler tab
         self._create_scheduler_section(scheduler_tab)
         
+        # Playback tab
+        self._create_playback_section(playback_tab)
+        
+        # Library tab
+        self._create_library_section(library_tab)
+        
         return self.frame
     
     def _create_trigger_section(self, parent):
@@ -337,6 +362,198 @@ class SettingsPanel:
         )
         load_btn.pack(side="left")
 
+    # ---------------- Playback timing UI ---------------- #
+    def _create_playback_section(self, parent):
+        section = StyleHelper.create_frame(parent, fg_color="transparent")
+        section.pack(fill="both", expand=False, padx=20, pady=(10, 15))
+        
+        title = StyleHelper.create_label(
+            section,
+            text="Playback Timing",
+            style='subheading',
+            anchor="w"
+        )
+        title.pack(fill="x", pady=(0, 8))
+        
+        # Timing mode
+        mode_row = StyleHelper.create_frame(section, fg_color="transparent")
+        mode_row.pack(fill="x", pady=(0, 5))
+        StyleHelper.create_label(mode_row, text="Timing mode:", style='small', anchor="w", width=120).pack(side="left", padx=(0, 10))
+        self.timing_mode_var = ctk.StringVar(value="power_saving")
+        ctk.CTkComboBox(
+            mode_row, values=["power_saving", "precise"], variable=self.timing_mode_var, width=160
+        ).pack(side="left")
+        
+        # Spin margin
+        margin_row = StyleHelper.create_frame(section, fg_color="transparent")
+        margin_row.pack(fill="x", pady=(0, 5))
+        StyleHelper.create_label(margin_row, text="Spin margin (ms):", style='small', anchor="w", width=120).pack(side="left", padx=(0, 10))
+        self.spin_margin_var = ctk.StringVar(value="2.0")
+        margin_entry = StyleHelper.create_entry(margin_row, placeholder="2.0", width=100, height=30)
+        margin_entry.configure(textvariable=self.spin_margin_var, font=ThemeManager.get_font('small'))
+        margin_entry.pack(side="left")
+        
+        hint_label = StyleHelper.create_label(
+            section,
+            text="Precise mode spins the last few ms before each event: tighter timing, more CPU",
+            style='small',
+            anchor='w'
+        )
+        hint_label.pack(fill="x", pady=(0, 10))
+        
+        # Loop mode
+        loop_row = StyleHelper.create_frame(section, fg_color="transparent")
+        loop_row.pack(fill="x", pady=(0, 5))
+        StyleHelper.create_label(loop_row, text="Loop mode:", style='small', anchor="w", width=120).pack(side="left", padx=(0, 10))
+        self.loop_mode_var = ctk.StringVar(value="fixed_delay")
+        ctk.CTkComboBox(
+            loop_row, values=["fixed_delay", "fixed_rate"], variable=self.loop_mode_var, width=160
+        ).pack(side="left")
+        
+        # Overrun policy (fixed rate only)
+        overrun_row = StyleHelper.create_frame(section, fg_color="transparent")
+        overrun_row.pack(fill="x", pady=(0, 5))
+        StyleHelper.create_label(overrun_row, text="On overrun:", style='small', anchor="w", width=120).pack(side="left", padx=(0, 10))
+        self.overrun_policy_var = ctk.StringVar(value="skip")
+        ctk.CTkComboBox(
+            overrun_row, values=["skip", "catch_up", "delay"], variable=self.overrun_policy_var, width=160
+        ).pack(side="left")
+        
+        loop_hint = StyleHelper.create_label(
+            section,
+            text="Fixed rate starts iteration N at N × repeat interval, no matter how long each run takes",
+            style='small',
+            anchor='w'
+        )
+        loop_hint.pack(fill="x", pady=(0, 10))
+        
+        # Time warp
+        self.speed_var = ctk.StringVar(value="1.0")
+        self.gap_threshold_var = ctk.StringVar(value="0")
+        self.compressed_gap_var = ctk.StringVar(value="1.0")
+        for label_text, var, placeholder in (
+            ("Speed (0.25-20x):", self.speed_var, "1.0"),
+            ("Gaps longer than (s):", self.gap_threshold_var, "0 = off"),
+            ("...shortened to (s):", self.compressed_gap_var, "1.0"),
+        ):
+            row = StyleHelper.create_frame(section, fg_color="transparent")
+            row.pack(fill="x", pady=(0, 5))
+            StyleHelper.create_label(row, text=label_text, style='small', anchor="w", width=120).pack(side="left", padx=(0, 10))
+            entry = StyleHelper.create_entry(row, placeholder=placeholder, width=100, height=30)
+            entry.configure(textvariable=var, font=ThemeManager.get_font('small'))
+            entry.pack(side="left")
+        
+        # Mouse move injection rate
+        rate_row = StyleHelper.create_frame(section, fg_color="transparent")
+        rate_row.pack(fill="x", pady=(0, 5))
+        StyleHelper.create_label(rate_row, text="Max moves/s:", style='small', anchor="w", width=120).pack(side="left", padx=(0, 10))
+        self.move_rate_var = ctk.StringVar(value="off")
+        ctk.CTkComboBox(
+            rate_row, values=["off", "60", "120", "240"], variable=self.move_rate_var, width=160
+        ).pack(side="left")
+        
+        btn_row = StyleHelper.create_frame(section, fg_color="transparent")
+        btn_row.pack(fill="x", pady=(0, 8))
+        StyleHelper.create_button(
+            btn_row, text="Apply Playback", style_type='apply', command=self._apply_playback_timing, width=140, height=28
+        ).pack(side="left", padx=(0, 6))
+        StyleHelper.create_button(
+            btn_row, text="📊 Last Run", style_type='apply', command=self.refresh_playback_stats, width=120, height=28
+        ).pack(side="left")
+        
+        # Lateness report of the last run
+        self.playback_stats_label = StyleHelper.create_label(
+            section,
+            text="No playback yet",
+            style='small',
+            anchor="w",
+            justify="left"
+        )
+        self.playback_stats_label.pack(fill="x", pady=(5, 0))
+    
+    def set_playback_state(self, timing_mode, spin_margin_ms):
+        self.timing_mode_var.set(timing_mode)
+        self.spin_margin_var.set(str(spin_margin_ms))
+    
+    def get_playback_state(self):
+        try:
+            spin_margin_ms = float(self.spin_margin_var.get())
+        except ValueError:
+            spin_margin_ms = 2.0
+        return self.timing_mode_var.get(), spin_margin_ms
+    
+    def set_loop_state(self, loop_mode, overrun_policy):
+        self.loop_mode_var.set(loop_mode)
+        self.overrun_policy_var.set(overrun_policy)
+    
+    def get_loop_state(self):
+        return self.loop_mode_var.get(), self.overrun_policy_var.get()
+    
+    def set_warp_state(self, speed, gap_threshold_s, compressed_gap_s):
+        self.speed_var.set(str(speed))
+        self.gap_threshold_var.set(str(gap_threshold_s))
+        self.compressed_gap_var.set(str(compressed_gap_s))
+    
+    def get_warp_state(self):
+        """(speed, gap threshold s, compressed gap s); raises ValueError on non-numbers"""
+        return (
+            float(self.speed_var.get() or 1.0),
+            float(self.gap_threshold_var.get() or 0),
+            float(self.compressed_gap_var.get() or 0),
+        )
+    
+    def set_move_rate_state(self, max_move_rate_hz):
+        self.move_rate_var.set(f"{max_move_rate_hz:g}" if max_move_rate_hz else "off")
+    
+    def get_move_rate_state(self):
+        """Max injected moves per second, 0 when off; raises ValueError on non-numbers"""
+        value = self.move_rate_var.get().strip().lower()
+        return 0.0 if value in ("", "off", "0") else float(value)
+    
+    def _apply_playback_timing(self):
+        timing_mode, spin_margin_ms = self.get_playback_state()
+        loop_mode, overrun_policy = self.get_loop_state()
+        try:
+            speed, gap_threshold_s, compressed_gap_s = self.get_warp_state()
+            max_move_rate_hz = self.get_move_rate_state()
+            self.controller.recorder.set_move_rate(max_move_rate_hz)
+            self.controller.recorder.set_timing_mode(timing_mode, spin_margin_ms)
+            self.controller.recorder.set_loop_mode(loop_mode, overrun_policy)
+            self.controller.recorder.set_time_warp(speed, gap_threshold_s, compressed_gap_s)
+        except ValueError as e:
+            messagebox.showerror("Invalid Playback Setting", str(e))
+            return
+        self.controller.settings_manager.set_playback_timing(timing_mode, spin_margin_ms)
+        self.controller.settings_manager.set_playback_loop(loop_mode, overrun_policy)
+        self.controller.settings_manager.set_playback_warp(speed, gap_threshold_s, compressed_gap_s)
+        self.controller.settings_manager.set_playback_move_rate(max_move_rate_hz)
+        self.controller.settings_manager.save_settings()
+    
+    def refresh_playback_stats(self):
+        stats = self.controller.recorder.get_playback_stats()
+        loop_stats = self.controller.recorder.get_loop_stats()
+        trigger_latency = self.controller.recorder.get_trigger_latency()
+        cache = self.controller.recorder.get_cache_stats()
+        cache_line = (f"Macro cache: {cache['entries']} macros, {cache['bytes'] / 1e6:.1f}/{cache['max_bytes'] / 1e6:.0f} MB · "
+                      f"hits {cache['hits']} · misses {cache['misses']} · evicted {cache['evictions']}")
+        if not stats and not loop_stats:
+            self.playback_stats_label.configure(text="No playback yet\n" + cache_line)
+            return
+        lines = []
+        if stats:
+            lines.append(f"{stats['count']} events · p50 {stats['p50_ms']:.2f} ms · p99 {stats['p99_ms']:.2f} ms")
+            lines.append(f"max {stats['max_ms']:.2f} ms · mean {stats['mean_ms']:.2f} ms")
+            lines.extend(f"  {label:>12}: {count}" for label, count in stats['histogram'])
+        if loop_stats:
+            lines.append(f"Loop: {loop_stats['iterations']} iterations every {loop_stats['period_s']:g}s")
+            lines.append(f"start error last {loop_stats['last_error_ms']:.1f} ms · mean {loop_stats['mean_error_ms']:.1f} ms "
+                         f"· max {loop_stats['max_error_ms']:.1f} ms")
+            lines.append(f"overruns {loop_stats['overruns']} ({loop_stats['overrun_policy']}) · skipped {loop_stats['skipped']}")
+        if trigger_latency:
+            lines.append(f"Trigger to first event: {trigger_latency['trigger_to_first_event_ms']:.2f} ms")
+        lines.append(cache_line)
+        self.playback_stats_label.configure(text="\n".join(lines))
+
     # ---------------- Scheduler UI ---------------- #
     def _create_scheduler_section(self, parent):
         section = StyleHelper.create_frame(parent, fg_color="transparent")
@@ -584,6 +801,168 @@ class SettingsPanel:
         dlg.wait_window()
         return result_holder['value']
 
+    # ---------------- Library UI ---------------- #
+    def _create_library_section(self, parent):
+        section = StyleHelper.create_frame(parent, fg_color="transparent")
+        section.pack(fill="both", expand=True, padx=20, pady=(10, 15))
+        
+        title = StyleHelper.create_label(
+            section,
+            text="Macro Library",
+            style='subheading',
+            anchor="w"
+        )
+        title.pack(fill="x", pady=(0, 8))
+        
+        # Library folder
+        folder_row = StyleHelper.create_frame(section, fg_color="transparent")
+        folder_row.pack(fill="x", pady=(0, 5))
+        StyleHelper.create_label(folder_row, text="Folder:", style='small', anchor="w", width=60).pack(side="left", padx=(0, 10))
+        self.library_folder_var = ctk.StringVar(value="macros")
+        folder_entry = StyleHelper.create_entry(folder_row, placeholder="macros", width=200, height=30)
+        folder_entry.configure(textvariable=self.library_folder_var, font=ThemeManager.get_font('small'))
+        folder_entry.pack(side="left", padx=(0, 6))
+        StyleHelper.create_button(
+            folder_row, text="📁 Open", style_type='apply', command=self._on_open_library, width=80, height=28
+        ).pack(side="left")
+        
+        # Search and sort
+        search_row = StyleHelper.create_frame(section, fg_color="transparent")
+        search_row.pack(fill="x", pady=(0, 5))
+        StyleHelper.create_label(search_row, text="Search:", style='small', anchor="w", width=60).pack(side="left", padx=(0, 10))
+        self.library_search_var = ctk.StringVar(value="")
+        search_entry = StyleHelper.create_entry(search_row, placeholder="name or tag", width=200, height=30)
+        search_entry.configure(textvariable=self.library_search_var, font=ThemeManager.get_font('small'))
+        search_entry.pack(side="left", padx=(0, 6))
+        search_entry.bind("<KeyRelease>", lambda _event: self.refresh_library_table())
+        self.library_sort_var = ctk.StringVar(value="name")
+        ctk.CTkComboBox(
+            search_row, values=["name", "modified", "played", "events", "duration"], variable=self.library_sort_var,
+            width=110, command=lambda _value: self.refresh_library_table()
+        ).pack(side="left")
+        
+        # Buttons
+        btn_row = StyleHelper.create_frame(section, fg_color="transparent")
+        btn_row.pack(fill="x", pady=(0, 8))
+        StyleHelper.create_button(
+            btn_row, text="📂 Load", style_type='apply', command=self._on_load_library_macro, width=90, height=28
+        ).pack(side="left", padx=(0, 6))
+        StyleHelper.create_button(
+            btn_row, text="🏷️ Tags", style_type='apply', command=self._on_edit_library_tags, width=90, height=28
+        ).pack(side="left", padx=(0, 6))
+        StyleHelper.create_button(
+            btn_row, text="🔄 Rescan", style_type='apply', command=self._on_rescan_library, width=90, height=28
+        ).pack(side="left")
+        
+        # Table
+        table_container = StyleHelper.create_frame(section)
+        table_container.pack(fill="both", expand=True)
+        
+        self.library_tree = ttk.Treeview(
+            table_container,
+            columns=("name", "events", "duration", "played", "tags"),
+            show="headings",
+            height=10
+        )
+        self.library_tree.heading("name", text="Name")
+        self.library_tree.heading("events", text="Events")
+        self.library_tree.heading("duration", text="Duration")
+        self.library_tree.heading("played", text="Last Played")
+        self.library_tree.heading("tags", text="Tags")
+        self.library_tree.column("name", width=140, anchor="w")
+        self.library_tree.column("events", width=60, anchor="e")
+        self.library_tree.column("duration", width=60, anchor="e")
+        self.library_tree.column("played", width=110, anchor="center")
+        self.library_tree.column("tags", width=90, anchor="w")
+        self.library_tree.pack(fill="both", expand=True, padx=8, pady=8)
+        self.library_tree.bind("<Double-1>", lambda _event: self._on_load_library_macro())
+        
+        self.library_info_label = StyleHelper.create_label(
+            section,
+            text="Library not opened",
+            style='small',
+            anchor="w"
+        )
+        self.library_info_label.pack(fill="x", pady=(5, 0))
+    
+    def set_library_state(self, folder):
+        self.library_folder_var.set(folder)
+        self.refresh_library_table()
+    
+    def get_library_state(self):
+        return self.library_folder_var.get().strip() or "macros"
+    
+    def refresh_library_table(self):
+        """Re-query the catalog; reads only the database, never the macro files"""
+        library = getattr(self.controller, 'library', None)
+        if not self.library_tree or library is None:
+            return
+        try:
+            entries = library.query(search=self.library_search_var.get().strip(), sort=self.library_sort_var.get())
+        except Exception as e:
+            self.library_info_label.configure(text=f"❌ {e}")
+            return
+        selected = self.library_tree.selection()
+        for iid in self.library_tree.get_children():
+            self.library_tree.delete(iid)
+        for entry in entries:
+            played = entry['last_played'].replace('T', ' ')[:16] if entry['last_played'] else "—"
+            self.library_tree.insert("", "end", iid=entry['path'], values=(
+                entry['name'], f"{entry['event_count']:,}", f"{entry['duration']:.1f}s", played, ", ".join(entry['tags'])
+            ))
+        self.library_tree.selection_set([iid for iid in selected if self.library_tree.exists(iid)])
+        self.library_info_label.configure(text=f"{len(entries)} macros in {library.folder}")
+    
+    def _selected_library_path(self):
+        sel = self.library_tree.selection() if self.library_tree else ()
+        if not sel:
+            messagebox.showinfo("No selection", "Select a macro in the library.")
+            return None
+        return sel[0]
+    
+    def _on_open_library(self):
+        folder = self.get_library_state()
+        library_settings = self.controller.settings_manager.get_library_settings()
+        if self.controller.open_library(folder, library_settings.get("watch", True),
+                                        library_settings.get("poll_interval_s", 2.0)):
+            self.controller.settings_manager.set_library_folder(folder)
+            self.controller.settings_manager.save_settings()
+            self.refresh_library_table()
+        else:
+            messagebox.showerror("Library", f"Cannot open macro library in {folder}")
+    
+    def _on_load_library_macro(self):
+        path = self._selected_library_path()
+        if path and not self.controller.open_macro(path):
+            messagebox.showerror("Error", "Failed to load macro file")
+    
+    def _on_edit_library_tags(self):
+        path = self._selected_library_path()
+        library = self.controller.library
+        if not path or library is None:
+            return
+        entry = library.get(path)
+        current = ", ".join(entry['tags']) if entry else ""
+        dialog = ctk.CTkInputDialog(
+            title="Tags",
+            text=f"Comma-separated tags for {os.path.basename(path)}\n(current: {current or 'none'})"
+        )
+        value = dialog.get_input()
+        if value is None:
+            return
+        library.set_tags(path, value.split(","))
+        self.refresh_library_table()
+    
+    def _on_rescan_library(self):
+        library = self.controller.library
+        if library is None:
+            return
+        stats = library.scan()
+        self.refresh_library_table()
+        self.controller.update_status(
+            f"Library: {stats['added']} added, {stats['updated']} updated, {stats['removed']} removed"
+        )
+
 class MovementsPanel:
     """Movements display panel component"""
     
@@ -4,7 +4,12 @@ Editable Movements Display for  Macro Recorder
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import customtkinter as ctk
+import time
+from bisect import bisect_right
 from .gui_styles import ThemeManager, StyleHelper
+from .event_table import VirtualEventTable
+from event_editor import EventEditor, INSERT, REMOVE, MOVE, UPDATE
+from event_index import EventIndex, parse_query, positions_to_ranges
 import json
 
 class EditableMovementsDisplay:
@@ -15,8 +20,17 @@ class EditableMovementsDisplay:
         self.recorder = recorder
         self.frame = None
         self.tree = None
+        self.table = None
         self.context_menu = None
-        self.selected_item = None
+        # All edits go through the editor, which reports what changed so only those rows are redrawn
+        self.editor = EventEditor(recorder)
+        self.editor.add_listener(self._on_events_changed)
+        # Search indexes, kept up to date from the same change notifications
+        self.index = EventIndex(self.editor)
+        self.query_entry = None
+        self.query_label = None
+        self._last_query = None
+        self._matches = []
         
     def create(self):
         """Create the editable movements display"""
@@ -39,6 +53,9 @@ class EditableMovementsDisplay:
         # Toolbar
         self._create_toolbar()
         
+        # Search bar
+        self._create_query_bar()
+        
         # Treeview container
         tree_frame = StyleHelper.create_frame(
             self.frame, 
@@ -110,6 +127,42 @@ class EditableMovementsDisplay:
         )
         export_btn.pack(side="left")
     
+    def _create_query_bar(self):
+        """Create the search bar that selects matching events"""
+        bar = StyleHelper.create_frame(
+            self.frame,
+            fg_color="transparent"
+        )
+        bar.pack(fill="x", padx=20, pady=(0, 10))
+        
+        self.query_entry = StyleHelper.create_entry(
+            bar,
+            placeholder="🔍 type:click t:30-90 area:top-right key:a",
+            width=None,
+            height=28
+        )
+        self.query_entry.pack(side="left", fill="x", expand=True, padx=(0, 5))
+        self.query_entry.bind("<Return>", self.run_query)
+        self.query_entry.bind("<Escape>", self.clear_query)
+        
+        find_btn = StyleHelper.create_button(
+            bar,
+            text="Find",
+            style_type='apply',
+            command=self.run_query,
+            width=60,
+            height=25
+        )
+        find_btn.pack(side="left", padx=(0, 5))
+        
+        self.query_label = StyleHelper.create_label(
+            bar,
+            text="",
+            style='small',
+            color=ThemeManager.COLORS['secondary']
+        )
+        self.query_label.pack(side="left")
+    
     def _create_treeview(self, parent):
         """Create the treeview for displaying events"""
         # Create custom style for treeview
@@ -175,10 +228,11 @@ class EditableMovementsDisplay:
         
         scrollbar = ttk.Scrollbar(
             scrollbar_frame, 
-            orient="vertical", 
-            command=self.tree.yview
+            orient="vertical"
         )
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        
+        # Only the rows on screen exist in the tree; the table maps them to events
+        self.table = VirtualEventTable(self.tree, scrollbar, self._format_row, row_height=28)
         
         # Custom scrollbar styling
         style.configure("Vertical.TScrollbar",
@@ -198,11 +252,19 @@ class EditableMovementsDisplay:
         self.tree.bind("<Double-1>", self.edit_selected_event)  # Double click
         self.tree.bind("<Motion>", self._on_hover)  # Hover effect
         self.tree.bind("<Leave>", self._on_leave)  # Leave hover
+        
+        # Keyboard shortcuts (the tree takes focus when a row is clicked)
+        self.tree.bind("<Control-z>", self.undo)
+        self.tree.bind("<Control-y>", self.redo)
+        self.tree.bind("<Control-Z>", self.redo)  # Ctrl+Shift+Z
+        self.tree.bind("<Control-d>", lambda e: self.duplicate_selected_event())
+        self.tree.bind("<Delete>", lambda e: self.delete_selected_event())
+        self.tree.bind("<Control-Up>", lambda e: self.move_event_up() or "break")
+        self.tree.bind("<Control-Down>", lambda e: self.move_event_down() or "break")
     
     def _on_hover(self, event):
         """Add hover effect"""
-        item = self.tree.identify_row(event.y)
-        if item and not item.startswith("instruction_"):
+        if self.table.index_at(event.y) is not None:
             self.tree.configure(cursor="hand2")
     
     def _on_leave(self, event):
@@ -225,6 +287,17 @@ class EditableMovementsDisplay:
         )
         
         # Add commands with beautiful icons and styling
+        self.context_menu.add_command(
+            label="↩️  Undo", 
+            command=self.undo,
+            accelerator="Ctrl+Z"
+        )
+        self.context_menu.add_command(
+            label="↪️  Redo", 
+            command=self.redo,
+            accelerator="Ctrl+Y"
+        )
+        self.context_menu.add_separator()
         self.context_menu.add_command(
             label="✏️  Edit Event", 
             command=self.edit_selected_event,
@@ -246,11 +319,33 @@ class EditableMovementsDisplay:
         )
         self.context_menu.add_separator()
         self.context_menu.add_command(
-            label="🗑️  Delete Event", 
+            label="🗑️  Delete Selected", 
             command=self.delete_selected_event,
             accelerator="Delete"
         )
         self.context_menu.add_separator()
+        bulk_menu = tk.Menu(
+            self.context_menu,
+            tearoff=0,
+            bg="#16213e",
+            fg="#f0f8ff",
+            activebackground=ThemeManager.COLORS['secondary'],
+            activeforeground="#ffffff",
+            font=('Segoe UI', 10),
+            borderwidth=0,
+            relief="flat"
+        )
+        bulk_menu.add_command(label="⏩  Shift Time...", command=self.shift_selected_time)
+        bulk_menu.add_command(label="📏  Scale Time...", command=self.scale_selected_time)
+        bulk_menu.add_separator()
+        bulk_menu.add_command(label="↔️  Offset Coordinates...", command=self.offset_selected_coords)
+        bulk_menu.add_command(label="🔍  Scale Coordinates...", command=self.scale_selected_coords)
+        bulk_menu.add_separator()
+        bulk_menu.add_command(label="⌨️  Change Key...", command=self.change_selected_key)
+        bulk_menu.add_separator()
+        bulk_menu.add_command(label="☑️  Select All", command=self.table.select_all, accelerator="Ctrl+A")
+        self.context_menu.add_cascade(label="⚡  Bulk Edit Selection", menu=bulk_menu)
+        self.context_menu.add_separator()
         self.context_menu.add_command(
             label="⬆️  Move Up", 
             command=self.move_event_up,
@@ -264,10 +359,10 @@ class EditableMovementsDisplay:
     
     def show_context_menu(self, event):
         """Show context menu on right click"""
-        item = self.tree.identify_row(event.y)
-        if item:
-            self.tree.selection_set(item)
-            self.selected_item = item
+        index = self.table.index_at(event.y)
+        if index is not None and not self.table.is_selected(index):
+            self.table.select(index)
+        if index is not None or not self.table.row_count:
             self.context_menu.post(event.x_root, event.y_root)
     
     def _show_initial_instructions(self):
@@ -279,31 +374,59 @@ class EditableMovementsDisplay:
             ("info", "Drag events to reorder (coming soon)", "📝 Instructions", "0.0")
         ]
         
-        for i, (event_type, details, category, timestamp) in enumerate(instructions):
-            self.tree.insert("", "end", iid=f"instruction_{i}", 
-                           text=str(i+1), values=(category, details, timestamp))
+        self.table.set_placeholder(
+            (str(i+1), (category, details, timestamp))
+            for i, (event_type, details, category, timestamp) in enumerate(instructions)
+        )
     
     def refresh_display(self):
-        """Refresh the display with current recorder events"""
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        if not hasattr(self.recorder, 'events') or not self.recorder.events:
-            self._show_initial_instructions()
+        """Refresh the display with current recorder events.
+
+        Only the rows on screen are formatted, so this costs the same for
+        ten events as for a million.
+        """
+        if not self.editor.sync():
+            self.table.set_row_count(len(self.editor.store))
+    
+    def _on_events_changed(self, changes):
+        """Patch just the rows an edit touched"""
+        if self.table is None:
+            return
+        # Match positions are stale after any edit; Enter runs the search again
+        self._last_query = None
+        if len(changes) > 1:
+            # Bulk edit or undo of a group: one redraw instead of a patch per change. Unless
+            # every change was in place, other rows have shifted under the old selection
+            if any(change.kind != UPDATE for change in changes):
+                self.table.select(None)
+            self.table.set_row_count(len(self.editor))
             return
+        change = changes[0]
+        if change.kind == INSERT:
+            self.table.insert_rows(change.index, change.count)
+        elif change.kind == REMOVE:
+            self.table.remove_rows(change.index, change.count)
+        elif change.kind == MOVE:
+            self.table.move_rows(change.index, change.count, change.target)
+        elif change.kind == UPDATE:
+            self.table.update_rows(change.index, change.count)
+        else:
+            self.table.set_row_count(len(self.editor.store))
+    
+    def _format_row(self, index):
+        """Tree text and values of one event, built when the row scrolls into view.
+
+        The ID column shows the event's stable id, so rows below an edit keep their label.
+        """
+        event = self.editor.store[index]
+        event_type = event['type']
+        details = self._format_event_details(event)
+        timestamp = f"{event['timestamp']:.2f}"
         
-        # Add events from recorder
-        for i, event in enumerate(self.recorder.events):
-            event_type = event['type']
-            details = self._format_event_details(event)
-            timestamp = f"{event['timestamp']:.2f}"
-            
-            # Color coding by event type
-            icon = self._get_event_icon(event_type)
-            
-            self.tree.insert("", "end", iid=str(i), 
-                           text=str(i+1), values=(f"{icon} {event_type}", details, timestamp))
+        # Color coding by event type
+        icon = self._get_event_icon(event_type)
+        
+        return str(self.editor.ids[index]+1), (f"{icon} {event_type}", details, timestamp)
     
     def _format_event_details(self, event):
         """Format event details for display"""
@@ -348,24 +471,21 @@ class EditableMovementsDisplay:
     
     def edit_selected_event(self, event=None):
         """Edit the selected event"""
-        selection = self.tree.selection()
-        if not selection:
-            messagebox.showinfo("No Selection", "Please select an event to edit.")
+        # Instructions are showing: editing means adding the first event
+        self.editor.sync()
+        if not self.editor.store:
+            self.add_new_event()
             return
         
-        item_id = selection[0]
-        
-        # Skip instruction items
-        if item_id.startswith("instruction_"):
-            self.add_new_event()
+        event_index = self.table.selected
+        if event_index is None:
+            messagebox.showinfo("No Selection", "Please select an event to edit.")
             return
         
         try:
-            event_index = int(item_id)
-            if event_index < len(self.recorder.events):
-                event_data = self.recorder.events[event_index]
-                self._show_event_editor(event_data, event_index)
-        except (ValueError, IndexError):
+            event_data = self.editor.store[event_index]
+            self._show_event_editor(event_data, event_index)
+        except IndexError:
             messagebox.showerror("Error", "Invalid event selected.")
     
     def _show_event_editor(self, event_data, event_index):
@@ -374,12 +494,10 @@ class EditableMovementsDisplay:
         if editor.result:
             if event_index >= 0:
                 # Update existing event
-                self.recorder.events[event_index] = editor.result
+                self.editor.update(event_index, [editor.result])
             else:
                 # Add new event
-                self.recorder.events.append(editor.result)
-            
-            self.refresh_display()
+                self.editor.insert(len(self.editor), [editor.result])
     
     def add_new_event(self, insert_above=False, insert_below=False):
         """Add a new event"""
@@ -393,92 +511,227 @@ class EditableMovementsDisplay:
         
         editor = EventEditorDialog(self.frame, default_event, is_new=True)
         if editor.result:
-            insert_index = len(self.recorder.events)
+            self.editor.sync()
+            insert_index = len(self.editor)
+            selected = self.table.selected
             
-            if insert_above and self.selected_item:
-                try:
-                    insert_index = int(self.selected_item)
-                except ValueError:
-                    pass
-            elif insert_below and self.selected_item:
-                try:
-                    insert_index = int(self.selected_item) + 1
-                except ValueError:
-                    pass
+            if insert_above and selected is not None:
+                insert_index = selected
+            elif insert_below and selected is not None:
+                insert_index = selected + 1
             
-            self.recorder.events.insert(insert_index, editor.result)
-            self.refresh_display()
+            self.editor.insert(insert_index, [editor.result])
+            self.table.select(insert_index)
+            self.table.see(insert_index)
     
     def duplicate_selected_event(self):
         """Duplicate the selected event"""
-        selection = self.tree.selection()
-        if not selection:
+        event_index = self.table.selected
+        if event_index is None:
             return
         
         try:
-            event_index = int(selection[0])
-            if event_index < len(self.recorder.events):
-                event_copy = self.recorder.events[event_index].copy()
-                self.recorder.events.insert(event_index + 1, event_copy)
-                self.refresh_display()
-        except (ValueError, IndexError):
+            self.editor.duplicate(event_index)
+        except IndexError:
             pass
     
     def delete_selected_event(self):
-        """Delete the selected event"""
-        selection = self.tree.selection()
-        if not selection:
+        """Delete the selected events (every selected range in one pass)"""
+        ranges = self.table.selected_ranges()
+        if not ranges:
             return
         
+        self.editor.remove_ranges(ranges)
+        if len(self.editor):
+            # The event that took the place of the first deleted one
+            self.table.select(min(ranges[0][0], len(self.editor) - 1))
+    
+    # ---------------- Search ---------------- #
+    def run_query(self, event=None):
+        """Select the events matching the search bar; Enter again steps through them one at a time"""
+        text = self.query_entry.get().strip()
+        if not text:
+            self.clear_query()
+            return "break"
+        if text == self._last_query and self._matches:
+            self._next_match()
+            return "break"
         try:
-            event_index = int(selection[0])
-            if event_index < len(self.recorder.events):
-                del self.recorder.events[event_index]
-                self.refresh_display()
-        except (ValueError, IndexError):
-            pass
+            criteria = parse_query(text, (self.frame.winfo_screenwidth(), self.frame.winfo_screenheight()))
+        except ValueError as e:
+            self.query_label.configure(text=f"❌ {e}", text_color=ThemeManager.COLORS['danger'])
+            return "break"
+        
+        started = time.perf_counter()
+        positions = self.index.query(**criteria)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._last_query = text
+        self._matches = positions
+        self.table.select_ranges(positions_to_ranges(positions))
+        if self._matches:
+            self.table.see(self._matches[0])
+        self.query_label.configure(
+            text=f"{len(self._matches)} matches · {elapsed_ms:.1f} ms",
+            text_color=ThemeManager.COLORS['secondary']
+        )
+        return "break"
+    
+    def _next_match(self):
+        """Select the match after the cursor, wrapping around"""
+        cursor = self.table.selected if self.table.selected is not None else -1
+        after = bisect_right(self._matches, cursor)
+        index = self._matches[after % len(self._matches)]
+        self.table.select(index)
+        self.table.see(index)
+    
+    def clear_query(self, event=None):
+        """Forget the last search"""
+        self._last_query = None
+        self._matches = []
+        if self.query_label is not None:
+            self.query_label.configure(text="")
+        return "break"
+    
+    # ---------------- Bulk edits on the selection ---------------- #
+    def _selection_for_bulk(self):
+        """Selected ranges, or None (with a hint) when nothing is selected"""
+        ranges = self.table.selected_ranges()
+        if not ranges:
+            messagebox.showinfo("No Selection", "Select events first (Shift+click for a range, Ctrl+click to add).")
+            return None
+        return ranges
+    
+    def _ask_pair(self, title, prompt):
+        """Ask for two numbers written as 'a, b'; None if cancelled or invalid"""
+        answer = simpledialog.askstring(title, prompt, parent=self.frame)
+        if not answer:
+            return None
+        try:
+            first, second = (float(part) for part in answer.replace(";", ",").split(","))
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Please enter two numbers separated by a comma.")
+            return None
+        return first, second
+    
+    def shift_selected_time(self):
+        """Move the selected events earlier or later in time"""
+        ranges = self._selection_for_bulk()
+        if not ranges:
+            return
+        delta = simpledialog.askfloat(
+            "Shift Time",
+            f"Seconds to add to {self.table.selection_size()} selected events (negative = earlier):",
+            parent=self.frame
+        )
+        if delta is None:
+            return
+        ripple = messagebox.askyesno("Shift Time", "Also shift every event after the selection?")
+        self.editor.shift_time(ranges, delta, ripple=ripple)
+    
+    def scale_selected_time(self):
+        """Stretch or compress the timing from the first to the last selected event"""
+        ranges = self._selection_for_bulk()
+        if not ranges:
+            return
+        factor = simpledialog.askfloat(
+            "Scale Time",
+            "Time factor (2 = twice as slow, 0.5 = twice as fast):",
+            parent=self.frame,
+            minvalue=0.0
+        )
+        if factor is None:
+            return
+        ripple = messagebox.askyesno("Scale Time", "Move the events after the selection along?")
+        self.editor.scale_time(ranges[0][0], ranges[-1][1], factor, ripple=ripple)
+    
+    def offset_selected_coords(self):
+        """Move the mouse positions of the selected events"""
+        ranges = self._selection_for_bulk()
+        if not ranges:
+            return
+        offset = self._ask_pair("Offset Coordinates", "Pixels to move by, as 'dx, dy':")
+        if offset:
+            self.editor.offset_coords(ranges, *offset)
+    
+    def scale_selected_coords(self):
+        """Scale the mouse positions of the selected events around their top-left corner"""
+        ranges = self._selection_for_bulk()
+        if not ranges:
+            return
+        factors = self._ask_pair("Scale Coordinates", "Scale factors, as 'sx, sy':")
+        if factors:
+            self.editor.scale_coords(ranges, *factors)
+    
+    def change_selected_key(self):
+        """Replace the key of the selected key press/release events"""
+        ranges = self._selection_for_bulk()
+        if not ranges:
+            return
+        new_key = simpledialog.askstring("Change Key", "New key (e.g. a, space, enter):", parent=self.frame)
+        if not new_key:
+            return
+        old_key = simpledialog.askstring(
+            "Change Key",
+            "Only replace this key (leave empty to replace every key):",
+            parent=self.frame
+        )
+        self.editor.change_key(ranges, new_key.strip(), old_key.strip() if old_key else None)
     
     def move_event_up(self):
         """Move selected event up"""
-        selection = self.tree.selection()
-        if not selection:
+        event_index = self.table.selected
+        if event_index is None:
             return
         
         try:
-            event_index = int(selection[0])
-            if event_index > 0 and event_index < len(self.recorder.events):
-                # Swap with previous event
-                self.recorder.events[event_index], self.recorder.events[event_index-1] = \
-                    self.recorder.events[event_index-1], self.recorder.events[event_index]
-                self.refresh_display()
-                # Keep selection on moved item
-                self.tree.selection_set(str(event_index-1))
-        except (ValueError, IndexError):
+            if event_index > 0:
+                # The table keeps the selection on the moved event
+                self.editor.move(event_index, 1, event_index-1)
+                self.table.see(event_index-1)
+        except IndexError:
             pass
     
     def move_event_down(self):
         """Move selected event down"""
-        selection = self.tree.selection()
-        if not selection:
+        event_index = self.table.selected
+        if event_index is None:
             return
         
         try:
-            event_index = int(selection[0])
-            if event_index < len(self.recorder.events) - 1:
-                # Swap with next event
-                self.recorder.events[event_index], self.recorder.events[event_index+1] = \
-                    self.recorder.events[event_index+1], self.recorder.events[event_index]
-                self.refresh_display()
-                # Keep selection on moved item
-                self.tree.selection_set(str(event_index+1))
-        except (ValueError, IndexError):
+            if event_index < len(self.editor) - 1:
+                # The table keeps the selection on the moved event
+                self.editor.move(event_index, 1, event_index+1)
+                self.table.see(event_index+1)
+        except IndexError:
             pass
     
+    def undo(self, event=None):
+        """Undo the last edit"""
+        self._show_change(self.editor.undo())
+        return "break"
+    
+    def redo(self, event=None):
+        """Redo the last undone edit"""
+        self._show_change(self.editor.redo())
+        return "break"
+    
+    def _show_change(self, changes):
+        """Select and scroll to where an undo/redo changed the events"""
+        if not changes or not self.table.row_count:
+            return
+        change = changes[-1]
+        index = min(change.target if change.target is not None else change.index, self.table.row_count - 1)
+        self.table.select(index)
+        self.table.see(index)
+    
+    def set_undo_budget(self, max_mb):
+        """Memory budget of the undo/redo history in MB"""
+        self.editor.set_history_budget(int(float(max_mb) * 1024 * 1024))
+    
     def clear_all_events(self):
         """Clear all events"""
         if messagebox.askyesno("Clear All", "Are you sure you want to clear all events?"):
-            self.recorder.events = []
-            self.refresh_display()
+            self.editor.clear()
     
     def import_from_recording(self):
         """Import events from the current recording"""
@@ -514,9 +767,7 @@ class EditableMovementsDisplay:
     
     def clear_display(self):
         """Clear the display"""
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self.table.set_row_count(0)
         self._show_initial_instructions()
     
     def show_no_macro_message(self):
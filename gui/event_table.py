@@ -0,0 +1,385 @@
+"""
+Virtual Event Table for  Macro Recorder
+Shows a window of a large event list in a fixed pool of Treeview rows
+"""
+from bisect import bisect_right
+
+from event_editor import merge_ranges
+
+# Pooled rows kept beyond the visible ones (covers a partly visible last row and small resizes)
+OVERSCAN = 4
+
+# Rows moved per mouse wheel notch
+WHEEL_ROWS = 3
+
+
+class VirtualEventTable:
+    """Drives a ttk.Treeview that never holds more rows than fit on screen.
+
+    The tree gets a small pool of row items; scrolling changes which event
+    index the first row shows (``top``) and re-fills the pool through
+    ``format_row(index) -> (text, values)``, so the cost of a scroll or a
+    refresh depends on the window height, not on the number of events.
+    The scrollbar is driven by ``top`` instead of the tree's own view, and
+    the selection is kept here as event index ranges, not tree items:
+    ``ranges`` holds the selected (start, stop) ranges and ``selected`` the
+    row last clicked or moved to (the cursor that single-row actions use).
+    Shift extends from the anchor, Ctrl toggles rows.
+    """
+
+    def __init__(self, tree, scrollbar, format_row, row_height=28, overscan=OVERSCAN):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.format_row = format_row
+        self.row_height = row_height
+        self.overscan = overscan
+        self.row_count = 0
+        self.top = 0
+        self.visible = 1
+        self.selected = None
+        self.anchor = None
+        self.ranges = []
+        # Rows shown while there are no events (index_at returns None for them)
+        self.placeholder = []
+        self._slots = []
+        self._attached = 0
+
+        scrollbar.configure(command=self.yview)
+        tree.bind("<Configure>", self._on_resize, add="+")
+        tree.bind("<Button-1>", self._on_click)
+        tree.bind("<Shift-Button-1>", lambda event: self._on_click(event, extend=True))
+        tree.bind("<Control-Button-1>", lambda event: self._on_click(event, toggle=True))
+        tree.bind("<MouseWheel>", self._on_wheel)
+        tree.bind("<Button-4>", lambda _event: self._scroll_units(-WHEEL_ROWS))
+        tree.bind("<Button-5>", lambda _event: self._scroll_units(WHEEL_ROWS))
+        for key, step in (("<Up>", -1), ("<Down>", 1)):
+            tree.bind(key, lambda _event, step=step: self._move_selection(step))
+        for key, pages in (("<Prior>", -1), ("<Next>", 1)):
+            tree.bind(key, lambda _event, pages=pages: self._move_selection(pages * self.visible))
+        for key, step in (("<Shift-Up>", -1), ("<Shift-Down>", 1)):
+            tree.bind(key, lambda _event, step=step: self._move_selection(step, extend=True))
+        tree.bind("<Home>", lambda _event: self._select_and_see(0))
+        tree.bind("<End>", lambda _event: self._select_and_see(self.row_count - 1))
+        tree.bind("<Control-a>", lambda _event: self.select_all() or "break")
+
+    # ---------------- Model ---------------- #
+    def set_row_count(self, row_count):
+        """Point the table at a list of row_count events and redraw"""
+        self.row_count = row_count
+        if self.selected is not None and self.selected >= row_count:
+            self.selected = row_count - 1 if row_count else None
+        if self.anchor is not None and self.anchor >= row_count:
+            self.anchor = self.selected
+        self.ranges = merge_ranges(self.ranges, row_count)
+        self._keep_cursor_selected()
+        self._set_top(self.top)
+        self.render()
+
+    def set_placeholder(self, rows):
+        """(text, values) rows to show while the table is empty"""
+        self.placeholder = list(rows)
+        if not self.row_count:
+            self.render()
+
+    def index_at(self, y):
+        """Event index of the row at widget y, or None"""
+        iid = self.tree.identify_row(y)
+        if not iid or not self.row_count:
+            return None
+        index = self.top + self._slots.index(iid)
+        return index if index < self.row_count else None
+
+    # ---------------- Patching ---------------- #
+    def insert_rows(self, index, count):
+        """count events were inserted at index: splice fresh rows in, no full refresh"""
+        self.row_count += count
+        if self.selected is not None and self.selected >= index:
+            self.selected += count
+        if self.anchor is not None and self.anchor >= index:
+            self.anchor += count
+        # New rows are not selected; a selected range they land in is split
+        ranges = []
+        for start, stop in self.ranges:
+            if start >= index:
+                ranges.append((start + count, stop + count))
+            elif stop > index:
+                ranges += [(start, index), (index + count, stop + count)]
+            else:
+                ranges.append((start, stop))
+        self.ranges = ranges
+        if self.row_count == count:
+            # Placeholder rows are showing
+            self.render()
+            return
+        if index < self.top:
+            # Keep the same events on screen
+            self.top += count
+        else:
+            self._splice(index - self.top, 0, count)
+        self._update_scrollbar()
+        self._show_selection()
+
+    def remove_rows(self, index, count):
+        """count events starting at index were removed"""
+        old_top = self.top
+        self.row_count -= count
+        if self.selected is not None:
+            if self.selected >= index + count:
+                self.selected -= count
+            elif self.selected >= index:
+                # The event that moved into the removed place, or the new last one
+                self.selected = min(index, self.row_count - 1) if self.row_count else None
+        self.anchor = self.selected
+        self.ranges = merge_ranges(
+            (start if start < index else max(index, start - count),
+             stop if stop <= index else max(index, stop - count))
+            for start, stop in self.ranges
+        )
+        self._keep_cursor_selected()
+        if index + count <= old_top:
+            self.top -= count
+        elif index < old_top:
+            self.top = index
+        if not self.row_count or self.top > max(0, self.row_count - self.visible):
+            # Removed near the end: the window itself has to move
+            self._set_top(self.top)
+            self.render()
+            return
+        first = max(index, old_top) - old_top
+        self._splice(first, max(0, min(index + count, old_top + self._attached) - old_top - first), 0)
+        self._update_scrollbar()
+        self._show_selection()
+
+    def move_rows(self, index, count, target):
+        """count events moved from index to target; only rows between the two ends change"""
+        if self.selected is not None:
+            if index <= self.selected < index + count:
+                self.selected += target - index
+            else:
+                after_remove = self.selected - count if self.selected >= index + count else self.selected
+                self.selected = after_remove + count if after_remove >= target else after_remove
+        if self.ranges and self.ranges[0][0] >= index and self.ranges[-1][1] <= index + count:
+            # The selection travels with the moved rows
+            self.ranges = [(start + target - index, stop + target - index) for start, stop in self.ranges]
+        else:
+            self.ranges = []
+            self._keep_cursor_selected()
+        self.anchor = self.selected
+        self.render(min(index, target), max(index, target) + count)
+
+    def update_rows(self, index, count):
+        """count events starting at index changed in place"""
+        self.render(index, index + count)
+
+    def _splice(self, first, removed, inserted):
+        """Patch the pooled rows: from slot position first, removed rows left and inserted rows came in.
+
+        Rows below the splice keep their tree items (Tk shifts them), rows
+        pushed past the pool are detached and reused for the new rows, so the
+        tree work is proportional to the rows that changed, not the window.
+        """
+        pool = self.visible + self.overscan
+        self._ensure_slots(pool)
+        shown = min(pool, self.row_count - self.top)
+        attached = self._slots[:self._attached]
+        first = min(first, len(attached))
+        head = attached[:first]
+        kept = attached[first + removed:]
+        free = attached[first:first + removed] + self._slots[self._attached:]
+        new_count = max(0, min(inserted, shown - first))
+        kept_count = max(0, min(len(kept), shown - first - new_count))
+        free = kept[kept_count:] + free
+        kept = kept[:kept_count]
+        # Rows that scrolled into the bottom of the window after a removal
+        tail_count = max(0, shown - first - new_count - kept_count)
+        new = free[:new_count]
+        tail = free[new_count:new_count + tail_count]
+        free = free[new_count + tail_count:]
+
+        staying = set(head) | set(kept)
+        for slot in attached:
+            if slot not in staying:
+                self.tree.detach(slot)
+        for position, slot in enumerate(new, first):
+            self._fill(slot, position)
+            self.tree.move(slot, "", position)
+        for position, slot in enumerate(tail, first + new_count + kept_count):
+            self._fill(slot, position)
+            self.tree.move(slot, "", position)
+        self._slots = head + new + kept + tail + free
+        self._attached = shown
+        self.tree.yview_moveto(0)
+
+    def _fill(self, slot, position):
+        text, values = self.format_row(self.top + position)
+        self.tree.item(slot, text=text, values=values)
+
+    # ---------------- Selection ---------------- #
+    def select(self, index, extend=False, toggle=False):
+        """Select one row; extend selects from the anchor to it (Shift), toggle adds or removes it (Ctrl)"""
+        if index is None or not 0 <= index < self.row_count:
+            self.selected = self.anchor = None
+            self.ranges = []
+        elif extend and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.ranges = [(low, high + 1)]
+            self.selected = index
+        elif toggle:
+            if self.is_selected(index):
+                self.ranges = [part for start, stop in self.ranges
+                               for part in ((start, min(stop, index)), (max(start, index + 1), stop))
+                               if part[0] < part[1]]
+            else:
+                self.ranges = merge_ranges(self.ranges + [(index, index + 1)])
+            self.selected = self.anchor = index
+        else:
+            self.ranges = [(index, index + 1)]
+            self.selected = self.anchor = index
+        self._show_selection()
+
+    def select_ranges(self, ranges):
+        """Select the given (start, stop) ranges; the cursor goes to the first selected row"""
+        self.ranges = merge_ranges(ranges, self.row_count)
+        self.selected = self.anchor = self.ranges[0][0] if self.ranges else None
+        self._show_selection()
+
+    def select_all(self):
+        self.select_ranges([(0, self.row_count)])
+
+    def selected_ranges(self):
+        """Selected rows as sorted, non-overlapping (start, stop) ranges"""
+        return list(self.ranges)
+
+    def selection_size(self):
+        return sum(stop - start for start, stop in self.ranges)
+
+    def is_selected(self, index):
+        position = bisect_right(self.ranges, (index, float('inf'))) - 1
+        return position >= 0 and self.ranges[position][0] <= index < self.ranges[position][1]
+
+    def _keep_cursor_selected(self):
+        if not self.ranges and self.selected is not None:
+            self.ranges = [(self.selected, self.selected + 1)]
+
+    def see(self, index):
+        """Scroll just enough for index to be on screen"""
+        if index < self.top:
+            self._set_top(index)
+        elif index >= self.top + self.visible:
+            self._set_top(index - self.visible + 1)
+        else:
+            return
+        self.render()
+
+    def _select_and_see(self, index, extend=False):
+        if self.row_count:
+            self.select(max(0, min(index, self.row_count - 1)), extend=extend)
+            self.see(self.selected)
+        return "break"
+
+    def _move_selection(self, step, extend=False):
+        start = self.selected if self.selected is not None else self.top - (1 if step > 0 else 0)
+        return self._select_and_see(start + step, extend)
+
+    def _on_click(self, event, extend=False, toggle=False):
+        self.tree.focus_set()
+        index = self.index_at(event.y)
+        if index is not None:
+            self.select(index, extend=extend, toggle=toggle)
+        # Clicks on headings still reach the tree
+        return None if self.tree.identify_region(event.x, event.y) == "heading" else "break"
+
+    def _show_selection(self):
+        chosen = []
+        if self.row_count:
+            # Only the ranges that overlap the window
+            position = max(0, bisect_right(self.ranges, (self.top, float('inf'))) - 1)
+            while position < len(self.ranges) and self.ranges[position][0] < self.top + self._attached:
+                start, stop = self.ranges[position]
+                chosen += self._slots[max(start - self.top, 0):max(0, min(stop - self.top, self._attached))]
+                position += 1
+        self.tree.selection_set(chosen)
+
+    # ---------------- Scrolling ---------------- #
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')"""
+        if not args:
+            return
+        if args[0] == "moveto":
+            top = int(float(args[1]) * self.row_count)
+        elif args[0] == "scroll":
+            top = self.top + int(args[1]) * (self.visible if args[2] == "pages" else 1)
+        else:
+            return
+        if self._set_top(top):
+            self.render()
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small deltas
+        notches = event.delta // 120 if abs(event.delta) >= 120 else (1 if event.delta > 0 else -1)
+        return self._scroll_units(-notches * WHEEL_ROWS)
+
+    def _scroll_units(self, rows):
+        if self._set_top(self.top + rows):
+            self.render()
+        return "break"
+
+    def _set_top(self, top):
+        """Clamp and set the first shown index; True if it changed"""
+        top = max(0, min(top, self.row_count - self.visible))
+        changed = top != self.top
+        self.top = top
+        self._update_scrollbar()
+        return changed
+
+    def _update_scrollbar(self):
+        if self.row_count <= self.visible:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.top / self.row_count, (self.top + self.visible) / self.row_count)
+
+    def _on_resize(self, event):
+        # The heading takes about one row of the widget height
+        visible = max(1, event.height // self.row_height - 1)
+        if visible != self.visible or len(self._slots) < visible + self.overscan:
+            self.visible = visible
+            self._set_top(self.top)
+            self.render()
+
+    # ---------------- Drawing ---------------- #
+    def _ensure_slots(self, count):
+        # New rows start detached; _attach puts them on screen in order
+        while len(self._slots) < count:
+            iid = self.tree.insert("", "end", iid=f"slot_{len(self._slots)}", text="")
+            self.tree.detach(iid)
+            self._slots.append(iid)
+
+    def _attach(self, count):
+        """Keep exactly the first count pooled rows in the tree"""
+        for slot in range(count, self._attached):
+            self.tree.detach(self._slots[slot])
+        for slot in range(self._attached, count):
+            self.tree.move(self._slots[slot], "", slot)
+        self._attached = count
+
+    def render(self, start=None, stop=None):
+        """Refill the pooled rows; with start/stop only those showing event indices in [start, stop)"""
+        pool = self.visible + self.overscan
+        self._ensure_slots(pool)
+        if self.row_count:
+            shown = min(pool, self.row_count - self.top)
+            first = 0 if start is None else max(0, start - self.top)
+            last = shown if stop is None else min(shown, stop - self.top)
+            if self._attached != shown:
+                self._attach(shown)
+                first, last = 0, shown
+            for slot in range(first, last):
+                self._fill(self._slots[slot], slot)
+        else:
+            self._attach(min(pool, len(self.placeholder)))
+            for slot in range(self._attached):
+                text, values = self.placeholder[slot]
+                self.tree.item(self._slots[slot], text=text, values=values)
+        # Rows past the visible ones must never scroll the tree's own view
+        self.tree.yview_moveto(0)
+        self._show_selection()
@@ -0,0 +1,381 @@
+"""
+Input Backends for  Macro Recorder
+Where playback injects input and where recording reads it from
+"""
+import random
+import shutil
+import subprocess
+import threading
+import time
+
+from clock import DEFAULT_CLOCK
+
+# Names of the non-character keys a macro can contain
+SPECIAL_KEY_NAMES = (
+    'alt', 'alt_l', 'alt_r', 'backspace', 'caps_lock', 'cmd', 'cmd_l', 'cmd_r',
+    'ctrl', 'ctrl_l', 'ctrl_r', 'delete', 'down', 'end', 'enter', 'esc',
+    'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8', 'f9', 'f10', 'f11', 'f12',
+    'home', 'left', 'page_down', 'page_up', 'right', 'shift', 'shift_l', 'shift_r',
+    'space', 'tab', 'up'
+)
+
+
+class InputBackend:
+    """Base class for input backends.
+
+    A backend hands out pynput-shaped objects:
+      - mouse controller: ``position`` (settable), ``press(button)``,
+        ``release(button)``, ``scroll(dx, dy)``
+      - keyboard controller: ``press(key)``, ``release(key)``
+      - listeners: built with pynput's callbacks (on_move/on_click/on_scroll,
+        on_press/on_release), with ``start()`` and ``stop()``
+    plus conversions between its key/button objects and the names stored in macros.
+
+    ``can_inject``/``can_record`` say which halves a backend implements, so
+    callers can check before starting instead of hitting NotImplementedError.
+    ``max_move_rate`` is the most mouse moves per second it can keep up with
+    (0: no limit); playback coalesces moves down to it.
+    """
+
+    name = 'base'
+    can_inject = False
+    can_record = False
+    max_move_rate = 0
+
+    def __init__(self, clock=None):
+        self.clock = clock or DEFAULT_CLOCK
+
+    def mouse_controller(self):
+        raise NotImplementedError(f"{self.name} backend cannot inject mouse input")
+
+    def keyboard_controller(self):
+        raise NotImplementedError(f"{self.name} backend cannot inject keyboard input")
+
+    def mouse_listener(self, on_move=None, on_click=None, on_scroll=None):
+        raise NotImplementedError(f"{self.name} backend cannot record mouse input")
+
+    def keyboard_listener(self, on_press=None, on_release=None):
+        raise NotImplementedError(f"{self.name} backend cannot record keyboard input")
+
+    def resolve_key(self, name):
+        """Recorded key name -> key object accepted by the keyboard controller"""
+        return name
+
+    def resolve_button(self, name):
+        """Recorded button name -> button object accepted by the mouse controller"""
+        return name
+
+    def key_name(self, key):
+        """Key object from a listener -> name stored in the macro"""
+        return str(key)
+
+    def button_name(self, button):
+        """Button object from a listener -> name stored in the macro"""
+        return str(button)
+
+
+class PynputBackend(InputBackend):
+    """Real input through pynput; pynput is only imported when this backend is created"""
+
+    name = 'pynput'
+    can_inject = True
+    can_record = True
+
+    def __init__(self, clock=None):
+        super().__init__(clock)
+        from pynput import mouse, keyboard
+        self._mouse = mouse
+        self._keyboard = keyboard
+        self._special_keys = {name: getattr(keyboard.Key, name) for name in SPECIAL_KEY_NAMES}
+
+    def mouse_controller(self):
+        return self._mouse.Controller()
+
+    def keyboard_controller(self):
+        return self._keyboard.Controller()
+
+    def mouse_listener(self, on_move=None, on_click=None, on_scroll=None):
+        return self._mouse.Listener(on_move=on_move, on_click=on_click, on_scroll=on_scroll)
+
+    def keyboard_listener(self, on_press=None, on_release=None):
+        return self._keyboard.Listener(on_press=on_press, on_release=on_release)
+
+    def resolve_key(self, name):
+        # Special keys are looked up by name, anything else is a regular character
+        return self._special_keys.get(name, name)
+
+    def resolve_button(self, name):
+        return getattr(self._mouse.Button, name)
+
+    def key_name(self, key):
+        try:
+            return key.char
+        except AttributeError:
+            return str(key).replace('Key.', '')
+
+    def button_name(self, button):
+        return button.name
+
+
+# X keysyms for the special key names (xdotool backend)
+XDOTOOL_KEYSYMS = {
+    'alt': 'Alt_L', 'alt_l': 'Alt_L', 'alt_r': 'Alt_R', 'backspace': 'BackSpace',
+    'caps_lock': 'Caps_Lock', 'cmd': 'Super_L', 'cmd_l': 'Super_L', 'cmd_r': 'Super_R',
+    'ctrl': 'Control_L', 'ctrl_l': 'Control_L', 'ctrl_r': 'Control_R', 'delete': 'Delete',
+    'down': 'Down', 'end': 'End', 'enter': 'Return', 'esc': 'Escape', 'home': 'Home',
+    'left': 'Left', 'page_down': 'Next', 'page_up': 'Prior', 'right': 'Right',
+    'shift': 'Shift_L', 'shift_l': 'Shift_L', 'shift_r': 'Shift_R', 'space': 'space',
+    'tab': 'Tab', 'up': 'Up',
+    ' ': 'space', ',': 'comma', '.': 'period', '/': 'slash', ';': 'semicolon',
+    "'": 'apostrophe', '[': 'bracketleft', ']': 'bracketright', '-': 'minus',
+    '=': 'equal', '\\': 'backslash', '`': 'grave',
+}
+XDOTOOL_KEYSYMS.update({f'f{i}': f'F{i}' for i in range(1, 13)})
+XDOTOOL_BUTTONS = {'left': '1', 'middle': '2', 'right': '3'}
+
+
+class _XdotoolMouse:
+    def __init__(self, run):
+        self._run = run
+        self._position = (0, 0)
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = value
+        self._run('mousemove', str(int(value[0])), str(int(value[1])))
+
+    def press(self, button):
+        self._run('mousedown', button)
+
+    def release(self, button):
+        self._run('mouseup', button)
+
+    def scroll(self, dx, dy):
+        # X11 scrolls are button clicks: 4/5 vertical, 6/7 horizontal
+        if dy:
+            self._run('click', '--repeat', str(abs(int(dy))), '4' if dy > 0 else '5')
+        if dx:
+            self._run('click', '--repeat', str(abs(int(dx))), '7' if dx > 0 else '6')
+
+
+class _XdotoolKeyboard:
+    def __init__(self, run):
+        self._run = run
+
+    def press(self, key):
+        self._run('keydown', key)
+
+    def release(self, key):
+        self._run('keyup', key)
+
+
+class XdotoolBackend(InputBackend):
+    """Playback on Linux/X11 through the xdotool command line tool (no recording).
+
+    Every action is one xdotool call (a few ms each), so dense mouse paths are
+    coalesced to max_move_rate moves per second; it is meant for boxes where
+    pynput's X backend is unavailable.
+    """
+
+    name = 'xdotool'
+    can_inject = True
+    max_move_rate = 60
+
+    def __init__(self, clock=None, executable='xdotool'):
+        super().__init__(clock)
+        self.executable = shutil.which(executable)
+        if not self.executable:
+            raise RuntimeError(f"{executable} not found on PATH")
+
+    def _run(self, *args):
+        subprocess.run((self.executable,) + args, check=False,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def mouse_controller(self):
+        return _XdotoolMouse(self._run)
+
+    def keyboard_controller(self):
+        return _XdotoolKeyboard(self._run)
+
+    def resolve_key(self, name):
+        return XDOTOOL_KEYSYMS.get(name, name)
+
+    def resolve_button(self, name):
+        return XDOTOOL_BUTTONS[name]
+
+
+class _NullMouse:
+    def __init__(self, log):
+        self._log = log
+        self._position = (0, 0)
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = value
+        self._log('move', value)
+
+    def press(self, button):
+        self._log('press_button', button)
+
+    def release(self, button):
+        self._log('release_button', button)
+
+    def scroll(self, dx, dy):
+        self._log('scroll', (dx, dy))
+
+
+class _NullKeyboard:
+    def __init__(self, log):
+        self._log = log
+
+    def press(self, key):
+        self._log('press_key', key)
+
+    def release(self, key):
+        self._log('release_key', key)
+
+
+class _IdleListener:
+    """Listener that never produces events"""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class NullBackend(InputBackend):
+    """In-memory sink: every injected action is kept as (timestamp_ns, action, value).
+
+    Keys and buttons stay plain names. Nothing reaches the OS, so playback can
+    be run and timed without a display.
+    """
+
+    name = 'null'
+    can_inject = True
+    can_record = True
+
+    def __init__(self, clock=None):
+        super().__init__(clock)
+        self.actions = []
+        self._lock = threading.Lock()
+
+    def _log(self, action, value):
+        entry = (self.clock.now_ns(), action, value)
+        with self._lock:
+            self.actions.append(entry)
+
+    def clear(self):
+        with self._lock:
+            self.actions = []
+
+    def mouse_controller(self):
+        return _NullMouse(self._log)
+
+    def keyboard_controller(self):
+        return _NullKeyboard(self._log)
+
+    def mouse_listener(self, on_move=None, on_click=None, on_scroll=None):
+        return _IdleListener()
+
+    def keyboard_listener(self, on_press=None, on_release=None):
+        return _IdleListener()
+
+
+class _SyntheticListener:
+    """Thread that calls ``emit(step)`` at a fixed rate until stopped or emit returns False"""
+
+    def __init__(self, emit, rate, name):
+        self._emit = emit
+        self._rate = rate
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def _run(self):
+        started = time.perf_counter()
+        step = 0
+        while not self._stop_event.is_set():
+            ahead = started + step / self._rate - time.perf_counter()
+            if ahead > 0 and self._stop_event.wait(ahead):
+                break
+            if self._emit(step) is False:
+                break
+            step += 1
+
+
+class SyntheticBackend(NullBackend):
+    """Null sink for playback plus generated input for recording.
+
+    The mouse listener random-walks at ``mouse_rate`` Hz with a click every
+    ``click_every`` moves; the keyboard listener taps WASD at ``key_rate`` Hz.
+    """
+
+    name = 'synthetic'
+
+    def __init__(self, clock=None, mouse_rate=500, key_rate=5, click_every=250, seed=1):
+        super().__init__(clock)
+        self.mouse_rate = mouse_rate
+        self.key_rate = key_rate
+        self.click_every = click_every
+        self.seed = seed
+
+    def mouse_listener(self, on_move=None, on_click=None, on_scroll=None):
+        rng = random.Random(self.seed)
+        position = [960, 540]
+
+        def emit(step):
+            position[0] += rng.randint(-4, 4)
+            position[1] += rng.randint(-4, 4)
+            x, y = position
+            if on_move and on_move(x, y) is False:
+                return False
+            if on_click and self.click_every and step % self.click_every == self.click_every - 1:
+                if on_click(x, y, 'left', True) is False or on_click(x, y, 'left', False) is False:
+                    return False
+            return True
+
+        return _SyntheticListener(emit, self.mouse_rate, "SyntheticMouseListener")
+
+    def keyboard_listener(self, on_press=None, on_release=None):
+        keys = 'wasd'
+
+        def emit(step):
+            key = keys[(step // 2) % len(keys)]
+            callback = on_press if step % 2 == 0 else on_release
+            return callback(key) if callback else True
+
+        return _SyntheticListener(emit, self.key_rate * 2, "SyntheticKeyboardListener")
+
+
+BACKENDS = {
+    'pynput': PynputBackend,
+    'xdotool': XdotoolBackend,
+    'null': NullBackend,
+    'synthetic': SyntheticBackend,
+}
+
+
+def create_backend(name='pynput', clock=None, **options):
+    """Instantiate a backend by name ('pynput', 'xdotool', 'null' or 'synthetic')"""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown input backend: {name}") from None
+    return backend_class(clock=clock, **options)
@@ -0,0 +1,179 @@
+"""
+Macro Cache for  Macro Recorder
+Keeps recently loaded macros and their compiled playback plans in memory, within a byte budget
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Steps sampled to estimate the memory held by a compiled plan
+PLAN_SAMPLE = 256
+
+
+def file_key(filename):
+    """Cache key of a macro file: (absolute path, mtime ns, size).
+
+    Saving over the file changes the key, so a stale entry is never returned;
+    it just ages out of the cache.
+    """
+    stat = os.stat(filename)
+    return os.path.abspath(filename), stat.st_mtime_ns, stat.st_size
+
+
+def plan_nbytes(plan):
+    """Approximate memory held by a compiled PlaybackPlan (sampled, steps share their callables)"""
+    steps = plan.steps
+    if not steps:
+        return sys.getsizeof(steps)
+    stride = max(1, len(steps) // PLAN_SAMPLE)
+    sample = steps[::stride]
+    per_step = sum(sys.getsizeof(step) + sys.getsizeof(step[0]) + sys.getsizeof(step[2]) for step in sample)
+    return sys.getsizeof(steps) + per_step * len(steps) // len(sample)
+
+
+class _Entry:
+    __slots__ = ('store', 'store_bytes', 'engine', 'plans', 'plan_bytes')
+
+    def __init__(self, store):
+        self.store = store
+        self.store_bytes = store.nbytes()
+        self.engine = None
+        self.plans = {}
+        self.plan_bytes = {}
+
+    @property
+    def nbytes(self):
+        return self.store_bytes + sum(self.plan_bytes.values())
+
+
+class MacroCache:
+    """LRU cache of parsed EventStores and their compiled plans.
+
+    ``get`` hands out a copy, so editing a loaded macro never changes the
+    cached one; copying the columns is a memcpy, far cheaper than parsing.
+    Plans are immutable and bound to the engine that compiled them, so they
+    are shared as-is and dropped when a different engine asks.
+    Least recently used entries are evicted once the total passes
+    ``max_bytes``; anything bigger than the whole budget is not cached.
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.plan_hits = 0
+        self.plan_misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Copy of the cached store for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            store = entry.store
+        return store.copy()
+
+    def put(self, key, store):
+        """Cache a freshly loaded store (the cache keeps its own copy)"""
+        entry = _Entry(store.copy())
+        with self._lock:
+            self._discard(key)
+            if entry.nbytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            self._evict(keep=key)
+
+    def get_plan(self, key, engine, options):
+        """Compiled plan of the cached macro for this engine and playback options, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            plan = entry.plans.get(options) if entry is not None and entry.engine is engine else None
+            if plan is None:
+                self.plan_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.plan_hits += 1
+            return plan
+
+    def put_plan(self, key, engine, options, plan):
+        """Keep a plan compiled from the cached macro; ignored if the macro was evicted"""
+        if plan.streamed:
+            return
+        size = plan_nbytes(plan)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self._bytes -= entry.nbytes
+            if entry.engine is not engine:
+                entry.engine = engine
+                entry.plans.clear()
+                entry.plan_bytes.clear()
+            if entry.nbytes + size <= self.max_bytes:
+                entry.plans[options] = plan
+                entry.plan_bytes[options] = size
+            self._bytes += entry.nbytes
+            self._evict(keep=key)
+
+    def invalidate(self, filename):
+        """Drop every entry for a file (any mtime/size)"""
+        path = os.path.abspath(filename)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def _evict(self, keep=None):
+        while self._bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(key)
+                continue
+            self._discard(key)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'plan_hits': self.plan_hits,
+                'plan_misses': self.plan_misses,
+            }
@@ -0,0 +1,575 @@
+"""
+Macro File Formats for  Macro Recorder
+Reads and writes macros as JSON (.json) or packed binary records (.mrec)
+"""
+import gzip
+import json
+import lzma
+import mmap
+import os
+import struct
+import threading
+from array import array
+from datetime import datetime
+from operator import itemgetter
+
+from delta_codec import encode_block, read_block
+from event_store import COLUMNS, EventStore, US_PER_SECOND
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, it only speeds up .mrec packing
+    numpy = None
+
+# JSON layout version 2: integer microsecond 'timestamp_us' per event (version 1: float seconds 'timestamp')
+MACRO_FORMAT_VERSION = 2
+
+MREC_EXTENSION = '.mrec'
+MREC_MAGIC = b'MREC'
+MREC_VERSION = 2
+
+# magic, version, record size, event count, duration (us), table size, flags
+MREC_HEADER = struct.Struct('<4sHHQqII')
+
+# Event encodings: fixed-width records (version 1, can be memory-mapped) or
+# per-column zigzag varints with delta-coded timestamps/coordinates (version 2)
+MREC_RECORDS = 'records'
+MREC_DELTA = 'delta'
+MREC_ENCODINGS = (MREC_RECORDS, MREC_DELTA)
+MREC_FLAG_DELTA = 1
+
+# One event per record, little-endian; names match the EventStore columns.
+# numpy.frombuffer(data, dtype=numpy.dtype(RECORD_FIELDS), offset=...) reads them directly.
+RECORD_FIELDS = [
+    ('timestamps', '<i8'),
+    ('x', '<i4'),
+    ('y', '<i4'),
+    ('dx', '<i4'),
+    ('dy', '<i4'),
+    ('keys', '<i4'),
+    ('extras', '<i4'),
+    ('types', 'u1'),
+    ('buttons', 'i1'),
+    ('pressed', 'i1'),
+    ('_pad', 'V1'),
+]
+MREC_RECORD = struct.Struct('<qiiiiiiBbbx')
+RECORD_COLUMNS = [name for name, _ in RECORD_FIELDS if name != '_pad']
+# Column name -> (byte offset in the record, struct code)
+RECORD_OFFSETS = {
+    'timestamps': (0, 'q'),
+    'x': (8, 'i'),
+    'y': (12, 'i'),
+    'dx': (16, 'i'),
+    'dy': (20, 'i'),
+    'keys': (24, 'i'),
+    'extras': (28, 'i'),
+    'types': (32, 'B'),
+    'buttons': (33, 'b'),
+    'pressed': (34, 'b'),
+}
+
+# Mapped stores decode and stream this many records at a time
+MAPPED_CHUNK = 4096
+
+# Records start on this boundary so they can be viewed in place (e.g. through mmap)
+RECORD_ALIGNMENT = 8
+
+
+# Records per chunk when streaming a .mrec file through a (compressed) file object
+RECORD_CHUNK = 65536
+# Events per write when streaming JSON
+JSON_CHUNK = 4096
+
+# Compression suffix (after .json or .mrec) -> (streaming opener, level keyword, default level)
+CODECS = {
+    '.gz': (gzip.open, 'compresslevel', 6),
+    '.xz': (lzma.open, 'preset', 6),
+}
+
+
+def split_codec(filename):
+    """Split 'macro.mrec.xz' into ('macro.mrec', '.xz'); the codec is None when uncompressed"""
+    lower = filename.lower()
+    for suffix in CODECS:
+        if lower.endswith(suffix):
+            return filename[:-len(suffix)], suffix
+    return filename, None
+
+
+def open_stream(filename, mode, codec=None, level=None):
+    """Open a file, compressing or decompressing on the fly when codec is set.
+
+    Data goes through the codec in chunks as it is written or read, so the
+    whole document is never held compressed and uncompressed at once.
+    """
+    if codec is None:
+        return open(filename, mode)
+    opener, level_keyword, default_level = CODECS[codec]
+    if 'b' not in mode:
+        mode += 't'
+    if 'w' in mode:
+        return opener(filename, mode, **{level_keyword: default_level if level is None else level})
+    return opener(filename, mode)
+
+
+def is_mrec(filename):
+    """True if the file name selects the binary format (compressed or not)"""
+    return split_codec(filename)[0].lower().endswith(MREC_EXTENSION)
+
+
+def save_events(store, filename, level=None, encoding=MREC_RECORDS):
+    """Save an EventStore, picking the format and compression from the file extension.
+
+    encoding only applies to .mrec files: 'records' or the smaller 'delta'.
+    """
+    if isinstance(store, MappedEventStore) and store.maps(filename):
+        # Never rewrite the file under its own mapping
+        store.materialize()
+    if is_mrec(filename):
+        save_mrec(store, filename, level, encoding)
+    else:
+        save_json(store, filename, level)
+
+
+def load_events(filename, mapped=False):
+    """Load an EventStore, picking the format and compression from the file extension.
+
+    With mapped=True an uncompressed, record-encoded .mrec file is
+    memory-mapped instead of read (see MappedEventStore); everything else is
+    read in full.
+    """
+    if is_mrec(filename):
+        if mapped and split_codec(filename)[1] is None and mrec_encoding(filename) == MREC_RECORDS:
+            return MappedEventStore(filename)
+        return load_mrec(filename)
+    return load_json(filename)
+
+
+# ---------------- JSON ---------------- #
+def save_json(store, filename, level=None):
+    """Write the JSON layout with one event per line, streamed in chunks.
+
+    Written beside the target and swapped in, so an interrupted save never
+    truncates the existing macro.
+    """
+    header = {
+        'format_version': MACRO_FORMAT_VERSION,
+        'time_unit': 'us',
+        'created_at': datetime.now().isoformat(),
+        'total_events': len(store),
+        'duration': store.duration,
+        'duration_us': store.timestamps[-1] if store else 0
+    }
+    dumps = json.dumps
+    temp_name = f"{filename}.tmp"
+    try:
+        with open_stream(temp_name, 'w', split_codec(filename)[1], level) as f:
+            f.write('{\n' + ''.join(f'  {dumps(key)}: {dumps(value)},\n' for key, value in header.items()))
+            f.write('  "events": [')
+            events = store.iter_dicts(integer_timestamps=True)
+            separator = '\n    '
+            for start in range(0, len(store), JSON_CHUNK):
+                lines = [dumps(event) for _, event in zip(range(JSON_CHUNK), events)]
+                f.write(separator + ',\n    '.join(lines))
+                separator = ',\n    '
+            f.write('\n  ]\n}\n')
+        os.replace(temp_name, filename)
+    except BaseException:
+        _remove_temp(temp_name)
+        raise
+
+
+def load_json(filename):
+    """Read a JSON macro.
+
+    Files in save_json's layout are parsed JSON_CHUNK event lines at a time
+    straight into the store, so the document is never held whole. Anything
+    else (version 1 or pretty-printed files) falls back to json.load.
+    """
+    codec = split_codec(filename)[1]
+    with open_stream(filename, 'r', codec) as f:
+        store = _read_event_lines(f)
+    if store is None:
+        with open_stream(filename, 'r', codec) as f:
+            data = json.load(f)
+        # Version 1 files store float seconds in 'timestamp'; EventStore converts
+        # those to integer microseconds, so old macros load transparently
+        store = EventStore(data.get('events', []))
+    return store
+
+
+def _read_event_lines(f):
+    """Parse the one-event-per-line layout written by save_json; None if the file is laid out differently"""
+    if f.readline() != '{\n':
+        return None
+    for line in f:
+        if line == '  "events": [\n':
+            break
+        if not (line.startswith('  "') and line.endswith(',\n')):
+            return None
+    else:
+        return None
+
+    store = EventStore()
+    batch = []
+    for line in f:
+        if line == '  ]\n':
+            break
+        line = line.strip()
+        if not line.startswith('{'):
+            return None
+        batch.append(line[:-1] if line.endswith(',') else line)
+        if len(batch) == JSON_CHUNK:
+            store.extend(json.loads('[' + ','.join(batch) + ']'))
+            batch = []
+    else:
+        return None
+    if batch:
+        store.extend(json.loads('[' + ','.join(batch) + ']'))
+    return store
+
+
+# ---------------- Binary (.mrec) ---------------- #
+def save_mrec(store, filename, level=None, encoding=MREC_RECORDS):
+    """Write header, string tables and one fixed-width record per event.
+
+    The string tables (event type, key and button names) and the extras side
+    table are a small JSON blob; ids in the records index into them, exactly as
+    in the EventStore, so a load gives back the same store. With the 'delta'
+    encoding the records are replaced by one varint block per column.
+    """
+    if encoding not in MREC_ENCODINGS:
+        raise ValueError(f"Unknown .mrec encoding: {encoding}")
+    delta = encoding == MREC_DELTA
+    # Only the extras that events still use (edits leave old ones in the table)
+    extras, extras_column = store.compact_extras()
+    tables = json.dumps({
+        'type_names': store.type_names,
+        'key_names': store.key_names,
+        'button_names': store.button_names,
+        'extras': extras,
+        'created_at': datetime.now().isoformat(),
+    }, separators=(',', ':')).encode('utf-8')
+    # Pad with JSON whitespace so the records start aligned
+    tables += b' ' * (-(MREC_HEADER.size + len(tables)) % RECORD_ALIGNMENT)
+
+    # Record-encoded files stay version 1 so older readers can still open them
+    header = MREC_HEADER.pack(MREC_MAGIC, 2 if delta else 1, 0 if delta else MREC_RECORD.size, len(store),
+                              store.timestamps[-1] if store else 0, len(tables), MREC_FLAG_DELTA if delta else 0)
+    # Write beside the target and swap it in, so a store still mapping the
+    # old file keeps reading intact data
+    temp_name = f"{filename}.tmp"
+    columns = {name: extras_column if name == 'extras' else getattr(store, name) for name in RECORD_COLUMNS}
+    try:
+        with open_stream(temp_name, 'wb', split_codec(filename)[1], level) as f:
+            f.write(header)
+            f.write(tables)
+            if delta:
+                for name, _ in COLUMNS:
+                    f.write(encode_block(name, columns[name]))
+            else:
+                for start in range(0, len(store), RECORD_CHUNK):
+                    f.write(pack_records({name: column[start:start + RECORD_CHUNK]
+                                          for name, column in columns.items()}))
+        os.replace(temp_name, filename)
+    except BaseException:
+        _remove_temp(temp_name)
+        raise
+
+
+def _remove_temp(temp_name):
+    """Drop the partial file of a failed save so no stray .tmp is left beside the macro"""
+    try:
+        os.remove(temp_name)
+    except OSError:
+        pass
+
+
+def pack_records(columns):
+    """Pack column arrays (keyed by RECORD_COLUMNS name) into .mrec records"""
+    columns = [columns[name] for name in RECORD_COLUMNS]
+    if numpy is not None:
+        records = numpy.zeros(len(columns[0]), dtype=numpy.dtype(RECORD_FIELDS))
+        for name, column in zip(RECORD_COLUMNS, columns):
+            records[name] = numpy.frombuffer(column, dtype=column.typecode)
+        return records.tobytes()
+    return b''.join(map(MREC_RECORD.pack, *columns))
+
+
+def mrec_encoding(filename):
+    """Event encoding of an uncompressed .mrec file ('records' or 'delta')"""
+    with open(filename, 'rb') as f:
+        return read_mrec_header(f)['encoding']
+
+
+def read_mrec_header(f):
+    """Parse the header and string tables from an open .mrec file.
+
+    Returns a dict with version, encoding, event_count, duration_us,
+    record_size, records_offset and the tables; the file is left positioned
+    at the records.
+    """
+    raw = f.read(MREC_HEADER.size)
+    if len(raw) < MREC_HEADER.size:
+        raise ValueError("Truncated .mrec header")
+    magic, version, record_size, count, duration_us, table_size, flags = MREC_HEADER.unpack(raw)
+    if magic != MREC_MAGIC:
+        raise ValueError("Not a .mrec file")
+    if version > MREC_VERSION:
+        raise ValueError(f"Unsupported .mrec version {version} (newest known is {MREC_VERSION})")
+    encoding = MREC_DELTA if flags & MREC_FLAG_DELTA else MREC_RECORDS
+    if record_size != (0 if encoding == MREC_DELTA else MREC_RECORD.size):
+        raise ValueError(f"Unexpected .mrec record size {record_size}")
+    raw_tables = f.read(table_size)
+    if len(raw_tables) < table_size:
+        raise ValueError("Truncated .mrec string tables")
+    header = json.loads(raw_tables.decode('utf-8'))
+    header.update({
+        'version': version,
+        'encoding': encoding,
+        'event_count': count,
+        'duration_us': duration_us,
+        'duration': duration_us / US_PER_SECOND,
+        'record_size': record_size,
+        'records_offset': MREC_HEADER.size + table_size,
+    })
+    return header
+
+
+def load_mrec(filename):
+    typecodes = dict(COLUMNS)
+    columns = {name: array(typecodes[name]) for name in RECORD_COLUMNS}
+    with open_stream(filename, 'rb', split_codec(filename)[1]) as f:
+        header = read_mrec_header(f)
+        count = header['event_count']
+        if header['encoding'] == MREC_DELTA:
+            columns = {name: read_block(f.read, name, count, typecode) for name, typecode in COLUMNS}
+        else:
+            for start in range(0, count, RECORD_CHUNK):
+                chunk = min(RECORD_CHUNK, count - start)
+                data = f.read(chunk * MREC_RECORD.size)
+                if len(data) < chunk * MREC_RECORD.size:
+                    raise ValueError(f"Truncated .mrec file: expected {count} events")
+                for name, column in unpack_records(data, chunk).items():
+                    columns[name].extend(column)
+
+    return EventStore.from_columns(
+        columns,
+        type_names=header['type_names'],
+        key_names=header['key_names'],
+        button_names=header['button_names'],
+        extras=header['extras'],
+    )
+
+
+def unpack_records(data, count):
+    """Unpack count .mrec records into column arrays keyed by column name"""
+    typecodes = dict(COLUMNS)
+    if numpy is not None:
+        records = numpy.frombuffer(data, dtype=numpy.dtype(RECORD_FIELDS), count=count)
+        return {name: array(typecodes[name], records[name].astype(typecodes[name]).tobytes())
+                for name in RECORD_COLUMNS}
+    if not count:
+        return {name: array(typecodes[name]) for name in RECORD_COLUMNS}
+    rows = zip(*MREC_RECORD.iter_unpack(data))
+    return {name: array(typecodes[name], values) for name, values in zip(RECORD_COLUMNS, rows)}
+
+
+class MappedColumn:
+    """Read-only, array-like view of one record field across a mapped .mrec file"""
+
+    def __init__(self, buffer, records_offset, count, name):
+        field_offset, code = RECORD_OFFSETS[name]
+        self._buffer = buffer
+        self._records_offset = records_offset
+        self._base = records_offset + field_offset
+        self._count = count
+        self._unpack = struct.Struct('<' + code).unpack_from
+        self._field = RECORD_COLUMNS.index(name)
+        self.typecode = dict(COLUMNS)[name]
+        self.itemsize = struct.calcsize(code)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            if step != 1:
+                return array(self.typecode, (self[i] for i in range(start, stop, step)))
+            # Decode whole records in bulk and keep this field
+            size = MREC_RECORD.size
+            data = self._buffer[self._records_offset + start * size:self._records_offset + max(start, stop) * size]
+            return array(self.typecode, map(itemgetter(self._field), MREC_RECORD.iter_unpack(data)))
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("event index out of range")
+        return self._unpack(self._buffer, self._base + index * MREC_RECORD.size)[0]
+
+    def __iter__(self):
+        for start in range(0, self._count, MAPPED_CHUNK):
+            yield from self[start:start + MAPPED_CHUNK]
+
+
+def _close_map(mapping):
+    try:
+        mapping.close()
+    except BufferError:
+        # A numpy view from as_numpy() is still alive; the mapping goes with it
+        pass
+
+
+class MappedEventStore(EventStore):
+    """EventStore backed by a memory-mapped .mrec file.
+
+    Opening only parses the header and string tables; the columns are
+    MappedColumn views that decode fields from the mapping on access, and
+    ``rows()`` streams records chunk by chunk, handing pages back to the OS
+    once they are behind, so playback memory stays flat however long the
+    macro is. The first mutation copies every column into ordinary arrays,
+    after which the store behaves exactly like an EventStore; the mapping is
+    closed then, or when the last running stream ends.
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        self.path = os.path.abspath(filename)
+        with open(filename, 'rb') as f:
+            header = read_mrec_header(f)
+            if header['encoding'] != MREC_RECORDS:
+                raise ValueError(f"Only record-encoded .mrec files can be memory-mapped: {filename}")
+            self._count = header['event_count']
+            self._records_offset = header['records_offset']
+            if os.fstat(f.fileno()).st_size < self._records_offset + self._count * MREC_RECORD.size:
+                raise ValueError(f"Truncated .mrec file: expected {self._count} events")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._streams = 0
+        self._lock = threading.Lock()
+
+        self.type_names = list(header['type_names'])
+        self.key_names = list(header['key_names'])
+        self.button_names = list(header['button_names'])
+        self._type_ids = {name: i for i, name in enumerate(self.type_names)}
+        self._key_ids = {name: i for i, name in enumerate(self.key_names)}
+        self._button_ids = {name: i for i, name in enumerate(self.button_names)}
+        self._extras = header['extras']
+        for name in RECORD_COLUMNS:
+            setattr(self, name, MappedColumn(self._map, self._records_offset, self._count, name))
+
+    @property
+    def mapped(self):
+        """True until the store has been copied into memory"""
+        return self._map is not None
+
+    def maps(self, filename):
+        return self.mapped and os.path.abspath(filename) == self.path
+
+    def materialize(self):
+        """Copy every column into memory and drop the mapping (done on first mutation)"""
+        if self._map is None:
+            return
+        end = self._records_offset + self._count * MREC_RECORD.size
+        columns = unpack_records(self._map[self._records_offset:end], self._count)
+        for name, column in columns.items():
+            setattr(self, name, column)
+        self._release_map()
+
+    def _release_map(self):
+        # Closed right away so the file can be replaced (Windows refuses while it is mapped),
+        # unless a stream still reads it; the last one closes it then
+        with self._lock:
+            mapping, self._map = self._map, None
+            if mapping is None or self._streams:
+                return
+        _close_map(mapping)
+
+    def rows(self):
+        if self._map is None:
+            return super().rows()
+        return self._stream_rows()
+
+    def _stream_rows(self):
+        with self._lock:
+            mapping = self._map
+            if mapping is not None:
+                self._streams += 1
+        if mapping is None:
+            # Materialized before the stream started
+            yield from super().rows()
+            return
+        try:
+            yield from self._read_rows(mapping)
+        finally:
+            with self._lock:
+                self._streams -= 1
+                last = self._map is not mapping and not self._streams
+            if last:
+                _close_map(mapping)
+
+    def _read_rows(self, mapping):
+        size = MREC_RECORD.size
+        reorder = itemgetter(*(RECORD_COLUMNS.index(name) for name, _ in COLUMNS))
+        release = getattr(mmap, 'MADV_DONTNEED', None)
+        released = 0
+        for start in range(0, self._count, MAPPED_CHUNK):
+            begin = self._records_offset + start * size
+            end = self._records_offset + min(self._count, start + MAPPED_CHUNK) * size
+            yield from map(reorder, MREC_RECORD.iter_unpack(mapping[begin:end]))
+            if release is not None:
+                # Drop the pages already played; they are re-read from disk if needed again
+                upto = end - end % mmap.PAGESIZE
+                if upto > released:
+                    mapping.madvise(release, released, upto - released)
+                    released = upto
+
+    def as_numpy(self):
+        if self._map is None:
+            return super().as_numpy()
+        if numpy is None:
+            raise RuntimeError("numpy is not installed")
+        records = numpy.frombuffer(self._map, dtype=numpy.dtype(RECORD_FIELDS),
+                                   count=self._count, offset=self._records_offset)
+        return {name: records[name] for name in RECORD_COLUMNS}
+
+    # ---------------- Copy on write ---------------- #
+    def append_raw(self, *args, **kwargs):
+        self.materialize()
+        super().append_raw(*args, **kwargs)
+
+    def _write_row(self, index, row):
+        self.materialize()
+        super()._write_row(index, row)
+
+    def _insert_row(self, index, row):
+        self.materialize()
+        super()._insert_row(index, row)
+
+    def __delitem__(self, index):
+        self.materialize()
+        super().__delitem__(index)
+
+    def insert_rows(self, index, rows):
+        self.materialize()
+        super().insert_rows(index, rows)
+
+    def write_rows(self, index, rows):
+        self.materialize()
+        super().write_rows(index, rows)
+
+    def delete_ranges(self, ranges):
+        self.materialize()
+        super().delete_ranges(ranges)
+
+    def insert_pieces(self, pieces):
+        self.materialize()
+        super().insert_pieces(pieces)
+
+    def clear(self):
+        self._release_map()
+        super().clear()
+
+    def close(self):
+        """Unmap the file without copying it in (e.g. once a scan has read what it needs); leaves the store empty"""
+        self.clear()
@@ -0,0 +1,421 @@
+"""
+Macro Library for  Macro Recorder
+Indexes a folder of macro files in a SQLite catalog so they can be found without opening them
+Run: python macro_library.py [--folder DIR] <scan|list|show|tag|untag|tags>
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from macro_file import MappedEventStore, load_events, split_codec
+
+# Macro files the library picks up (plus their .gz/.xz variants)
+MACRO_EXTENSIONS = ('.json', '.mrec')
+
+# Catalog file name, kept inside the library folder by default
+LIBRARY_DB = 'macro_library.db'
+
+HASH_CHUNK = 1 << 20
+
+# Sort name -> ORDER BY clause
+SORT_ORDERS = {
+    'name': 'm.name COLLATE NOCASE',
+    'modified': 'm.mtime_ns DESC',
+    'played': 'm.last_played IS NULL, m.last_played DESC',
+    'events': 'm.event_count DESC',
+    'duration': 'm.duration DESC',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS macros (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    event_count INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    last_played TEXT,
+    indexed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS macros_hash ON macros(hash);
+CREATE TABLE IF NOT EXISTS macro_types (
+    path TEXT NOT NULL REFERENCES macros(path) ON DELETE CASCADE ON UPDATE CASCADE,
+    type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (path, type)
+);
+CREATE INDEX IF NOT EXISTS macro_types_type ON macro_types(type);
+CREATE TABLE IF NOT EXISTS macro_tags (
+    path TEXT NOT NULL REFERENCES macros(path) ON DELETE CASCADE ON UPDATE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (path, tag)
+);
+CREATE INDEX IF NOT EXISTS macro_tags_tag ON macro_tags(tag);
+"""
+
+# Tags and type counts are folded into each row; 0x1f never appears in either
+_SEPARATOR = '\x1f'
+_SELECT = f"""
+SELECT m.path, m.name, m.mtime_ns, m.size, m.hash, m.event_count, m.duration, m.last_played, m.indexed_at,
+       (SELECT group_concat(tag, '{_SEPARATOR}') FROM macro_tags WHERE path = m.path),
+       (SELECT group_concat(type || ':' || count, '{_SEPARATOR}') FROM macro_types WHERE path = m.path)
+FROM macros AS m
+"""
+
+
+def is_macro_file(filename):
+    """True for .json/.mrec files, compressed or not"""
+    return split_codec(filename)[0].lower().endswith(MACRO_EXTENSIONS)
+
+
+def file_hash(filename):
+    """SHA-1 of the file contents, read in chunks"""
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_tags(tags):
+    return sorted({tag.strip().lower() for tag in tags if tag and tag.strip()})
+
+
+class MacroLibrary:
+    """SQLite catalog of the macro files under a folder.
+
+    ``scan`` compares each file's mtime and size with the catalog and only
+    reads what changed: a file with new contents is hashed and parsed once
+    for its event count, duration and event-type histogram; a touched file
+    whose hash still matches is not parsed, and a renamed or moved file
+    (same hash under a new path) keeps its tags and play history. Queries
+    only read the catalog, never the macro files.
+
+    The connection is shared by the GUI and the watcher thread, so every
+    use goes through ``_lock``. The database runs in WAL mode so the CLI can
+    read it while the app is writing.
+    """
+
+    def __init__(self, folder, db_path=None):
+        self.folder = os.path.abspath(folder)
+        os.makedirs(self.folder, exist_ok=True)
+        self.db_path = db_path or os.path.join(self.folder, LIBRARY_DB)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        # Files that failed to parse, keyed by path -> (mtime_ns, size); retried once they change
+        self._invalid = {}
+        self.last_scan = None
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+
+    def close(self):
+        self.stop_watching()
+        with self._lock:
+            self._conn.close()
+
+    # ---------------- Indexing ---------------- #
+    def _walk(self, folder=None):
+        """Yield (path, (mtime_ns, size)) for every macro file under folder"""
+        try:
+            entries = list(os.scandir(folder or self.folder))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._walk(entry.path)
+                elif entry.is_file() and is_macro_file(entry.name):
+                    stat = entry.stat()
+                    yield entry.path, (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+
+    def scan(self):
+        """Bring the catalog in line with the folder; returns what changed.
+
+        Only files whose mtime or size differ from the catalog are opened, so
+        a scan of an unchanged library costs one stat per file.
+        """
+        started = time.perf_counter()
+        on_disk = dict(self._walk())
+        with self._lock:
+            known = {path: (mtime_ns, size, digest) for path, mtime_ns, size, digest
+                     in self._conn.execute("SELECT path, mtime_ns, size, hash FROM macros")}
+        stats = {'files': len(on_disk), 'added': 0, 'updated': 0, 'touched': 0, 'moved': 0,
+                 'removed': 0, 'invalid': 0}
+
+        removed = {path for path in known if path not in on_disk}
+        removed_by_hash = {}
+        for path in removed:
+            removed_by_hash.setdefault(known[path][2], []).append(path)
+        changed = [path for path, state in on_disk.items()
+                   if known.get(path, (None, None))[:2] != state and self._invalid.get(path) != state]
+        self._invalid = {path: state for path, state in self._invalid.items() if path in on_disk}
+
+        # Hash and parse outside the lock so queries stay responsive during a long scan
+        writes = []
+        for path in changed:
+            state = on_disk[path]
+            try:
+                digest = file_hash(path)
+                if path in known and known[path][2] == digest:
+                    writes.append(('touch', path, state))
+                    stats['touched'] += 1
+                    continue
+                moved_from = removed_by_hash.get(digest)
+                if path not in known and moved_from:
+                    old_path = moved_from.pop()
+                    removed.discard(old_path)
+                    writes.append(('move', old_path, path, state))
+                    stats['moved'] += 1
+                    continue
+                writes.append(('index', path, state, digest, self._summarize(path)))
+                stats['updated' if path in known else 'added'] += 1
+            except Exception as e:
+                self._invalid[path] = state
+                stats['invalid'] += 1
+                print(f"⚠️ Library: cannot index {path}: {e}")
+
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._lock, self._conn:
+            for write in writes:
+                if write[0] == 'touch':
+                    _, path, (mtime_ns, size) = write
+                    self._conn.execute("UPDATE macros SET mtime_ns = ?, size = ? WHERE path = ?",
+                                       (mtime_ns, size, path))
+                elif write[0] == 'move':
+                    _, old_path, path, (mtime_ns, size) = write
+                    self._conn.execute("UPDATE macros SET path = ?, name = ?, mtime_ns = ?, size = ? WHERE path = ?",
+                                       (path, os.path.basename(path), mtime_ns, size, old_path))
+                else:
+                    _, path, (mtime_ns, size), digest, (event_count, duration, type_counts) = write
+                    self._conn.execute(
+                        "INSERT INTO macros (path, name, mtime_ns, size, hash, event_count, duration, indexed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size, "
+                        "hash = excluded.hash, event_count = excluded.event_count, duration = excluded.duration, "
+                        "indexed_at = excluded.indexed_at",
+                        (path, os.path.basename(path), mtime_ns, size, digest, event_count, duration, now))
+                    self._conn.execute("DELETE FROM macro_types WHERE path = ?", (path,))
+                    self._conn.executemany("INSERT INTO macro_types (path, type, count) VALUES (?, ?, ?)",
+                                           [(path, name, count) for name, count in type_counts.items()])
+            self._conn.executemany("DELETE FROM macros WHERE path = ?", [(path,) for path in removed])
+        stats['removed'] = len(removed)
+        stats['changed'] = bool(writes or removed)
+        stats['elapsed_s'] = time.perf_counter() - started
+        self.last_scan = stats
+        return stats
+
+    @staticmethod
+    def _summarize(path):
+        """Event count, duration and event-type histogram of one macro file"""
+        store = load_events(path, mapped=True)
+        try:
+            counts = Counter(store.types)
+            return len(store), store.duration, {store.type_names[type_id]: count for type_id, count in counts.items()}
+        finally:
+            if isinstance(store, MappedEventStore):
+                # Unmap right away: a mapped file cannot be replaced on Windows, and the watcher rescans often
+                store.close()
+
+    # ---------------- Watching ---------------- #
+    def start_watching(self, interval_s=2.0, on_change=None):
+        """Rescan every interval_s seconds on a background thread.
+
+        on_change(stats) is called from that thread after a scan that changed
+        the catalog.
+        """
+        self.stop_watching()
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(
+            target=self._watch_loop, args=(interval_s, on_change), name="MacroLibraryWatcher", daemon=True
+        )
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        thread, self._watch_thread = self._watch_thread, None
+        if thread is not None:
+            self._watch_stop.set()
+            thread.join(timeout=5.0)
+
+    def _watch_loop(self, interval_s, on_change):
+        while True:
+            try:
+                stats = self.scan()
+                if stats['changed'] and on_change:
+                    on_change(stats)
+            except Exception as e:
+                print(f"❌ Library watcher error: {e}")
+            if self._watch_stop.wait(interval_s):
+                return
+
+    # ---------------- Queries ---------------- #
+    def query(self, search=None, tag=None, event_type=None, sort='name', limit=None):
+        """Catalog entries matching every given filter, as dicts.
+
+        search matches the file name or a tag (case-insensitive substring),
+        tag and event_type must match exactly.
+        """
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"Unknown sort order: {sort}")
+        where, params = [], []
+        if search:
+            pattern = '%' + search.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            where.append("(lower(m.name) LIKE ? ESCAPE '\\' OR EXISTS "
+                         "(SELECT 1 FROM macro_tags WHERE path = m.path AND tag LIKE ? ESCAPE '\\'))")
+            params += [pattern, pattern]
+        if tag:
+            where.append("EXISTS (SELECT 1 FROM macro_tags WHERE path = m.path AND tag = ?)")
+            params.append(tag.strip().lower())
+        if event_type:
+            where.append("EXISTS (SELECT 1 FROM macro_types WHERE path = m.path AND type = ?)")
+            params.append(event_type)
+        sql = _SELECT + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY " + SORT_ORDERS[sort]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            return [self._row_dict(row) for row in self._conn.execute(sql, params)]
+
+    def get(self, path):
+        """Catalog entry for one file, or None"""
+        with self._lock:
+            row = self._conn.execute(_SELECT + " WHERE m.path = ?", (os.path.abspath(path),)).fetchone()
+        return self._row_dict(row) if row else None
+
+    def tags(self):
+        """All tags with the number of macros carrying each"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT tag, COUNT(*) FROM macro_tags GROUP BY tag ORDER BY tag").fetchall()
+
+    @staticmethod
+    def _row_dict(row):
+        path, name, mtime_ns, size, digest, event_count, duration, last_played, indexed_at, tags, types = row
+        type_counts = {}
+        for item in (types.split(_SEPARATOR) if types else []):
+            type_name, _, count = item.rpartition(':')
+            type_counts[type_name] = int(count)
+        return {
+            'path': path,
+            'name': name,
+            'modified': mtime_ns / 1e9,
+            'size': size,
+            'hash': digest,
+            'event_count': event_count,
+            'duration': duration,
+            'type_counts': type_counts,
+            'tags': sorted(tags.split(_SEPARATOR)) if tags else [],
+            'last_played': last_played,
+            'indexed_at': indexed_at,
+        }
+
+    # ---------------- Tags / history ---------------- #
+    def set_tags(self, path, tags):
+        """Replace a macro's tags; returns False if the file is not in the catalog"""
+        return self._edit_tags(path, tags, replace=True)
+
+    def add_tags(self, path, tags):
+        return self._edit_tags(path, tags)
+
+    def remove_tags(self, path, tags):
+        path = os.path.abspath(path)
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM macro_tags WHERE path = ? AND tag = ?",
+                                   [(path, tag) for tag in normalize_tags(tags)])
+
+    def _edit_tags(self, path, tags, replace=False):
+        path = os.path.abspath(path)
+        with self._lock, self._conn:
+            if not self._conn.execute("SELECT 1 FROM macros WHERE path = ?", (path,)).fetchone():
+                return False
+            if replace:
+                self._conn.execute("DELETE FROM macro_tags WHERE path = ?", (path,))
+            self._conn.executemany("INSERT OR IGNORE INTO macro_tags (path, tag) VALUES (?, ?)",
+                                   [(path, tag) for tag in normalize_tags(tags)])
+        return True
+
+    def mark_played(self, path, when=None):
+        """Record that a macro was played (now unless when is given)"""
+        when = (when or datetime.now()).isoformat(timespec='seconds')
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE macros SET last_played = ? WHERE path = ?", (when, os.path.abspath(path)))
+
+
+# ---------------- Command line ---------------- #
+def format_entry(entry):
+    played = entry['last_played'].replace('T', ' ') if entry['last_played'] else 'never'
+    tags = ', '.join(entry['tags'])
+    return (f"{entry['name']:<32} {entry['event_count']:>9,} ev {entry['duration']:>9.1f} s  "
+            f"played {played:<19}  {tags}").rstrip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Macro library catalog")
+    parser.add_argument('--folder', default='macros', help="library folder (default: macros)")
+    parser.add_argument('--db', help=f"catalog file (default: <folder>/{LIBRARY_DB})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('scan', help="index new and changed macro files")
+    list_parser = commands.add_parser('list', help="list catalog entries (does not open macro files)")
+    list_parser.add_argument('--search', help="substring of the file name or a tag")
+    list_parser.add_argument('--tag')
+    list_parser.add_argument('--type', dest='event_type', help="only macros containing this event type")
+    list_parser.add_argument('--sort', choices=sorted(SORT_ORDERS), default='name')
+    list_parser.add_argument('--limit', type=int)
+    list_parser.add_argument('--json', action='store_true', help="print entries as JSON")
+    show_parser = commands.add_parser('show', help="full catalog entry for one file")
+    show_parser.add_argument('path')
+    for name, help_text in (('tag', "add tags to a macro"), ('untag', "remove tags from a macro")):
+        tag_parser = commands.add_parser(name, help=help_text)
+        tag_parser.add_argument('path')
+        tag_parser.add_argument('tags', nargs='+')
+    commands.add_parser('tags', help="list tags with their macro counts")
+    args = parser.parse_args()
+
+    library = MacroLibrary(args.folder, args.db)
+    try:
+        if args.command == 'scan':
+            stats = library.scan()
+            print(f"📚 {stats['files']} files: {stats['added']} added, {stats['updated']} updated, "
+                  f"{stats['moved']} moved, {stats['removed']} removed, {stats['invalid']} unreadable "
+                  f"({stats['elapsed_s'] * 1000:.0f} ms)")
+        elif args.command == 'list':
+            entries = library.query(args.search, args.tag, args.event_type, args.sort, args.limit)
+            if args.json:
+                print(json.dumps(entries, indent=2))
+            else:
+                for entry in entries:
+                    print(format_entry(entry))
+                print(f"{len(entries)} macros")
+        elif args.command == 'show':
+            entry = library.get(args.path)
+            if entry is None:
+                print(f"❌ Not in the library: {args.path}")
+                return 1
+            print(json.dumps(entry, indent=2))
+        elif args.command == 'tag':
+            if not library.add_tags(args.path, args.tags):
+                print(f"❌ Not in the library: {args.path}")
+                return 1
+        elif args.command == 'untag':
+            library.remove_tags(args.path, args.tags)
+        elif args.command == 'tags':
+            for tag, count in library.tags():
+                print(f"{tag:<24} {count}")
+    finally:
+        library.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,44 +1,144 @@
-import time
-import json
+import os
 import threading
 from datetime import datetime
-from pynput import mouse, keyboard
-from pynput.mouse import Button, Listener as MouseListener
-from pynput.keyboard import Key, Listener as KeyboardListener
+from event_store import (
+    EventStore, seconds_to_us,
+    MOUSE_MOVE, MOUSE_CLICK, MOUSE_SCROLL, KEY_PRESS, KEY_RELEASE
+)
+from capture_buffer import CaptureRing, CaptureDrain
+from clock import DEFAULT_CLOCK, NS_PER_SECOND, NS_PER_US
+from macro_file import MREC_ENCODINGS, MappedEventStore, load_events, save_events
+from macro_cache import MacroCache, file_key
+from recording_journal import JOURNAL_FORMATS, RecordingJournal, find_journals, recover_journal
+from path_simplifier import OnlineMoveSimplifier, simplify_moves
+from input_backends import InputBackend, create_backend
+from playback import (
+    PlaybackEngine, PlaybackWorker, LoopSchedule, TIMING_MODES, TIMING_POWER_SAVING, DEFAULT_SPIN_MARGIN_MS,
+    LOOP_MODES, LOOP_FIXED_DELAY, LOOP_FIXED_RATE, OVERRUN_POLICIES, OVERRUN_SKIP
+)
+
 
 class MacroRecorder:
-    def __init__(self):
-        self.events = []
+    def __init__(self, capture_capacity=65536, clock=None, backend=None):
+        self.events = EventStore()
         self.recording = False
         self.playing = False
-        self.start_time = None
+        
+        # All recording/playback timing goes through one monotonic ns clock;
+        # inject a VirtualClock to test playback timing deterministically
+        self.clock = clock or DEFAULT_CLOCK
+        self._now_ns = self.clock.now_ns
+        self.start_ns = None
+        
+        # Input backend: an InputBackend instance or a backend name (default pynput)
+        self.backend = None
+        self.set_backend(backend or 'pynput')
         
         # Event listeners
         self.mouse_listener = None
         self.keyboard_listener = None
         
+        # Capture pipeline: listener callbacks only push raw tuples into their
+        # own ring; the drain thread turns them into stored events in batches
+        self.capture_capacity = capture_capacity
+        self.mouse_ring = None
+        self.keyboard_ring = None
+        self.capture_drain = None
+        
+        # Mouse path simplification: None (off), 'online' (while recording) or 'post' (after stop)
+        self.simplify_mode = None
+        self.simplify_tolerance_px = 2.0
+        self.simplify_tolerance_ms = 30.0
+        self.move_simplifier = None
+        self.last_simplify_stats = None
+        
+        # Optional crash-safe recording: captured events stream to an append-only
+        # journal in journal_dir instead of accumulating in memory (None = off)
+        self.journal_dir = None
+        self.journal_format = 'binary'
+        self.journal = None
+        self.last_journal_stats = None
+        self._last_capture_us = 0
+        
+        # How .mrec macros are saved: 'records' (memory-mappable) or 'delta' (smaller)
+        self.mrec_encoding = 'records'
+        
+        # Recently loaded macros and their compiled plans, so switching back to
+        # a macro skips parsing and compiling; (events, version, key) of the
+        # cached macro currently in self.events
+        self.macro_cache = MacroCache()
+        self._cached_macro = None
+        # Message of the last failed load_macro/save_macro
+        self.last_file_error = None
+        
         # Playback control
         self.playback_thread = None
         self.should_stop = False
+        # Set by stop_all; every playback wait blocks on it, so a stop lands immediately
+        self.stop_event = threading.Event()
+        # Triggers hand playback to this thread instead of running it in the hook
+        self.playback_worker = PlaybackWorker()
+        self._armed_trigger = None
+        self.last_trigger_latency = None
+        self.playback_engine = None
+        self._plan = None
+        self._plan_source = None
+        self._plan_version = None
+        self._plan_warp = None
+        
+        # Time warp applied when compiling: speed factor, and gaps longer than
+        # gap_threshold seconds squeezed to compressed_gap seconds (0 = off)
+        self.playback_speed = 1.0
+        self.gap_threshold = 0.0
+        self.compressed_gap = 1.0
+        
+        # Cap on injected mouse moves per second (0 = inject every recorded move)
+        self.max_move_rate = 0
+        
+        # Playback timing: 'power_saving' (plain sleeps) or 'precise' (sleep, then spin)
+        self.timing_mode = TIMING_POWER_SAVING
+        self.spin_margin_ms = DEFAULT_SPIN_MARGIN_MS
+        self.last_playback_stats = None
+        
+        # Looping: 'fixed_delay' waits repeat_interval after each run, 'fixed_rate'
+        # starts run N at t0 + N * repeat_interval
+        self.loop_mode = LOOP_FIXED_DELAY
+        self.overrun_policy = OVERRUN_SKIP
+        self.last_loop_stats = None
     
     def start_recording(self):
         """Start recording mouse and keyboard events"""
         if self.recording:
             return
-        
+        self._require_recording()
+        
+        self.events = EventStore()
+        self.mouse_ring = CaptureRing(self.capture_capacity)
+        self.keyboard_ring = CaptureRing(self.capture_capacity)
+        self.capture_drain = CaptureDrain([self.mouse_ring, self.keyboard_ring], self._store_captured)
+        self.last_simplify_stats = None
+        self.move_simplifier = None
+        if self.simplify_mode == 'online':
+            self.move_simplifier = OnlineMoveSimplifier(
+                self.events, self.simplify_tolerance_px, self.simplify_tolerance_ms
+            )
+        self._last_capture_us = 0
+        self.journal = None
+        if self.journal_dir:
+            self._open_journal()
+        self.start_ns = self._now_ns()
         self.recording = True
-        self.events = []
-        self.start_time = time.time()
+        self.capture_drain.start()
         
         # Start mouse listener
-        self.mouse_listener = MouseListener(
+        self.mouse_listener = self.backend.mouse_listener(
             on_move=self.on_mouse_move,
             on_click=self.on_mouse_click,
             on_scroll=self.on_mouse_scroll
         )
         
         # Start keyboard listener
-        self.keyboard_listener = KeyboardListener(
+        self.keyboard_listener = self.backend.keyboard_listener(
             on_press=self.on_key_press,
             on_release=self.on_key_release
         )
@@ -61,10 +161,140 @@ class MacroRecorder:
         if self.keyboard_listener:
             self.keyboard_listener.stop()
         
+        # Flush everything still sitting in the capture rings
+        if self.capture_drain:
+            self.capture_drain.stop()
+            stats = self.capture_drain.stats()
+            if stats['overflow']:
+                print(f"⚠️ Capture buffer overflowed, {stats['overflow']} events dropped "
+                      f"(high-water {stats['high_water']})")
+        
+        if self.move_simplifier:
+            self.move_simplifier.flush()
+            self.last_simplify_stats = self.move_simplifier.stats()
+            self.move_simplifier = None
+        
+        if self.journal:
+            self._close_journal()
+        
         # Remove last 2 seconds of events to avoid capturing stop action
         self.remove_last_seconds(2.0)
         
+        if self.simplify_mode == 'post':
+            self.simplify_events()
+        
         print(f"Recording stopped. Captured {len(self.events)} events.")
+        if self.last_simplify_stats:
+            print(f"Mouse path simplified {self.last_simplify_stats['ratio']:.1f}x "
+                  f"({self.last_simplify_stats['moves_before']} -> {self.last_simplify_stats['moves_after']} moves)")
+    
+    def set_simplification(self, mode=None, tolerance_px=2.0, tolerance_ms=30.0):
+        """Configure mouse path simplification ('online', 'post' or None to disable)"""
+        if mode not in (None, 'online', 'post'):
+            raise ValueError(f"Unknown simplification mode: {mode}")
+        self.simplify_mode = mode
+        self.simplify_tolerance_px = float(tolerance_px)
+        self.simplify_tolerance_ms = float(tolerance_ms)
+    
+    def simplify_events(self, tolerance_px=None, tolerance_ms=None):
+        """Drop mouse moves not needed to reproduce the path; returns the compression stats"""
+        if tolerance_px is None:
+            tolerance_px = self.simplify_tolerance_px
+        if tolerance_ms is None:
+            tolerance_ms = self.simplify_tolerance_ms
+        self.events, self.last_simplify_stats = simplify_moves(self.events, tolerance_px, tolerance_ms)
+        return self.last_simplify_stats
+    
+    def set_journal(self, folder=None, journal_format='binary'):
+        """Stream recordings to an append-only journal in folder ('jsonl' or 'binary'; None disables)"""
+        if journal_format not in JOURNAL_FORMATS:
+            raise ValueError(f"Unknown journal format: {journal_format}")
+        self.journal_dir = folder or None
+        self.journal_format = journal_format
+    
+    def set_mrec_encoding(self, encoding):
+        """Choose the .mrec event encoding used by save_macro ('records' or 'delta')"""
+        if encoding not in MREC_ENCODINGS:
+            raise ValueError(f"Unknown .mrec encoding: {encoding}")
+        self.mrec_encoding = encoding
+    
+    def _open_journal(self):
+        try:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            name = f"recording-{datetime.now():%Y%m%d-%H%M%S}{JOURNAL_FORMATS[self.journal_format]}"
+            self.journal = RecordingJournal(os.path.join(self.journal_dir, name))
+            self.journal.start()
+            print(f"📝 Journaling recording to {self.journal.path}")
+        except Exception as e:
+            print(f"❌ Cannot open recording journal, recording in memory only: {e}")
+            self.journal = None
+    
+    def _close_journal(self):
+        """Write out the last rows, close the journal and rebuild the recording from it.
+
+        After a journal error the recording is the part of the journal that
+        was flushed, then the batches the writer could not store, then the
+        rows kept in memory since the error.
+        """
+        journal = self.journal
+        self._journal_rows()
+        journal.close()
+        self.journal = None
+        self.last_journal_stats = journal.stats()
+        try:
+            events, _ = recover_journal(journal.path)
+        except Exception as e:
+            print(f"❌ Cannot read back recording journal {journal.path}: {e}")
+            if journal.error is None:
+                return
+            events = EventStore()
+        if journal.error is None:
+            self.events = events
+            os.remove(journal.path)
+            return
+        
+        print(f"⚠️ Recording journal kept at {journal.path} after an error; "
+              f"the rest of the recording was kept in memory")
+        if len(events) < journal.events:
+            print(f"❌ {journal.events - len(events)} journaled events could not be read back")
+        del events[journal.events:]
+        for batch in journal.unwritten + [self.events]:
+            events.extend(batch.iter_dicts(integer_timestamps=True))
+        self.events = events
+    
+    def _journal_rows(self):
+        """Hand the rows stored since the last call to the journal and drop them from memory.
+
+        Once the journal has failed the rows stay in memory instead.
+        """
+        events = self.events
+        if events and self.journal.error is None:
+            self.journal.append(events[:])
+            del events[:]
+    
+    def find_unfinished_journals(self):
+        """Journals left behind by recordings that never stopped cleanly (newest first)"""
+        return find_journals(self.journal_dir)
+    
+    def recover_journal(self, path, discard=True):
+        """Load the events of a leftover journal as the current macro"""
+        try:
+            self.events, info = recover_journal(path)
+            state = "complete" if info['complete'] else "partial"
+            print(f"🩹 Recovered {info['events']} events from {state} journal {path}"
+                  + (f" ({info['discarded_bytes']} torn bytes skipped)" if info['discarded_bytes'] else ""))
+            if discard:
+                os.remove(path)
+            return True
+        except Exception as e:
+            print(f"Error recovering journal: {e}")
+            return False
+    
+    def get_capture_stats(self):
+        """Overflow and high-water counters of the last recording's capture buffers"""
+        if not self.capture_drain:
+            return None
+        return self.capture_drain.stats()
     
     def remove_last_seconds(self, seconds):
         """Remove events from the last N seconds of recording"""
@@ -72,353 +302,477 @@ class MacroRecorder:
             return
         
         # Get the timestamp of the last event
-        last_timestamp = self.events[-1]['timestamp']
-        cutoff_timestamp = last_timestamp - seconds
+        cutoff_us = self.events.timestamps[-1] - seconds_to_us(seconds)
         
-        # Filter out events after the cutoff
-        original_count = len(self.events)
-        self.events = [event for event in self.events if event['timestamp'] <= cutoff_timestamp]
-        
-        removed_count = original_count - len(self.events)
+        # Events are time-ordered, so drop everything after the cutoff in one slice
+        removed_count = self.events.remove_after(cutoff_us)
         if removed_count > 0:
             print(f"Removed {removed_count} events from last {seconds} seconds")
     
+    def _store_captured(self, batch):
+        """Drain-thread sink: convert raw captured tuples into stored events"""
+        events = self.events
+        start_ns = self.start_ns
+        simplifier = self.move_simplifier
+        last_us = self._last_capture_us
+        
+        for item in batch:
+            event_type = item[0]
+            # Rings are merged by timestamp, but a callback can stamp its event just
+            # before another ring's batch was taken; never let time run backwards
+            timestamp_us = max((item[1] - start_ns) // NS_PER_US, last_us)
+            last_us = timestamp_us
+            
+            if event_type == MOUSE_MOVE:
+                if simplifier:
+                    simplifier.add(timestamp_us, int(item[2]), int(item[3]))
+                else:
+                    events.append_raw(MOUSE_MOVE, timestamp_us, int(item[2]), int(item[3]))
+                continue
+            
+            if simplifier:
+                simplifier.flush()
+            
+            if event_type == MOUSE_CLICK:
+                events.append_raw(
+                    MOUSE_CLICK, timestamp_us, int(item[2]), int(item[3]),
+                    button_id=events.intern_button(self.backend.button_name(item[4])),
+                    pressed=int(item[5])
+                )
+            elif event_type == MOUSE_SCROLL:
+                events.append_raw(MOUSE_SCROLL, timestamp_us, int(item[2]), int(item[3]), int(item[4]), int(item[5]))
+            else:
+                key_id = events.intern_key(self.get_key_name(item[2]))
+                events.append_raw(event_type, timestamp_us, key_id=key_id)
+        
+        self._last_capture_us = last_us
+        if self.journal:
+            self._journal_rows()
+    
     def on_mouse_move(self, x, y):
         """Record mouse movement events"""
         if self.recording:
-            timestamp = time.time() - self.start_time
-            event = {
-                'type': 'mouse_move',
-                'timestamp': timestamp,
-                'x': x,
-                'y': y
-            }
-            self.events.append(event)
+            self.mouse_ring.push((MOUSE_MOVE, self._now_ns(), x, y))
     
     def on_mouse_click(self, x, y, button, pressed):
         """Record mouse click events"""
         if self.recording:
-            timestamp = time.time() - self.start_time
-            event = {
-                'type': 'mouse_click',
-                'timestamp': timestamp,
-                'x': x,
-                'y': y,
-                'button': button.name,
-                'pressed': pressed
-            }
-            self.events.append(event)
+            self.mouse_ring.push((MOUSE_CLICK, self._now_ns(), x, y, button, pressed))
     
     def on_mouse_scroll(self, x, y, dx, dy):
         """Record mouse scroll events"""
         if self.recording:
-            timestamp = time.time() - self.start_time
-            event = {
-                'type': 'mouse_scroll',
-                'timestamp': timestamp,
-                'x': x,
-                'y': y,
-                'dx': dx,
-                'dy': dy
-            }
-            self.events.append(event)
+            self.mouse_ring.push((MOUSE_SCROLL, self._now_ns(), x, y, dx, dy))
     
     def on_key_press(self, key):
         """Record key press events"""
         if self.recording:
-            timestamp = time.time() - self.start_time
-            key_name = self.get_key_name(key)
-            event = {
-                'type': 'key_press',
-                'timestamp': timestamp,
-                'key': key_name
-            }
-            self.events.append(event)
+            self.keyboard_ring.push((KEY_PRESS, self._now_ns(), key))
     
     def on_key_release(self, key):
         """Record key release events"""
         if self.recording:
-            timestamp = time.time() - self.start_time
-            key_name = self.get_key_name(key)
-            event = {
-                'type': 'key_release',
-                'timestamp': timestamp,
-                'key': key_name
-            }
-            self.events.append(event)
+            self.keyboard_ring.push((KEY_RELEASE, self._now_ns(), key))
             
             # Stop recording on Esc key (optional safety feature)
-            if key == Key.esc:
+            if self.backend.key_name(key) == 'esc':
                 self.stop_recording()
                 return False
     
     def get_key_name(self, key):
         """Convert key object to string representation"""
-        try:
-            return key.char
-        except AttributeError:
-            return str(key).replace('Key.', '')
+        return self.backend.key_name(key)
     
     def play_macro_with_trigger(self, trigger_key, repeat_interval=60, loop=False, status_callback=None):
-        """Play recorded macro when trigger key is pressed"""
-        if not self.events:
-            print("No events to play")
+        """Play recorded macro when trigger key is pressed.
+
+        Standalone version with its own listener; the GUI arms triggers on its
+        hotkey listener instead (arm_trigger/fire_trigger).
+        """
+        self._require_recording()
+        if not self.arm_trigger(repeat_interval, loop, status_callback, end_session=True):
             return
         
-        self.playing = True
-        self.should_stop = False
-        
         if status_callback:
             status_callback(f"Waiting for trigger key '{trigger_key}' - Press in  to start!")
         
         # Set up trigger listener
         def on_trigger_press(key):
             try:
-                if hasattr(key, 'char') and key.char and key.char.lower() == trigger_key.lower():
-                    return self.start_macro_playback(repeat_interval, loop, status_callback)
-                elif hasattr(key, 'name') and key.name.lower() == trigger_key.lower():
-                    return self.start_macro_playback(repeat_interval, loop, status_callback)
-                elif str(key).replace('Key.', '').lower() == trigger_key.lower():
-                    return self.start_macro_playback(repeat_interval, loop, status_callback)
-            except:
+                key_name = self.backend.key_name(key)
+                if key_name and key_name.lower() == trigger_key.lower():
+                    self.fire_trigger()
+                    return False  # Stop the trigger listener
+            except Exception:
                 pass
             return True
         
         # Start trigger listener
-        trigger_listener = KeyboardListener(on_press=on_trigger_press)
+        trigger_listener = self.backend.keyboard_listener(on_press=on_trigger_press)
         trigger_listener.start()
         
-        # Wait for trigger or stop signal
-        while self.playing and not self.should_stop:
-            time.sleep(0.1)
+        # Sleep until stopped; the triggered run sets the event when it is done
+        self.stop_event.wait()
         
         # Clean up
         trigger_listener.stop()
         if status_callback:
             status_callback("Macro playback stopped")
     
-    def start_macro_playback(self, repeat_interval, loop, status_callback):
-        """Start the actual macro playback immediately after trigger"""
+    def arm_trigger(self, repeat_interval=60, loop=False, status_callback=None, end_session=False):
+        """Get ready to play on fire_trigger(); compiles now so the trigger only has to start the run"""
+        if not self.events:
+            print("No events to play")
+            return False
+        
+        self._begin_playback()
+        self.get_playback_engine()
+        self.compile()
+        self._armed_trigger = (repeat_interval, loop, status_callback, end_session)
+        return True
+    
+    def fire_trigger(self):
+        """Start the armed playback on the worker thread; safe to call from an input hook.
+
+        Returns False if nothing is armed.
+        """
+        trigger_ns = self._now_ns()
+        armed = self._armed_trigger
+        if armed is None or self.stop_event.is_set():
+            return False
+        self._armed_trigger = None
+        repeat_interval, loop, status_callback, end_session = armed
         if status_callback:
             status_callback("Trigger detected! Starting macro immediately...")
-        
-        # Start the macro playback immediately
-        self.play_macro(repeat_interval, loop, status_callback)
-        return False  # Stop the trigger listener
+        self.playback_worker.submit(self._play, repeat_interval, loop, status_callback,
+                                    None, trigger_ns, end_session)
+        return True
+    
+    def disarm_trigger(self):
+        self._armed_trigger = None
+    
+    def start_playback(self, repeat_interval=60, loop=False, status_callback=None, trigger_ns=None):
+        """Play on the worker thread and return immediately"""
+        if not self.events:
+            print("No events to play")
+            return False
+        self._begin_playback()
+        self.playback_worker.submit(self._play, repeat_interval, loop, status_callback, None, trigger_ns)
+        return True
     
-    def play_macro(self, repeat_interval=60, loop=False, status_callback=None):
-        """Play recorded macro with optional looping"""
+    def get_trigger_latency(self):
+        """Trigger-to-first-event latency of the last triggered run, in ms"""
+        return self.last_trigger_latency
+    
+    def play_macro(self, repeat_interval=60, loop=False, status_callback=None,
+                   speed=None, gap_threshold=None, compressed_gap=None, max_move_rate=None):
+        """Play recorded macro with optional looping.
+
+        speed/gap_threshold/compressed_gap/max_move_rate override the recorder's
+        playback options for this call.
+        """
         if not self.events:
             print("No events to play")
             return
         
+        self._begin_playback()
+        self._play(repeat_interval, loop, status_callback,
+                   (speed, gap_threshold, compressed_gap, max_move_rate))
+    
+    def _begin_playback(self):
         self.playing = True
         self.should_stop = False
+        self.stop_event.clear()
+    
+    def _play(self, repeat_interval, loop, status_callback, options=None, trigger_ns=None, end_session=False):
+        """Playback loop shared by play_macro and the worker thread"""
+        if self.stop_event.is_set():
+            # Stopped between being handed over and starting
+            if end_session:
+                self.stop_event.set()
+            return
         
         iteration = 1
         
         try:
+            # Compile once (or reuse the cached plan); every iteration runs the same plan
+            engine = self.get_playback_engine()
+            plan = self.compile(*(options or ()))
+            if not plan.streamed and len(plan) < plan.event_count:
+                print(f"🖱️ Injecting {len(plan)} of {plan.event_count} events (mouse moves coalesced)")
+            
+            schedule = None
+            if loop and self.loop_mode == LOOP_FIXED_RATE:
+                schedule = LoopSchedule(int(float(repeat_interval) * NS_PER_SECOND), self._now_ns(),
+                                        self.overrun_policy)
+                self.last_loop_stats = schedule.stats()
+            
             while self.playing and not self.should_stop:
+                if schedule:
+                    schedule.started(self._now_ns())
+                    self.last_loop_stats = schedule.stats()
                 if status_callback:
                     status_callback(f"Playing macro - Iteration {iteration}")
                 
                 # Play the sequence once
-                self.play_sequence()
+                self._run_plan(engine, plan)
+                if trigger_ns is not None and iteration == 1:
+                    self._report_trigger_latency(engine, trigger_ns)
                 
                 if not loop:
                     break
                 
                 iteration += 1
                 
+                if schedule:
+                    # Fixed rate: wait for the next slot on the grid, not for a fixed gap
+                    next_start_ns = schedule.advance(self._now_ns())
+                    self.last_loop_stats = stats = schedule.stats()
+                    if status_callback:
+                        wait_s = max(next_start_ns - self._now_ns(), 0) / NS_PER_SECOND
+                        status_callback(f"Next iteration in {wait_s:.1f}s "
+                                        f"(start error {stats['last_error_ms']:.1f} ms, "
+                                        f"max {stats['max_error_ms']:.1f} ms, skipped {stats['skipped']})")
+                    self._wait_until(next_start_ns)
+                    continue
+                
                 # Wait for the specified interval before repeating
                 if status_callback:
-                    status_callback(f"Waiting {repeat_interval}s before next iteration...")
+                    jitter = ""
+                    if self.last_playback_stats:
+                        jitter = f" (p99 lateness {self.last_playback_stats['p99_ms']:.1f} ms)"
+                    status_callback(f"Waiting {repeat_interval}s before next iteration...{jitter}")
                 
-                # Break the wait into smaller chunks to check for stop signal
-                wait_time = 0
-                while wait_time < repeat_interval and self.playing and not self.should_stop:
-                    time.sleep(0.1)
-                    wait_time += 0.1
+                self._wait(repeat_interval)
                 
         except Exception as e:
             print(f"Error during playback: {e}")
         finally:
             self.playing = False
+            if end_session:
+                # The trigger session is over: wake play_macro_with_trigger
+                self.stop_event.set()
             if status_callback:
                 status_callback("Macro playback stopped")
     
+    def _report_trigger_latency(self, engine, trigger_ns):
+        """Trigger to run start, and to the first event (minus its recorded offset)"""
+        to_start_ns = engine.last_start_ns - trigger_ns
+        stats = engine.last_stats
+        first_late_ns = stats.samples[0] if stats is not None and len(stats) else 0
+        self.last_trigger_latency = {
+            'trigger_to_start_ms': to_start_ns / 1e6,
+            'trigger_to_first_event_ms': (to_start_ns + first_late_ns) / 1e6,
+        }
+        print(f"⚡ Trigger to first event: {self.last_trigger_latency['trigger_to_first_event_ms']:.2f} ms")
+    
     def play_sequence(self):
         """Play the recorded sequence once"""
         if not self.events:
             return
         
-        # Initialize controllers
-        mouse_controller = mouse.Controller()
-        keyboard_controller = keyboard.Controller()
-        
-        # Track pressed keys to ensure they're released
-        pressed_keys = set()
-        pressed_buttons = set()
-        
-        start_time = time.time()
-        
-        for event in self.events:
-            if self.should_stop or not self.playing:
-                break
-            
-            # Wait for the correct timing
-            target_time = start_time + event['timestamp']
-            current_time = time.time()
-            
-            if target_time > current_time:
-                time.sleep(target_time - current_time)
-            
-            # Execute the event
-            try:
-                if event['type'] == 'mouse_move':
-                    mouse_controller.position = (event['x'], event['y'])
-                
-                elif event['type'] == 'mouse_click':
-                    mouse_controller.position = (event['x'], event['y'])
-                    button = getattr(Button, event['button'])
-                    
-                    if event['pressed']:
-                        mouse_controller.press(button)
-                        pressed_buttons.add(button)
-                    else:
-                        mouse_controller.release(button)
-                        pressed_buttons.discard(button)
-                
-                elif event['type'] == 'mouse_scroll':
-                    mouse_controller.position = (event['x'], event['y'])
-                    mouse_controller.scroll(event['dx'], event['dy'])
-                
-                elif event['type'] == 'key_press':
-                    key = self.string_to_key(event['key'])
-                    keyboard_controller.press(key)
-                    pressed_keys.add(key)
-                
-                elif event['type'] == 'key_release':
-                    key = self.string_to_key(event['key'])
-                    keyboard_controller.release(key)
-                    pressed_keys.discard(key)
-                
-                elif event['type'] == 'delay':
-                    # Handle delay events - wait for the specified duration
-                    duration = event.get('duration', 1.0)
-                    description = event.get('description', '')
-                    if description:
-                        print(f"⏰ Delay: {duration}s - {description}")
-                    else:
-                        print(f"⏰ Waiting {duration} seconds...")
-                    
-                    # Break the delay into smaller chunks to check for stop signal
-                    wait_time = 0
-                    while wait_time < duration and self.playing and not self.should_stop:
-                        time.sleep(0.1)
-                        wait_time += 0.1
-                    
-            except Exception as e:
-                print(f"Error executing event: {e}")
-                continue
-        
-        # Ensure all keys and buttons are released after sequence
-        for key in pressed_keys:
-            try:
-                keyboard_controller.release(key)
-            except:
-                pass
-        
-        for button in pressed_buttons:
-            try:
-                mouse_controller.release(button)
-            except:
-                pass
+        self._run_plan(self.get_playback_engine(), self.compile())
+    
+    def set_timing_mode(self, mode=TIMING_POWER_SAVING, spin_margin_ms=DEFAULT_SPIN_MARGIN_MS):
+        """Choose playback timing: 'power_saving' or 'precise' (spins the last spin_margin_ms)"""
+        if mode not in TIMING_MODES:
+            raise ValueError(f"Unknown timing mode: {mode}")
+        self.timing_mode = mode
+        self.spin_margin_ms = float(spin_margin_ms)
+        if self.playback_engine is not None:
+            self.playback_engine.set_timing(mode, self.spin_margin_ms)
+    
+    def _run_plan(self, engine, plan):
+        """Run a compiled plan once and keep its lateness stats"""
+        engine.run(plan, self.clock, self.stop_event)
+        stats = engine.last_stats
+        if stats is not None and len(stats):
+            self.last_playback_stats = stats.summary()
+            print(f"⏱️ Playback {stats.format()}")
+        return self.last_playback_stats
+    
+    def get_playback_stats(self):
+        """Lateness summary (p50/p99/max/mean in ms and a histogram) of the last run"""
+        return self.last_playback_stats
+    
+    def set_time_warp(self, speed=1.0, gap_threshold=0.0, compressed_gap=1.0):
+        """Play at speed x (0.25-20) and squeeze gaps longer than gap_threshold s to compressed_gap s"""
+        PlaybackEngine.check_warp(speed, gap_threshold, compressed_gap)
+        self.playback_speed = float(speed)
+        self.gap_threshold = float(gap_threshold or 0)
+        self.compressed_gap = float(compressed_gap or 0)
+    
+    def set_move_rate(self, max_move_rate=0):
+        """Inject at most max_move_rate mouse moves per second (0 disables coalescing)"""
+        max_move_rate = float(max_move_rate or 0)
+        if max_move_rate < 0:
+            raise ValueError("Move rate cannot be negative")
+        self.max_move_rate = max_move_rate
+    
+    def _move_rate(self, max_move_rate):
+        """Requested move rate, capped at what the backend can inject"""
+        limit = self.backend.max_move_rate
+        if limit and (not max_move_rate or max_move_rate > limit):
+            return float(limit)
+        return max_move_rate
+    
+    def set_loop_mode(self, mode=LOOP_FIXED_DELAY, overrun_policy=OVERRUN_SKIP):
+        """Choose 'fixed_delay' or 'fixed_rate' looping and the fixed-rate overrun policy"""
+        if mode not in LOOP_MODES:
+            raise ValueError(f"Unknown loop mode: {mode}")
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy: {overrun_policy}")
+        self.loop_mode = mode
+        self.overrun_policy = overrun_policy
+    
+    def get_loop_stats(self):
+        """Start-error metrics of the current or last fixed-rate loop"""
+        return self.last_loop_stats
+    
+    def set_backend(self, backend):
+        """Switch input backend (instance or name: 'pynput', 'xdotool', 'null', 'synthetic')"""
+        if self.recording or self.playing:
+            raise RuntimeError("Cannot switch input backend while recording or playing")
+        if not isinstance(backend, InputBackend):
+            backend = create_backend(backend, clock=self.clock)
+        if not backend.can_inject:
+            raise ValueError(f"The {backend.name} input backend cannot play macros")
+        self.backend = backend
+        # Controllers and compiled plans belong to the old backend
+        self.playback_engine = None
+        self._plan = None
+    
+    @property
+    def can_record(self):
+        """False when the input backend is playback-only (e.g. xdotool)"""
+        return self.backend.can_record
+    
+    def _require_recording(self):
+        if not self.backend.can_record:
+            raise RuntimeError(f"The {self.backend.name} input backend can only play macros; "
+                               f"switch to pynput to record")
+    
+    def get_playback_engine(self):
+        """Playback engine with controllers created once and reused for every run"""
+        if self.playback_engine is None:
+            self.playback_engine = PlaybackEngine(
+                self.backend.mouse_controller(), self.backend.keyboard_controller(),
+                self.backend.resolve_key, self.backend.resolve_button
+            )
+            self.playback_engine.set_timing(self.timing_mode, self.spin_margin_ms)
+        return self.playback_engine
+    
+    def compile(self, speed=None, gap_threshold=None, compressed_gap=None, max_move_rate=None):
+        """Compile events into a PlaybackPlan, cached until the events or the playback options change.
+
+        A memory-mapped macro gets a PlaybackStream instead, which reads the
+        events from disk while playing.
+        """
+        events = self.events
+        warp = (
+            self.playback_speed if speed is None else float(speed),
+            self.gap_threshold if gap_threshold is None else float(gap_threshold),
+            self.compressed_gap if compressed_gap is None else float(compressed_gap),
+            self._move_rate(self.max_move_rate if max_move_rate is None else float(max_move_rate)),
+        )
+        if (self._plan is None or self._plan_source is not events
+                or self._plan_version != events.version or self._plan_warp != warp):
+            engine = self.get_playback_engine()
+            cached = self._cached_macro
+            cache_key = cached[2] if cached and cached[0] is events and cached[1] == events.version else None
+            plan = self.macro_cache.get_plan(cache_key, engine, warp) if cache_key else None
+            if plan is None:
+                # A mapped macro is streamed; compiling it would hold every step in memory
+                build = engine.stream if isinstance(events, MappedEventStore) and events.mapped else engine.compile
+                plan = build(events, *warp)
+                if cache_key:
+                    self.macro_cache.put_plan(cache_key, engine, warp, plan)
+            self._plan = plan
+            self._plan_source = events
+            self._plan_version = events.version
+            self._plan_warp = warp
+        return self._plan
+    
+    def _wait(self, seconds):
+        """Wait on the monotonic clock; returns False if stopped first"""
+        return self._wait_until(self._now_ns() + int(float(seconds) * NS_PER_SECOND))
+    
+    def _wait_until(self, deadline_ns):
+        """Wait until a monotonic deadline; returns False if stopped first"""
+        return self.clock.wait_until(deadline_ns, self.stop_event)
     
     def string_to_key(self, key_string):
         """Convert string representation back to key object"""
-        # Handle special keys
-        special_keys = {
-            'alt': Key.alt,
-            'alt_l': Key.alt_l,
-            'alt_r': Key.alt_r,
-            'backspace': Key.backspace,
-            'caps_lock': Key.caps_lock,
-            'cmd': Key.cmd,
-            'cmd_l': Key.cmd_l,
-            'cmd_r': Key.cmd_r,
-            'ctrl': Key.ctrl,
-            'ctrl_l': Key.ctrl_l,
-            'ctrl_r': Key.ctrl_r,
-            'delete': Key.delete,
-            'down': Key.down,
-            'end': Key.end,
-            'enter': Key.enter,
-            'esc': Key.esc,
-            'f1': Key.f1, 'f2': Key.f2, 'f3': Key.f3, 'f4': Key.f4,
-            'f5': Key.f5, 'f6': Key.f6, 'f7': Key.f7, 'f8': Key.f8,
-            'f9': Key.f9, 'f10': Key.f10, 'f11': Key.f11, 'f12': Key.f12,
-            'home': Key.home,
-            'left': Key.left,
-            'page_down': Key.page_down,
-            'page_up': Key.page_up,
-            'right': Key.right,
-            'shift': Key.shift,
-            'shift_l': Key.shift_l,
-            'shift_r': Key.shift_r,
-            'space': Key.space,
-            'tab': Key.tab,
-            'up': Key.up
-        }
-        
-        if key_string in special_keys:
-            return special_keys[key_string]
-        else:
-            # Regular character
-            return key_string
+        return self.backend.resolve_key(key_string)
+    
+    def string_to_button(self, button_name):
+        """Convert a button name back to the backend's button object"""
+        return self.backend.resolve_button(button_name)
     
     def stop_all(self):
         """Stop all recording and playback operations"""
         self.should_stop = True
         self.playing = False
+        self.stop_event.set()
+        self._armed_trigger = None
         self.stop_recording()
     
     def save_macro(self, filename):
-        """Save recorded events to a JSON file"""
+        """Save recorded events to a .json or binary .mrec file, optionally .gz/.xz compressed (chosen by extension)"""
         try:
-            data = {
-                'events': self.events,
-                'created_at': datetime.now().isoformat(),
-                'total_events': len(self.events),
-                'duration': self.events[-1]['timestamp'] if self.events else 0
-            }
-            
-            with open(filename, 'w') as f:
-                json.dump(data, f, indent=2)
-            
+            save_events(self.events, filename, encoding=self.mrec_encoding)
+            self._cache_macro(filename, self.events)
             print(f"Macro saved to {filename}")
             return True
         except Exception as e:
+            self.last_file_error = str(e)
             print(f"Error saving macro: {e}")
             return False
     
-    def load_macro(self, filename):
-        """Load events from a JSON file"""
+    def load_macro(self, filename, mapped=True):
+        """Load events from a .json or binary .mrec file, optionally .gz/.xz compressed (chosen by extension).
+
+        Uncompressed .mrec files are memory-mapped unless mapped=False: events are decoded
+        on access and playback streams them from disk. Other files go through the macro
+        cache, so loading one again while it is unchanged on disk skips the parse.
+        """
         try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-            
-            self.events = data.get('events', [])
+            key = file_key(filename)
+            events = self.macro_cache.get(key)
+            if events is None:
+                events = load_events(filename, mapped)
+                self._cache_macro(filename, events, key)
+            else:
+                self._cached_macro = (events, events.version, key)
+            self.events = events
             print(f"Macro loaded from {filename} - {len(self.events)} events")
             return True
         except Exception as e:
+            self.last_file_error = str(e)
             print(f"Error loading macro: {e}")
             return False
     
+    def _cache_macro(self, filename, events, key=None):
+        """Remember events as the contents of filename (mapped macros stay on disk)"""
+        self._cached_macro = None
+        if isinstance(events, MappedEventStore):
+            return
+        key = key or file_key(filename)
+        self.macro_cache.put(key, events)
+        self._cached_macro = (events, events.version, key)
+    
+    def set_cache_budget(self, max_mb):
+        """Memory budget of the macro cache in MB (0 disables it)"""
+        self.macro_cache.set_max_bytes(int(float(max_mb) * 1024 * 1024))
+    
+    def get_cache_stats(self):
+        """Entries, bytes and hit/miss/eviction counters of the macro cache"""
+        return self.macro_cache.stats()
+    
     def get_macro_info(self):
         """Get information about the current macro"""
         if not self.events:
             return "No macro loaded"
         
-        duration = self.events[-1]['timestamp'] if self.events else 0
+        duration = self.events.duration
         return f"{len(self.events)} events, {duration:.2f} seconds duration"
@@ -0,0 +1,341 @@
+"""
+Macro Tools for  Macro Recorder
+Headless bulk processing of macro files across worker processes
+Run: python macro_tools.py <validate|stats|convert|optimize> PATH... [--jobs N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from event_store import EVENT_TYPES, KEY_PRESS, KEY_RELEASE, MOUSE_CLICK, TYPE_FIELDS, US_PER_SECOND
+from macro_file import MACRO_FORMAT_VERSION, MREC_ENCODINGS, is_mrec, open_stream, split_codec
+from macro_library import is_macro_file
+from macro_recorder import MacroRecorder
+
+# Problems listed per file before the rest are only counted
+MAX_PROBLEMS = 20
+
+# One recorder per worker process, created by _init_worker
+_recorder = None
+
+
+class InvalidMacro(ValueError):
+    """Validation failure that still carries the per-file result"""
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+def find_macros(paths):
+    """Macro files named directly or found under the given directories, sorted"""
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                found.update(os.path.join(folder, name) for name in names if is_macro_file(name))
+        else:
+            found.add(path)
+    return sorted(found)
+
+
+def output_path(path, options, suffix):
+    """Where a converted/optimized file goes: --out DIR (mirroring the input tree) or beside the input.
+
+    Under --out, a file found in one of the input folders (options['roots'])
+    keeps its path relative to the innermost of them; files named directly
+    land in DIR itself.
+    """
+    base = os.path.basename(path)
+    if options.get('out'):
+        roots = [root for root in options.get('roots', ()) if _is_inside(path, root)]
+        relative = os.path.relpath(path, max(roots, key=len)) if roots else base
+        return os.path.join(options['out'], os.path.dirname(relative), suffix(base))
+    return os.path.join(os.path.dirname(path), suffix(base))
+
+
+def _is_inside(path, root):
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        # Different drives, or a relative and an absolute path
+        return False
+
+
+def target_path(command, path, options):
+    """File a command writes for path, or None if it only reads"""
+    if command == 'convert':
+        return output_path(path, options, lambda name: strip_macro_extension(name) + options['to'])
+    if command == 'optimize':
+        return output_path(path, options, lambda name: name) if options.get('out') else path
+    return None
+
+
+def strip_macro_extension(name):
+    name = split_codec(name)[0]
+    for extension in ('.json', '.mrec'):
+        if name.lower().endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
+def _load(path):
+    if not _recorder.load_macro(path):
+        raise ValueError(_recorder.last_file_error or "cannot load macro")
+    return _recorder.events
+
+
+def _save(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if not _recorder.save_macro(path):
+        raise ValueError(_recorder.last_file_error or "cannot save macro")
+
+
+# ---------------- Commands ---------------- #
+def check_json_schema(path):
+    """Structural problems of a JSON macro: header fields and per-event required fields"""
+    with open_stream(path, 'r', split_codec(path)[1]) as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get('events'), list):
+        return ["top level must be an object with an 'events' list"]
+    problems = []
+    version = data.get('format_version', 1)
+    if not isinstance(version, int) or version > MACRO_FORMAT_VERSION:
+        problems.append(f"unsupported format_version {version!r}")
+    if 'total_events' in data and data['total_events'] != len(data['events']):
+        problems.append(f"total_events is {data['total_events']} but the file has {len(data['events'])} events")
+    for i, event in enumerate(data['events']):
+        if not isinstance(event, dict):
+            problems.append(f"event {i}: not an object")
+            continue
+        event_type = event.get('type')
+        if event_type not in TYPE_FIELDS:
+            problems.append(f"event {i}: unknown type {event_type!r}")
+            continue
+        timestamp = event.get('timestamp_us', event.get('timestamp'))
+        if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+            problems.append(f"event {i}: missing or non-numeric timestamp")
+        missing = [field for field in TYPE_FIELDS[event_type] if field not in event]
+        if missing:
+            problems.append(f"event {i} ({event_type}): missing {', '.join(missing)}")
+    return problems
+
+
+def check_events(store):
+    """Problems visible in the loaded events: unknown types, time going backwards, unresolved keys/buttons"""
+    problems = []
+    for name in store.type_names[len(EVENT_TYPES):]:
+        problems.append(f"unknown event type {name!r}")
+    previous = 0
+    for i, (type_id, timestamp, _, _, _, _, key, button, pressed, _) in enumerate(store.rows()):
+        if timestamp < previous:
+            problems.append(f"event {i}: timestamp goes back {(previous - timestamp) / 1000:.1f} ms")
+        previous = timestamp
+        if type_id in (KEY_PRESS, KEY_RELEASE) and key < 0:
+            problems.append(f"event {i}: key event without a key")
+        elif type_id == MOUSE_CLICK and (button < 0 or pressed < 0):
+            problems.append(f"event {i}: click without a button or pressed state")
+    return problems
+
+
+def validate_file(path, options):
+    problems = []
+    if not is_mrec(path):
+        problems.extend(check_json_schema(path))
+    store = _load(path)
+    problems.extend(check_events(store))
+    result = {'events': len(store), 'problems': problems[:MAX_PROBLEMS], 'problem_count': len(problems)}
+    if problems:
+        more = f" (+{len(problems) - MAX_PROBLEMS} more)" if len(problems) > MAX_PROBLEMS else ""
+        raise InvalidMacro("; ".join(problems[:3]) + more, result)
+    return result, f"{len(store):,} events, valid"
+
+
+def stats_file(path, options):
+    store = _load(path)
+    idle_us = int(options['idle_gap'] * US_PER_SECOND)
+    timestamps = store.timestamps
+    gaps = [later - earlier for earlier, later in zip(timestamps, timestamps[1:]) if later - earlier >= idle_us]
+    counts = Counter(store.types)
+    result = {
+        'events': len(store),
+        'duration': store.duration,
+        'type_counts': {store.type_names[type_id]: count for type_id, count in sorted(counts.items())},
+        'idle_gaps': len(gaps),
+        'idle_seconds': sum(gaps) / US_PER_SECOND,
+        'longest_gap': max(gaps, default=0) / US_PER_SECOND,
+    }
+    return result, (f"{len(store):,} events, {store.duration:.1f}s, {len(gaps)} idle gaps "
+                    f"({result['idle_seconds']:.1f}s, longest {result['longest_gap']:.1f}s)")
+
+
+def convert_file(path, options):
+    target = target_path('convert', path, options)
+    if os.path.abspath(target) == os.path.abspath(path):
+        raise ValueError(f"already {options['to']}")
+    if os.path.exists(target) and not options['overwrite']:
+        raise ValueError(f"{target} exists (use --overwrite)")
+    store = _load(path)
+    _recorder.set_mrec_encoding(options['encoding'])
+    _save(target)
+    before, after = os.path.getsize(path), os.path.getsize(target)
+    result = {'output': target, 'events': len(store), 'bytes_before': before, 'bytes_after': after}
+    return result, f"-> {target} ({before / 1e3:,.0f} KB -> {after / 1e3:,.0f} KB)"
+
+
+def optimize_file(path, options):
+    target = target_path('optimize', path, options)
+    if os.path.exists(target) and target != path and not options['overwrite']:
+        raise ValueError(f"{target} exists (use --overwrite)")
+    before = len(_load(path))
+    stats = _recorder.simplify_events(options['tolerance_px'], options['tolerance_ms'])
+    _save(target)
+    result = {'output': target, 'events_before': before, 'events_after': len(_recorder.events)}
+    result.update(stats)
+    return result, (f"{before:,} -> {len(_recorder.events):,} events "
+                    f"(moves {stats['moves_before']:,} -> {stats['moves_after']:,})")
+
+
+# Command name -> per-file function(path, options) -> (result dict, summary line)
+COMMANDS = {
+    'validate': validate_file,
+    'stats': stats_file,
+    'convert': convert_file,
+    'optimize': optimize_file,
+}
+
+
+# ---------------- Workers ---------------- #
+def _init_worker():
+    global _recorder
+    # Headless: no input devices, and no cache since every file is read once
+    _recorder = MacroRecorder(backend='null')
+    _recorder.set_cache_budget(0)
+
+
+def _run_task(command, path, options):
+    """Run one command on one file; never raises, errors land in the report"""
+    started = time.perf_counter()
+    report = {'path': path, 'ok': True, 'error': None, 'result': None, 'summary': ''}
+    try:
+        # load_macro/save_macro print a line per file; progress is reported by the parent
+        with contextlib.redirect_stdout(io.StringIO()):
+            report['result'], report['summary'] = COMMANDS[command](path, options)
+    except InvalidMacro as e:
+        report.update(ok=False, error=str(e), result=e.result)
+    except Exception as e:
+        report.update(ok=False, error=str(e) or repr(e))
+    report['elapsed_s'] = time.perf_counter() - started
+    return report
+
+
+def run(command, paths, options, jobs=None, progress=print):
+    """Run a command over paths on a process pool; returns one report dict per file, in path order"""
+    reports = {}
+    total = len(paths)
+
+    def record(report):
+        reports[report['path']] = report
+        mark = "✅" if report['ok'] else "❌"
+        progress(f"[{len(reports)}/{total}] {mark} {report['path']}: {report['summary'] or report['error']}")
+
+    # Workers check for existing outputs independently, so inputs sharing an output would race
+    targets = {}
+    for path in paths:
+        target = target_path(command, path, options)
+        if target is not None:
+            targets.setdefault(os.path.abspath(target), []).append(path)
+    clashes = {path: target for target, sources in targets.items() if len(sources) > 1 for path in sources}
+    for path, target in clashes.items():
+        record({'path': path, 'ok': False, 'error': f"{len(targets[target])} input files would write {target}",
+                'result': None, 'summary': '', 'elapsed_s': 0.0})
+    paths_to_run = [path for path in paths if path not in clashes]
+
+    if jobs == 1 or len(paths_to_run) <= 1:
+        _init_worker()
+        for path in paths_to_run:
+            record(_run_task(command, path, options))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            futures = [pool.submit(_run_task, command, path, options) for path in paths_to_run]
+            for future in as_completed(futures):
+                record(future.result())
+    return [reports[path] for path in paths]
+
+
+def print_summary(command, reports, elapsed):
+    failed = [report for report in reports if not report['ok']]
+    print(f"\n📊 {command}: {len(reports) - len(failed)} ok, {len(failed)} failed, "
+          f"{len(reports)} files in {elapsed:.1f}s")
+    if command == 'stats':
+        done = [report['result'] for report in reports if report['ok']]
+        counts = Counter()
+        for result in done:
+            counts.update(result['type_counts'])
+        print(f"   {sum(result['events'] for result in done):,} events, "
+              f"{sum(result['duration'] for result in done) / 60:.1f} min recorded, "
+              f"{sum(result['idle_seconds'] for result in done) / 60:.1f} min idle")
+        for name, count in counts.most_common():
+            print(f"   {name:<14} {count:>12,}")
+    if failed:
+        print("\n❌ Errors:")
+        for report in failed:
+            print(f"   {report['path']}: {report['error']}")
+            for problem in (report['result'] or {}).get('problems', [])[3:]:
+                print(f"      {problem}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk macro tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    subparsers = {
+        'validate': commands.add_parser('validate', help="check the file schema and the events"),
+        'stats': commands.add_parser('stats', help="duration, event counts per type and idle gaps"),
+        'convert': commands.add_parser('convert', help="convert between .json and .mrec (optionally .gz/.xz)"),
+        'optimize': commands.add_parser('optimize', help="drop redundant mouse moves (path simplification)"),
+    }
+    for subparser in subparsers.values():
+        subparser.add_argument('paths', nargs='+', help="macro files or folders (searched recursively)")
+        subparser.add_argument('--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+        subparser.add_argument('--report', help="write the per-file report as JSON to this file")
+    subparsers['stats'].add_argument('--idle-gap', type=float, default=1.0, help="seconds without input counted as idle")
+    for name in ('convert', 'optimize'):
+        subparsers[name].add_argument('--out', help="output folder (mirrors the input folders)")
+        subparsers[name].add_argument('--overwrite', action='store_true', help="replace existing output files")
+    subparsers['convert'].add_argument('--to', required=True, help="target extension, e.g. .mrec, .json.gz, .mrec.xz")
+    subparsers['convert'].add_argument('--encoding', choices=MREC_ENCODINGS, default='records', help=".mrec encoding")
+    subparsers['optimize'].add_argument('--in-place', action='store_true', help="rewrite the input files")
+    subparsers['optimize'].add_argument('--tolerance-px', type=float, default=2.0)
+    subparsers['optimize'].add_argument('--tolerance-ms', type=float, default=30.0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert' and not is_macro_file('macro' + args.to):
+        parser.error(f"--to must be .json or .mrec, optionally followed by .gz or .xz (got {args.to})")
+    if args.command == 'optimize' and not (args.out or args.in_place):
+        parser.error("optimize needs --out DIR or --in-place")
+
+    paths = find_macros(args.paths)
+    if not paths:
+        print("No macro files found")
+        return 1
+    options = {key: value for key, value in vars(args).items() if key not in ('command', 'paths', 'jobs', 'report')}
+    options['roots'] = [os.path.abspath(path) for path in args.paths if os.path.isdir(path)]
+    paths = [os.path.abspath(path) for path in paths]
+
+    started = time.perf_counter()
+    reports = run(args.command, paths, options, args.jobs)
+    print_summary(args.command, reports, time.perf_counter() - started)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=2)
+    return 0 if all(report['ok'] for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
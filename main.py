@@ -17,6 +17,7 @@ from gui import (
 from gui.advanced_hotkey_manager import AdvancedHotkeyManager
 from settings_manager import SettingsManager
 from scheduler import MacroScheduler
+from macro_library import MacroLibrary
 
 class MacroRecorderGUI:
     def __init__(self, root):
@@ -42,7 +43,11 @@ class MacroRecorderGUI:
         # Initialize managers
         self.hotkey_manager = AdvancedHotkeyManager(self)
         self.movement_display = None  # Will be initialized after GUI creation
-        self.scheduler = MacroScheduler(self)
+        self.scheduler = MacroScheduler(self, clock=self.recorder.clock)
+        
+        # Macro library catalog (opened from settings) and the file the current macro came from
+        self.library = None
+        self.macro_path = None
         
         # GUI components
         self.title_section = None
@@ -122,6 +127,12 @@ class MacroRecorderGUI:
     
     def start_recording(self):
         """Start recording user actions"""
+        if not self.recorder.can_record:
+            self.status_label.configure(
+                text=f"The {self.recorder.backend.name} input backend can only play macros",
+                text_color=ThemeManager.COLORS['danger']
+            )
+            return
         self.is_recording = True
         self.record_btn.configure(text="⏹ Stop Recording", fg_color=ThemeManager.COLORS['primary_hover'])
         self.status_label.configure(text="Recording... Perform actions in ", text_color=ThemeManager.COLORS['primary'])
@@ -136,7 +147,11 @@ class MacroRecorderGUI:
         self.is_recording = False
         self.recorder.stop_recording()
         self.record_btn.configure(text="● Record", fg_color=ThemeManager.COLORS['primary'])
-        self.status_label.configure(text=f"Recording stopped. {len(self.recorder.events)} events captured", text_color=ThemeManager.COLORS['secondary'])
+        status = f"Recording stopped. {len(self.recorder.events)} events captured"
+        simplify_stats = self.recorder.last_simplify_stats
+        if simplify_stats and simplify_stats['moves_before']:
+            status += f" (mouse path simplified {simplify_stats['ratio']:.1f}x)"
+        self.status_label.configure(text=status, text_color=ThemeManager.COLORS['secondary'])
         
         # Refresh the editable movements display
         self.movement_display.refresh_display()
@@ -161,19 +176,17 @@ class MacroRecorderGUI:
             messagebox.showerror("No Trigger", "Please enter a trigger key!")
             return
         
+        # Arm on the global hotkey listener; the trigger hands playback to the recorder's worker
+        if not self.recorder.arm_trigger(interval, self.loop_var.get(), self.update_status):
+            return
+        self.hotkey_manager.register_trigger(trigger_key, self.recorder.fire_trigger)
+        self._mark_played()
+        
         self.is_playing = True
         self.play_btn.configure(text="⏸ Playing...", fg_color="#45B7AB")
         self.status_label.configure(text=f"Waiting for trigger key '{trigger_key}' in ...", text_color="#FFD93D")
-        
-        # Start playback with trigger in separate thread
-        play_thread = threading.Thread(
-            target=self.recorder.play_macro_with_trigger,
-            args=(trigger_key, interval, self.loop_var.get(), self.update_status)
-        )
-        play_thread.daemon = True
-        play_thread.start()
     
-    def start_auto_playback(self):
+    def start_auto_playback(self, trigger_ns=None):
         """Start playing macro automatically when trigger key is pressed"""
         if not self.recorder.events:
             self.status_label.configure(
@@ -201,18 +214,16 @@ class MacroRecorderGUI:
             text_color=ThemeManager.COLORS['warning']
         )
         
-        # Start direct playback in separate thread
-        play_thread = threading.Thread(
-            target=self.recorder.play_macro,
-            args=(interval, self.loop_var.get(), self.update_status)
-        )
-        play_thread.daemon = True
-        play_thread.start()
+        self._mark_played()
+        
+        # Hand playback to the recorder's worker thread
+        self.recorder.start_playback(interval, self.loop_var.get(), self.update_status, trigger_ns)
     
     def stop_all(self):
         """Stop all recording and playback"""
         self.is_recording = False
         self.is_playing = False
+        self.hotkey_manager.clear_trigger()
         self.recorder.stop_all()
         
         # Note: No need to stop updates with editable display
@@ -232,30 +243,88 @@ class MacroRecorderGUI:
         
         filename = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("JSON files", "*.json"), ("Binary macro files", "*.mrec"),
+                       ("Compressed JSON", "*.json.gz *.json.xz"),
+                       ("Compressed binary macro", "*.mrec.gz *.mrec.xz"), ("All files", "*.*")]
         )
         
         if filename:
-            self.recorder.save_macro(filename)
+            if self.recorder.save_macro(filename):
+                self.macro_path = filename
             messagebox.showinfo("Saved", f"Macro saved to {filename}")
     
     def load_macro(self):
         """Load macro from file"""
         filename = filedialog.askopenfilename(
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("Macro files", "*.json *.mrec *.json.gz *.json.xz *.mrec.gz *.mrec.xz"),
+                       ("JSON files", "*.json"), ("Binary macro files", "*.mrec"), ("All files", "*.*")]
         )
         
         if filename:
-            if self.recorder.load_macro(filename):
-                self.status_label.configure(
-                    text=f"Loaded macro with {len(self.recorder.events)} events", 
-                    text_color=ThemeManager.COLORS['secondary']
-                )
-                self.movement_display.refresh_display()
+            if self.open_macro(filename):
                 messagebox.showinfo("Loaded", f"Macro loaded from {filename}")
             else:
                 messagebox.showerror("Error", "Failed to load macro file")
     
+    def open_macro(self, filename):
+        """Load a macro file into the recorder and refresh the display"""
+        if not self.recorder.load_macro(filename):
+            return False
+        self.macro_path = filename
+        self.status_label.configure(
+            text=f"Loaded macro with {len(self.recorder.events)} events", 
+            text_color=ThemeManager.COLORS['secondary']
+        )
+        self.movement_display.refresh_display()
+        return True
+    
+    def open_library(self, folder, watch=True, poll_interval_s=2.0):
+        """Open (or switch) the macro library catalog and keep it in sync with the folder"""
+        if self.library:
+            self.library.close()
+            self.library = None
+        try:
+            self.library = MacroLibrary(folder)
+        except Exception as e:
+            print(f"❌ Cannot open macro library '{folder}': {e}")
+            return False
+        on_change = lambda stats: self.root.after(0, self.settings_panel.refresh_library_table)
+        if watch:
+            self.library.start_watching(poll_interval_s, on_change)
+        else:
+            threading.Thread(target=lambda: on_change(self.library.scan()), daemon=True).start()
+        print(f"📚 Macro library: {self.library.folder}")
+        return True
+    
+    def _mark_played(self):
+        if self.library and self.macro_path:
+            try:
+                self.library.mark_played(self.macro_path)
+            except Exception as e:
+                print(f"⚠️ Cannot update library play history: {e}")
+    
+    def offer_journal_recovery(self):
+        """Ask whether to recover the newest recording journal left by a crashed session"""
+        journals = self.recorder.find_unfinished_journals()
+        if not journals:
+            return
+        
+        newest = journals[0]
+        if not messagebox.askyesno(
+            "Recover Recording",
+            f"A recording did not finish cleanly:\n{newest}\n\nRecover its events?"
+        ):
+            return
+        
+        if self.recorder.recover_journal(newest):
+            self.status_label.configure(
+                text=f"Recovered {len(self.recorder.events)} events from an unfinished recording",
+                text_color=ThemeManager.COLORS['secondary']
+            )
+            self.movement_display.refresh_display()
+        else:
+            messagebox.showerror("Error", "Failed to recover the recording journal")
+    
     def update_status(self, message):
         """Update status label thread-safely"""
         self.root.after(0, lambda: self.status_label.configure(
@@ -266,10 +335,10 @@ class MacroRecorderGUI:
     def load_settings(self):
         """Load saved settings from file"""
         try:
-            settings = self.settings_manager.load_settings()
+            self.settings_manager.load_settings()
             
             # Apply hotkey settings
-            hotkeys = settings.get("hotkeys", {})
+            hotkeys = self.settings_manager.get_hotkeys()
             if hotkeys:
                 self.start_hotkey_var.set(hotkeys.get("start_recording", "f9"))
                 self.stop_hotkey_var.set(hotkeys.get("stop_recording", "f10"))
@@ -277,7 +346,7 @@ class MacroRecorderGUI:
                 self.stop_play_hotkey_var.set(hotkeys.get("stop_playing", "f11"))
             
             # Apply UI settings
-            ui_settings = settings.get("ui", {})
+            ui_settings = self.settings_manager.get_ui_settings()
             if ui_settings:
                 self.interval_var.set(ui_settings.get("repeat_interval", "60"))
                 self.loop_var.set(ui_settings.get("loop_continuously", True))
@@ -288,7 +357,7 @@ class MacroRecorderGUI:
                     self.root.geometry(geometry)
             
             # Apply scheduler settings
-            scheduler_settings = settings.get("scheduler", {})
+            scheduler_settings = self.settings_manager.get_scheduler_settings()
             enabled = scheduler_settings.get("enabled", False)
             schedules = scheduler_settings.get("schedules", [])
             self.scheduler.set_schedules(schedules)
@@ -296,6 +365,84 @@ class MacroRecorderGUI:
             if hasattr(self.settings_panel, 'set_scheduler_state'):
                 self.settings_panel.set_scheduler_state(enabled, schedules)
             
+            # Apply input backend (pynput unless configured otherwise, e.g. "xdotool")
+            backend = self.settings_manager.get_input_backend()
+            if backend != self.recorder.backend.name:
+                try:
+                    self.recorder.set_backend(backend)
+                    print(f"🎛️ Input backend: {backend}")
+                except Exception as e:
+                    print(f"❌ Cannot use input backend '{backend}': {e}")
+            # Playback-only backends (xdotool) cannot record
+            self.record_btn.configure(state="normal" if self.recorder.can_record else "disabled")
+            
+            # Apply recording settings
+            recording = self.settings_manager.get_recording_settings()
+            simplify_mode = recording.get("simplify_mode", "off")
+            self.recorder.set_simplification(
+                None if simplify_mode in (None, "off") else simplify_mode,
+                recording.get("simplify_tolerance_px", 2.0),
+                recording.get("simplify_tolerance_ms", 30.0)
+            )
+            # Crash-safe recording: stream captured events to a journal on disk
+            try:
+                self.recorder.set_journal(
+                    recording.get("journal_dir", "journals") if recording.get("journal", False) else None,
+                    recording.get("journal_format", "binary")
+                )
+            except ValueError as e:
+                print(f"❌ Recording journal disabled: {e}")
+            try:
+                self.recorder.set_mrec_encoding(recording.get("mrec_encoding", "records"))
+            except ValueError as e:
+                print(f"❌ {e}")
+            
+            # Macro cache budget
+            try:
+                self.recorder.set_cache_budget(self.settings_manager.get_cache_settings().get("max_mb", 128))
+            except (TypeError, ValueError) as e:
+                print(f"❌ Invalid macro cache budget: {e}")
+            
+            # Editor undo history budget
+            try:
+                self.movement_display.set_undo_budget(self.settings_manager.get_editor_settings().get("undo_max_mb", 32))
+            except (TypeError, ValueError) as e:
+                print(f"❌ Invalid undo history budget: {e}")
+            
+            # Open the macro library, only if one was opened before (it creates its folder and database)
+            library = self.settings_manager.get_library_settings()
+            if library.get("folder"):
+                self.open_library(
+                    library["folder"],
+                    library.get("watch", True),
+                    library.get("poll_interval_s", 2.0)
+                )
+            if hasattr(self.settings_panel, 'set_library_state'):
+                self.settings_panel.set_library_state(library.get("folder") or "macros")
+            
+            # Apply playback timing settings
+            playback = self.settings_manager.get_playback_settings()
+            timing_mode = playback.get("timing_mode", "power_saving")
+            spin_margin_ms = playback.get("spin_margin_ms", 2.0)
+            self.recorder.set_timing_mode(timing_mode, spin_margin_ms)
+            if hasattr(self.settings_panel, 'set_playback_state'):
+                self.settings_panel.set_playback_state(timing_mode, spin_margin_ms)
+            loop_mode = playback.get("loop_mode", "fixed_delay")
+            overrun_policy = playback.get("overrun_policy", "skip")
+            self.recorder.set_loop_mode(loop_mode, overrun_policy)
+            if hasattr(self.settings_panel, 'set_loop_state'):
+                self.settings_panel.set_loop_state(loop_mode, overrun_policy)
+            speed = playback.get("speed", 1.0)
+            gap_threshold_s = playback.get("gap_threshold_s", 0.0)
+            compressed_gap_s = playback.get("compressed_gap_s", 1.0)
+            self.recorder.set_time_warp(speed, gap_threshold_s, compressed_gap_s)
+            if hasattr(self.settings_panel, 'set_warp_state'):
+                self.settings_panel.set_warp_state(speed, gap_threshold_s, compressed_gap_s)
+            max_move_rate_hz = playback.get("max_move_rate_hz", 0)
+            self.recorder.set_move_rate(max_move_rate_hz)
+            if hasattr(self.settings_panel, 'set_move_rate_state'):
+                self.settings_panel.set_move_rate_state(max_move_rate_hz)
+            
             print("✅ Settings loaded successfully")
             
         except Exception as e:
@@ -329,6 +476,28 @@ class MacroRecorderGUI:
                 self.scheduler.set_schedules(schedules)
                 self.scheduler.set_enabled(sched_enabled)
             
+            # Update playback timing settings
+            if hasattr(self.settings_panel, 'get_playback_state'):
+                timing_mode, spin_margin_ms = self.settings_panel.get_playback_state()
+                self.recorder.set_timing_mode(timing_mode, spin_margin_ms)
+                self.settings_manager.set_playback_timing(timing_mode, spin_margin_ms)
+            if hasattr(self.settings_panel, 'get_loop_state'):
+                loop_mode, overrun_policy = self.settings_panel.get_loop_state()
+                self.recorder.set_loop_mode(loop_mode, overrun_policy)
+                self.settings_manager.set_playback_loop(loop_mode, overrun_policy)
+            if hasattr(self.settings_panel, 'get_warp_state'):
+                speed, gap_threshold_s, compressed_gap_s = self.settings_panel.get_warp_state()
+                self.recorder.set_time_warp(speed, gap_threshold_s, compressed_gap_s)
+                self.settings_manager.set_playback_warp(speed, gap_threshold_s, compressed_gap_s)
+            if hasattr(self.settings_panel, 'get_move_rate_state'):
+                max_move_rate_hz = self.settings_panel.get_move_rate_state()
+                self.recorder.set_move_rate(max_move_rate_hz)
+                self.settings_manager.set_playback_move_rate(max_move_rate_hz)
+            
+            # Update library folder (once a library is open; typing a folder alone does not create one)
+            if self.library and hasattr(self.settings_panel, 'get_library_state'):
+                self.settings_manager.set_library_folder(self.settings_panel.get_library_state())
+            
             # Save to file
             success = self.settings_manager.save_settings()
             if success:
@@ -394,6 +563,8 @@ class MacroRecorderGUI:
             self.hotkey_manager.cleanup()
         if self.scheduler:
             self.scheduler.stop()
+        if self.library:
+            self.library.close()
         
         self.root.destroy()
 
@@ -0,0 +1,151 @@
+"""
+Mouse Path Simplifier for  Macro Recorder
+Drops mouse_move points that are not needed to reproduce the recorded path
+"""
+import math
+
+from event_store import MOUSE_MOVE
+
+# Online mode simplifies a move run in windows of this many points
+ONLINE_WINDOW = 512
+
+
+def _point_error(points, i, a, b, tolerance_px, tolerance_ms):
+    """Normalized error (> 1 means "must keep") of dropping point i between anchors a and b.
+
+    A point can be dropped if either:
+      - the straight a->b move, interpolated at the point's own timestamp, passes
+        within tolerance_px of it (synchronized distance), or
+      - it lies within tolerance_px of the a->b segment and the interpolated move
+        reaches that spot within tolerance_ms of when it was recorded.
+    """
+    ta, xa, ya = points[a]
+    tb, xb, yb = points[b]
+    ti, xi, yi = points[i]
+    span = tb - ta
+    vx, vy = xb - xa, yb - ya
+
+    frac = (ti - ta) / span if span > 0 else 0.0
+    sed = math.hypot(xi - (xa + frac * vx), yi - (ya + frac * vy))
+    error = sed / tolerance_px
+    if error <= 1.0 or tolerance_ms <= 0:
+        return error
+
+    length_sq = vx * vx + vy * vy
+    if length_sq == 0:
+        u = 0.0
+    else:
+        u = max(0.0, min(1.0, ((xi - xa) * vx + (yi - ya) * vy) / length_sq))
+    perpendicular = math.hypot(xi - (xa + u * vx), yi - (ya + u * vy))
+    time_error_ms = abs(ti - (ta + u * span)) / 1000.0
+    return min(error, max(perpendicular / tolerance_px, time_error_ms / tolerance_ms))
+
+
+def simplify_path(points, tolerance_px=2.0, tolerance_ms=30.0):
+    """Time-aware Ramer-Douglas-Peucker over (timestamp_us, x, y) points.
+
+    Returns the sorted indices of the points to keep; the first and last
+    points are always kept.
+    """
+    count = len(points)
+    if count <= 2:
+        return list(range(count))
+    if tolerance_px <= 0:
+        raise ValueError("tolerance_px must be positive")
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        a, b = stack.pop()
+        worst_index, worst_error = -1, 1.0
+        for i in range(a + 1, b):
+            error = _point_error(points, i, a, b, tolerance_px, tolerance_ms)
+            if error > worst_error:
+                worst_index, worst_error = i, error
+        if worst_index >= 0:
+            keep[worst_index] = True
+            stack.append((a, worst_index))
+            stack.append((worst_index, b))
+    return [i for i in range(count) if keep[i]]
+
+
+def simplify_moves(store, tolerance_px=2.0, tolerance_ms=30.0):
+    """Simplify every run of consecutive mouse_move events in an EventStore.
+
+    Non-move events are never touched, and each run keeps its first and last
+    point so clicks and key presses still happen where the cursor was.
+    Returns (new_store, stats).
+    """
+    types = store.types
+    timestamps, xs, ys = store.timestamps, store.x, store.y
+    keep = []
+    moves_before = 0
+    i, count = 0, len(store)
+    while i < count:
+        if types[i] != MOUSE_MOVE:
+            keep.append(i)
+            i += 1
+            continue
+        run_start = i
+        while i < count and types[i] == MOUSE_MOVE:
+            i += 1
+        points = [(timestamps[j], xs[j], ys[j]) for j in range(run_start, i)]
+        moves_before += len(points)
+        keep.extend(run_start + j for j in simplify_path(points, tolerance_px, tolerance_ms))
+
+    moves_after = len(keep) - (count - moves_before)
+    return store.take(keep), _make_stats(moves_before, moves_after)
+
+
+def _make_stats(moves_before, moves_after):
+    return {
+        'moves_before': moves_before,
+        'moves_after': moves_after,
+        'ratio': moves_before / moves_after if moves_after else 1.0,
+    }
+
+
+class OnlineMoveSimplifier:
+    """Simplifies mouse moves while recording.
+
+    Moves are buffered until the run ends (``flush()`` before any non-move
+    event) or the window fills up; kept points are written to the store with
+    ``append_raw``. The last point of a full window stays buffered as the
+    anchor of the next one, so windows join without gaps.
+    """
+
+    def __init__(self, store, tolerance_px=2.0, tolerance_ms=30.0, window=ONLINE_WINDOW):
+        self.store = store
+        self.tolerance_px = tolerance_px
+        self.tolerance_ms = tolerance_ms
+        self.window = window
+        self.moves_before = 0
+        self.moves_after = 0
+        self._pending = []
+
+    def add(self, timestamp_us, x, y):
+        self._pending.append((timestamp_us, x, y))
+        self.moves_before += 1
+        if len(self._pending) >= self.window:
+            self._emit(final=False)
+
+    def flush(self):
+        """Write out the buffered run (call before storing a non-move event)"""
+        if self._pending:
+            self._emit(final=True)
+
+    def _emit(self, final):
+        pending = self._pending
+        kept = simplify_path(pending, self.tolerance_px, self.tolerance_ms)
+        if not final:
+            kept = kept[:-1]
+        append = self.store.append_raw
+        for i in kept:
+            timestamp_us, x, y = pending[i]
+            append(MOUSE_MOVE, timestamp_us, x, y)
+        self.moves_after += len(kept)
+        self._pending = [] if final else [pending[-1]]
+
+    def stats(self):
+        return _make_stats(self.moves_before, self.moves_after + len(self._pending))
@@ -0,0 +1,466 @@
+"""
+Playback Engine for  Macro Recorder
+Compiles an EventStore into a flat plan of deadlines and pre-bound actions
+"""
+import queue
+import threading
+from array import array
+
+from event_store import (
+    MOUSE_MOVE, MOUSE_CLICK, MOUSE_SCROLL, KEY_PRESS, KEY_RELEASE, DELAY,
+    seconds_to_us
+)
+from clock import NS_PER_SECOND, NS_PER_US
+
+# Timing modes: plain OS sleeps, or sleep then spin for the last few milliseconds
+TIMING_POWER_SAVING = 'power_saving'
+TIMING_PRECISE = 'precise'
+TIMING_MODES = (TIMING_POWER_SAVING, TIMING_PRECISE)
+DEFAULT_SPIN_MARGIN_MS = 2.0
+
+# Upper bounds (µs) of the lateness histogram buckets; the last bucket is open-ended
+LATENESS_BUCKETS_US = (100, 500, 1000, 2000, 5000, 10000)
+
+# Playback speed limits
+MIN_SPEED = 0.25
+MAX_SPEED = 20.0
+
+# Loop modes: wait repeat_interval after each run, or start runs on a fixed grid
+LOOP_FIXED_DELAY = 'fixed_delay'
+LOOP_FIXED_RATE = 'fixed_rate'
+LOOP_MODES = (LOOP_FIXED_DELAY, LOOP_FIXED_RATE)
+
+# What a fixed-rate loop does when a run ends after the next start time
+OVERRUN_SKIP = 'skip'
+OVERRUN_CATCH_UP = 'catch_up'
+OVERRUN_DELAY = 'delay'
+OVERRUN_POLICIES = (OVERRUN_SKIP, OVERRUN_CATCH_UP, OVERRUN_DELAY)
+
+
+class PlaybackPlan:
+    """Immutable compiled macro.
+
+    ``steps`` is a tuple of ``(deadline_ns, action, args)`` where deadline_ns
+    is relative to the start of the run and action is a callable already
+    bound to the engine that compiled it. Keys and buttons in ``args`` are
+    resolved objects, so running the plan does no lookups or type dispatch.
+    """
+
+    __slots__ = ('steps', 'duration_ns', 'event_count')
+    streamed = False
+
+    def __init__(self, steps, event_count):
+        object.__setattr__(self, 'steps', tuple(steps))
+        object.__setattr__(self, 'duration_ns', self.steps[-1][0] if self.steps else 0)
+        object.__setattr__(self, 'event_count', event_count)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PlaybackPlan is immutable")
+
+    def __len__(self):
+        return len(self.steps)
+
+
+class PlaybackStream:
+    """Plan whose steps are generated while playing instead of stored.
+
+    ``steps`` starts a fresh pass over the source on every access, so the same
+    stream can be run repeatedly (e.g. in a loop). The number of steps and the
+    duration are not known in advance.
+    """
+
+    streamed = True
+
+    def __init__(self, make_steps, event_count):
+        self._make_steps = make_steps
+        self.event_count = event_count
+        self.duration_ns = None
+
+    @property
+    def steps(self):
+        return self._make_steps()
+
+
+class LatenessStats:
+    """Per-event lateness (actual dispatch time minus deadline) of one playback run"""
+
+    def __init__(self):
+        self.samples = array('q')
+
+    def add(self, lateness_ns):
+        self.samples.append(lateness_ns if lateness_ns > 0 else 0)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, fraction, ordered=None):
+        ordered = ordered if ordered is not None else sorted(self.samples)
+        if not ordered:
+            return 0
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def histogram(self):
+        """List of (label, count) buckets"""
+        counts = [0] * (len(LATENESS_BUCKETS_US) + 1)
+        bounds = [bound * 1000 for bound in LATENESS_BUCKETS_US]
+        for sample in self.samples:
+            for i, bound in enumerate(bounds):
+                if sample < bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        labels = []
+        lower = 0
+        for bound in LATENESS_BUCKETS_US:
+            labels.append(f"{lower / 1000:g}-{bound / 1000:g} ms")
+            lower = bound
+        labels.append(f">{lower / 1000:g} ms")
+        return list(zip(labels, counts))
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        count = len(ordered)
+        return {
+            'count': count,
+            'p50_ms': self.percentile(0.50, ordered) / 1e6,
+            'p99_ms': self.percentile(0.99, ordered) / 1e6,
+            'max_ms': (ordered[-1] if ordered else 0) / 1e6,
+            'mean_ms': (sum(ordered) / count / 1e6) if count else 0.0,
+            'histogram': self.histogram(),
+        }
+
+    def format(self):
+        summary = self.summary()
+        return (f"lateness p50 {summary['p50_ms']:.2f} ms · p99 {summary['p99_ms']:.2f} ms "
+                f"· max {summary['max_ms']:.2f} ms")
+
+
+class LoopSchedule:
+    """Start times of a fixed-rate loop: iteration N starts at origin + N * period.
+
+    Deadlines are integer nanoseconds on the monotonic clock, so the period never
+    drifts however long the loop runs. When a run overruns the next start time:
+      - skip:     drop the missed slots and wait for the next one on the grid
+      - catch_up: start the missed iterations right away, back to back
+      - delay:    start now and shift the whole grid to this new start
+    """
+
+    def __init__(self, period_ns, origin_ns, overrun=OVERRUN_SKIP):
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy: {overrun}")
+        self.period_ns = max(int(period_ns), 0)
+        self.origin_ns = origin_ns
+        self.overrun = overrun
+        self.index = 0
+        self.start_errors = array('q')
+        self.overruns = 0
+        self.skipped = 0
+
+    def next_start_ns(self):
+        return self.origin_ns + self.index * self.period_ns
+
+    def started(self, actual_ns):
+        """Record how late the current iteration actually started"""
+        self.start_errors.append(actual_ns - self.next_start_ns())
+
+    def advance(self, now_ns):
+        """Move to the next iteration after a run ended at now_ns; returns its start time"""
+        self.index += 1
+        deadline_ns = self.next_start_ns()
+        if deadline_ns >= now_ns or self.period_ns <= 0:
+            return deadline_ns
+
+        self.overruns += 1
+        if self.overrun == OVERRUN_SKIP:
+            missed = (now_ns - deadline_ns) // self.period_ns + 1
+            self.index += missed
+            self.skipped += missed
+        elif self.overrun == OVERRUN_DELAY:
+            self.origin_ns = now_ns - self.index * self.period_ns
+        return self.next_start_ns()
+
+    def stats(self):
+        errors = self.start_errors
+        count = len(errors)
+        return {
+            'iterations': count,
+            'period_s': self.period_ns / NS_PER_SECOND,
+            'last_error_ms': (errors[-1] / 1e6) if count else 0.0,
+            'mean_error_ms': (sum(errors) / count / 1e6) if count else 0.0,
+            'max_error_ms': (max(errors) / 1e6) if count else 0.0,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'overrun_policy': self.overrun,
+        }
+
+
+class PlaybackEngine:
+    """Executes compiled plans against a mouse and keyboard controller.
+
+    The controllers are created once and reused for every run. The engine
+    tracks pressed keys/buttons during a run so they can be released if the
+    run ends early.
+    """
+
+    def __init__(self, mouse_controller, keyboard_controller, resolve_key, resolve_button):
+        self.mouse_controller = mouse_controller
+        self.keyboard_controller = keyboard_controller
+        self.resolve_key = resolve_key
+        self.resolve_button = resolve_button
+        self.pressed_keys = set()
+        self.pressed_buttons = set()
+        self.timing_mode = TIMING_POWER_SAVING
+        self.spin_margin_ns = int(DEFAULT_SPIN_MARGIN_MS * 1_000_000)
+        self.last_stats = None
+        self.last_start_ns = None
+
+    def set_timing(self, mode, spin_margin_ms=DEFAULT_SPIN_MARGIN_MS):
+        """Choose 'power_saving' (plain sleeps) or 'precise' (sleep, then spin the last margin)"""
+        if mode not in TIMING_MODES:
+            raise ValueError(f"Unknown timing mode: {mode}")
+        self.timing_mode = mode
+        self.spin_margin_ns = int(float(spin_margin_ms) * 1_000_000)
+
+    # ---------------- Compilation ---------------- #
+    @staticmethod
+    def check_warp(speed=1.0, max_gap_s=None, compressed_gap_s=None):
+        """Validate time-warp settings; returns (speed, max_gap_ns, compressed_gap_ns)"""
+        speed = float(speed)
+        if not MIN_SPEED <= speed <= MAX_SPEED:
+            raise ValueError(f"Speed must be between {MIN_SPEED:g}x and {MAX_SPEED:g}x")
+        if not max_gap_s or float(max_gap_s) <= 0:
+            return speed, 0, 0
+        max_gap_ns = int(float(max_gap_s) * NS_PER_SECOND)
+        compressed_gap_ns = int(float(compressed_gap_s or 0) * NS_PER_SECOND)
+        if not 0 <= compressed_gap_ns <= max_gap_ns:
+            raise ValueError("Compressed gap must be between 0 and the gap threshold")
+        return speed, max_gap_ns, compressed_gap_ns
+
+    def compile(self, store, speed=1.0, max_gap_s=None, compressed_gap_s=None, max_move_rate=None):
+        """Compile an EventStore into a PlaybackPlan bound to this engine.
+
+        Events play at their recorded offsets. Like the old interpreter loop, an
+        event whose time has already passed fires right after the previous one,
+        and a delay event holds back everything after it until the delay ends.
+
+        The timeline can be warped without touching the stored timestamps: any
+        gap longer than max_gap_s is shortened to compressed_gap_s, then the
+        whole timeline (delays included) is divided by speed.
+
+        With max_move_rate (Hz), mouse moves closer than 1/max_move_rate to the
+        previous injected move are dropped, except the last move before any
+        other event, so the cursor is still in place for clicks and scrolls.
+        Non-move events are never dropped or shifted.
+        """
+        options = self._step_options(speed, max_gap_s, compressed_gap_s, max_move_rate)
+        return PlaybackPlan(self._iter_steps(store, *options), len(store))
+
+    def stream(self, store, speed=1.0, max_gap_s=None, compressed_gap_s=None, max_move_rate=None):
+        """Like compile, but steps are generated from the store while playing.
+
+        Nothing is held per event, so memory stays flat however long the macro
+        is; meant for memory-mapped stores that are too large to compile.
+        """
+        options = self._step_options(speed, max_gap_s, compressed_gap_s, max_move_rate)
+        return PlaybackStream(lambda: self._iter_steps(store, *options), len(store))
+
+    def _step_options(self, speed, max_gap_s, compressed_gap_s, max_move_rate):
+        # Validated up front so a bad setting fails at compile time, not mid-stream
+        speed, max_gap_ns, compressed_gap_ns = self.check_warp(speed, max_gap_s, compressed_gap_s)
+        move_interval_ns = int(NS_PER_SECOND / float(max_move_rate)) if max_move_rate else 0
+        return speed, max_gap_ns, compressed_gap_ns, move_interval_ns
+
+    def _iter_steps(self, store, speed, max_gap_ns, compressed_gap_ns, move_interval_ns):
+        """Yield (deadline_ns, action, args) for every step, reading the store row by row"""
+        warped = speed != 1.0 or max_gap_ns > 0
+        keys = [self._safe_resolve(self.resolve_key, name) for name in store.key_names]
+        buttons = [self._safe_resolve(self.resolve_button, name) for name in store.button_names]
+        move = self.move
+
+        deadline_ns = 0
+        previous_ns = 0
+        compressed_ns = 0
+        last_move_ns = -move_interval_ns
+        pending_move = None
+        for i, (type_code, timestamp_us, x, y, dx, dy, key_id, button_id, pressed, _) in enumerate(store.rows()):
+            timestamp_ns = timestamp_us * NS_PER_US
+            if warped:
+                # Work on the gap-compressed timeline in integer ns, then scale once
+                gap_ns = timestamp_ns - previous_ns
+                previous_ns = timestamp_ns
+                if max_gap_ns and gap_ns > max_gap_ns:
+                    gap_ns = compressed_gap_ns
+                compressed_ns += gap_ns
+                timestamp_ns = int(compressed_ns / speed)
+            if timestamp_ns > deadline_ns:
+                deadline_ns = timestamp_ns
+
+            if type_code == MOUSE_MOVE:
+                step = (deadline_ns, move, ((x, y),))
+                if deadline_ns - last_move_ns < move_interval_ns:
+                    # Too soon after the last injected move: hold it, a later one may replace it
+                    pending_move = step
+                else:
+                    yield step
+                    last_move_ns = deadline_ns
+                    pending_move = None
+                continue
+
+            if pending_move is not None:
+                yield pending_move
+                last_move_ns = pending_move[0]
+                pending_move = None
+
+            if type_code == MOUSE_CLICK:
+                button = buttons[button_id] if button_id >= 0 else None
+                if button is not None:
+                    action = self.press_button if pressed == 1 else self.release_button
+                    yield (deadline_ns, action, ((x, y), button))
+            elif type_code == MOUSE_SCROLL:
+                yield (deadline_ns, self.scroll, ((x, y), dx, dy))
+            elif type_code == KEY_PRESS or type_code == KEY_RELEASE:
+                key = keys[key_id] if key_id >= 0 else None
+                if key is not None:
+                    action = self.press_key if type_code == KEY_PRESS else self.release_key
+                    yield (deadline_ns, action, (key,))
+            elif type_code == DELAY:
+                event = store[i]
+                duration = float(event.get('duration', 1.0))
+                yield (deadline_ns, self.announce_delay, (duration, event.get('description', '')))
+                deadline_ns += int(seconds_to_us(duration) * NS_PER_US / speed)
+
+        if pending_move is not None:
+            yield pending_move
+
+    @staticmethod
+    def _safe_resolve(resolver, name):
+        try:
+            return resolver(name)
+        except Exception as e:
+            print(f"Cannot resolve '{name}': {e}")
+            return None
+
+    # ---------------- Actions ---------------- #
+    def move(self, position):
+        self.mouse_controller.position = position
+
+    def press_button(self, position, button):
+        self.mouse_controller.position = position
+        self.mouse_controller.press(button)
+        self.pressed_buttons.add(button)
+
+    def release_button(self, position, button):
+        self.mouse_controller.position = position
+        self.mouse_controller.release(button)
+        self.pressed_buttons.discard(button)
+
+    def scroll(self, position, dx, dy):
+        self.mouse_controller.position = position
+        self.mouse_controller.scroll(dx, dy)
+
+    def press_key(self, key):
+        self.keyboard_controller.press(key)
+        self.pressed_keys.add(key)
+
+    def release_key(self, key):
+        self.keyboard_controller.release(key)
+        self.pressed_keys.discard(key)
+
+    def announce_delay(self, duration, description):
+        if description:
+            print(f"⏰ Delay: {duration}s - {description}")
+        else:
+            print(f"⏰ Waiting {duration} seconds...")
+
+    # ---------------- Execution ---------------- #
+    def run(self, plan, clock, stop_event=None):
+        """Play a plan once; returns the number of steps executed.
+
+        Setting ``stop_event`` (a threading.Event) ends the run right away, even
+        in the middle of a long gap. Lateness of every step is recorded in
+        ``self.last_stats``.
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        stopped = stop_event.is_set
+        now_ns = clock.now_ns
+        wait_until = clock.wait_until
+        spin_margin_ns = self.spin_margin_ns if self.timing_mode == TIMING_PRECISE else 0
+        stats = self.last_stats = LatenessStats()
+        record = stats.add
+        start_ns = self.last_start_ns = now_ns()
+        executed = 0
+
+        try:
+            for deadline_ns, action, args in plan.steps:
+                if stopped():
+                    break
+
+                target_ns = start_ns + deadline_ns
+                remaining_ns = target_ns - now_ns()
+                if remaining_ns > 0:
+                    # Blocks on the stop event; in precise mode the last stretch spins
+                    if not wait_until(target_ns, stop_event, spin_margin_ns):
+                        break
+                    record(now_ns() - target_ns)
+                else:
+                    record(-remaining_ns)
+
+                try:
+                    action(*args)
+                except Exception as e:
+                    print(f"Error executing event: {e}")
+                executed += 1
+        finally:
+            self.release_all()
+        return executed
+
+    def release_all(self):
+        """Release anything still held down"""
+        for key in list(self.pressed_keys):
+            try:
+                self.keyboard_controller.release(key)
+            except Exception:
+                pass
+        for button in list(self.pressed_buttons):
+            try:
+                self.mouse_controller.release(button)
+            except Exception:
+                pass
+        self.pressed_keys.clear()
+        self.pressed_buttons.clear()
+
+
+class PlaybackWorker:
+    """Long-lived thread that runs playback jobs one at a time.
+
+    ``submit`` only enqueues, so triggers can hand playback over straight from an
+    input hook thread without blocking it or spawning a thread per play.
+    """
+
+    def __init__(self, name="PlaybackWorker"):
+        self.name = name
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job, *args):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        self._jobs.put((job, args))
+
+    def shutdown(self):
+        self._jobs.put((None, ()))
+
+    def _run(self):
+        while True:
+            job, args = self._jobs.get()
+            if job is None:
+                break
+            try:
+                job(*args)
+            except Exception as e:
+                print(f"Playback worker error: {e}")
@@ -0,0 +1,299 @@
+"""
+Recording Journal for  Macro Recorder
+Streams captured events to an append-only file so a crashed session can be recovered
+"""
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+
+from event_store import COLUMNS, EventStore
+from macro_file import MACRO_FORMAT_VERSION, MREC_RECORD, RECORD_COLUMNS, pack_records, unpack_records
+
+# Journal format -> file extension
+JOURNAL_FORMATS = {
+    'jsonl': '.jsonl',
+    'binary': '.mrj',
+}
+
+# Binary journal: magic + version, then frames of (kind, payload size, crc32) + payload
+JOURNAL_MAGIC = b'MRJ\x00'
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct('<4sH')
+FRAME_HEADER = struct.Struct('<BII')
+FRAME_TABLES = 1   # JSON: names/extras interned since the previous tables frame
+FRAME_RECORDS = 2  # packed .mrec records
+FRAME_END = 3      # JSON: {"events": n}, written by a clean close
+
+_CLOSE = object()
+
+
+def journal_format(path):
+    """Journal format selected by the file extension"""
+    for name, extension in JOURNAL_FORMATS.items():
+        if path.lower().endswith(extension):
+            return name
+    raise ValueError(f"Not a recording journal: {path}")
+
+
+class RecordingJournal:
+    """Append-only journal written by a background thread.
+
+    ``append`` is called from the capture drain thread with an EventStore
+    holding the rows captured since the last call. Batches wait in a queue of
+    at most ``max_pending`` entries; when the disk falls that far behind,
+    ``append`` blocks (and the capture rings absorb the input meanwhile)
+    instead of buffering without limit. The writer takes everything queued,
+    writes it and flushes once per round, so each round costs one flush.
+
+    After a write or flush error the writer keeps draining the queue, so
+    capture never blocks on it, and keeps every batch not known to be on
+    disk in ``unwritten``; ``events`` counts only the flushed ones.
+    """
+
+    def __init__(self, path, max_pending=64, fsync=False):
+        self.path = path
+        self.format = journal_format(path)
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.events = 0
+        self.batches = 0
+        self.flushes = 0
+        self.bytes_written = 0
+        self.blocked_s = 0.0
+        self.max_queued = 0
+        self.error = None
+        self.unwritten = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._file = None
+        self._thread = None
+        # How much of each name table has been written (binary format)
+        self._written = {'type_names': 0, 'key_names': 0, 'button_names': 0, 'extras': 0}
+
+    def start(self):
+        self._file = open(self.path, 'wb')
+        if self.format == 'binary':
+            self._write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+        else:
+            self._write_line({'journal': 'macro_recorder', 'format_version': MACRO_FORMAT_VERSION,
+                              'started_at': datetime.now().isoformat()})
+        self._file.flush()
+        self._thread = threading.Thread(target=self._run, name="RecordingJournalWriter", daemon=True)
+        self._thread.start()
+
+    def append(self, batch):
+        """Queue an EventStore of new rows; blocks while max_pending batches are waiting"""
+        if not batch:
+            return
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            started = time.perf_counter()
+            self._queue.put(batch)
+            self.blocked_s += time.perf_counter() - started
+        queued = self._queue.qsize()
+        if queued > self.max_queued:
+            self.max_queued = queued
+
+    def close(self):
+        """Write everything still queued plus the end marker, then stop the writer"""
+        if self._thread is None:
+            return
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        closing = False
+        while not closing:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batches = []
+            for item in items:
+                if item is _CLOSE:
+                    closing = True
+                    continue
+                batches.append(item)
+                if self.error is None:
+                    try:
+                        self._write_batch(item)
+                    except Exception as e:
+                        self._fail(e)
+            if self.error is None:
+                try:
+                    self._flush()
+                except Exception as e:
+                    self._fail(e)
+            if self.error is None:
+                self.events += sum(len(batch) for batch in batches)
+                self.batches += len(batches)
+            else:
+                # Keep draining the queue so the capture side never blocks on a dead writer,
+                # but hold on to what may not have reached the disk
+                self.unwritten.extend(batches)
+
+        try:
+            if self.error is None:
+                if self.format == 'binary':
+                    self._write_frame(FRAME_END, json.dumps({'events': self.events}).encode('utf-8'))
+                else:
+                    self._write_line({'journal_end': True, 'events': self.events})
+                self._flush()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._file.close()
+
+    def _fail(self, error):
+        self.error = error
+        print(f"❌ Recording journal error: {error}")
+
+    def _write_batch(self, batch):
+        if self.format == 'binary':
+            tables = {}
+            for name in self._written:
+                table = batch._extras if name == 'extras' else getattr(batch, name)
+                if len(table) > self._written[name]:
+                    tables[name] = table[self._written[name]:]
+                    self._written[name] = len(table)
+            if tables:
+                self._write_frame(FRAME_TABLES, json.dumps(tables).encode('utf-8'))
+            self._write_frame(FRAME_RECORDS, pack_records({name: getattr(batch, name) for name in RECORD_COLUMNS}))
+        else:
+            self._write(''.join(json.dumps(event) + '\n' for event in batch.to_dicts(integer_timestamps=True))
+                        .encode('utf-8'))
+
+    def _write_frame(self, kind, payload):
+        self._write(FRAME_HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload)
+
+    def _write_line(self, data):
+        self._write((json.dumps(data) + '\n').encode('utf-8'))
+
+    def _write(self, data):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def _flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.flushes += 1
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'format': self.format,
+            'events': self.events,
+            'batches': self.batches,
+            'flushes': self.flushes,
+            'bytes': self.bytes_written,
+            'max_queued': self.max_queued,
+            'blocked_s': self.blocked_s,
+            'error': str(self.error) if self.error else None,
+            'unwritten_events': sum(len(batch) for batch in self.unwritten),
+        }
+
+
+def recover_journal(path):
+    """Rebuild an EventStore from a journal, complete or cut short by a crash.
+
+    Everything up to the first torn or corrupt entry is kept. Returns
+    (store, info) where info has 'complete' (the end marker was found),
+    'events' and 'discarded_bytes' (unreadable tail).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if journal_format(path) == 'binary':
+        store, used, complete = _recover_binary(data)
+    else:
+        store, used, complete = _recover_jsonl(data)
+    return store, {'complete': complete, 'events': len(store), 'discarded_bytes': len(data) - used}
+
+
+def _recover_jsonl(data):
+    events = []
+    used = 0
+    complete = False
+    header_seen = False
+    while used < len(data):
+        end = data.find(b'\n', used)
+        if end < 0:
+            break  # torn last line
+        try:
+            entry = json.loads(data[used:end])
+        except ValueError:
+            break
+        if not isinstance(entry, dict):
+            break
+        used = end + 1
+        if not header_seen:
+            header_seen = True
+            if entry.get('journal') is not None:
+                continue
+        if entry.get('journal_end'):
+            complete = True
+            break
+        events.append(entry)
+    return EventStore(events), used, complete
+
+
+def _recover_binary(data):
+    if len(data) < JOURNAL_HEADER.size:
+        return EventStore(), 0, False
+    magic, version = JOURNAL_HEADER.unpack_from(data)
+    if magic != JOURNAL_MAGIC:
+        raise ValueError("Not a binary recording journal")
+    if version > JOURNAL_VERSION:
+        raise ValueError(f"Unsupported journal version {version}")
+
+    typecodes = dict(COLUMNS)
+    columns = {name: array(typecodes[name]) for name in RECORD_COLUMNS}
+    tables = {'type_names': [], 'key_names': [], 'button_names': [], 'extras': []}
+    used = JOURNAL_HEADER.size
+    complete = False
+    while used + FRAME_HEADER.size <= len(data):
+        kind, size, crc = FRAME_HEADER.unpack_from(data, used)
+        start = used + FRAME_HEADER.size
+        payload = data[start:start + size]
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            break
+        if kind == FRAME_TABLES:
+            for name, values in json.loads(payload).items():
+                tables[name].extend(values)
+        elif kind == FRAME_RECORDS:
+            if size % MREC_RECORD.size:
+                break
+            for name, column in unpack_records(payload, size // MREC_RECORD.size).items():
+                columns[name].extend(column)
+        elif kind == FRAME_END:
+            used = start + size
+            complete = True
+            break
+        else:
+            break
+        used = start + size
+
+    if not tables['type_names']:
+        # Nothing made it to disk; the type table always precedes the first records
+        return EventStore(), used, complete
+    store = EventStore.from_columns(columns, tables['type_names'], tables['key_names'],
+                                    tables['button_names'], tables['extras'])
+    return store, used, complete
+
+
+def find_journals(folder):
+    """Journal files left in folder (newest first), e.g. by a session that crashed"""
+    if not folder or not os.path.isdir(folder):
+        return []
+    paths = [os.path.join(folder, name) for name in os.listdir(folder)
+             if name.lower().endswith(tuple(JOURNAL_FORMATS.values()))]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
@@ -3,15 +3,18 @@ import time
 from datetime import datetime, timedelta, time as dt_time
 from typing import Any, Callable, Dict, List, Optional
 
+from clock import DEFAULT_CLOCK, NS_PER_SECOND
+
 
 class MacroScheduler:
     """Lightweight scheduler to trigger macro playback at configured times.
 
     Supports schedule types: once (datetime), daily (time), weekly (time + days), interval (seconds).
     Thread-safe and UI-thread friendly via a provided controller with tk.after().
+    Interval schedules run on the monotonic clock, so wall-clock changes do not make them drift.
     """
 
-    def __init__(self, controller):
+    def __init__(self, controller, clock=None):
         # controller is MacroRecorderGUI, must expose: root (tk), is_playing, start_auto_playback(), update_status(str)
         self.controller = controller
         self._thread: Optional[threading.Thread] = None
@@ -20,7 +23,10 @@ class MacroScheduler:
         self.enabled: bool = False
         self.schedules: List[Dict[str, Any]] = []
         self._next_run_cache: Dict[str, Optional[datetime]] = {}
+        # Monotonic deadlines (ns) of interval schedules, keyed by schedule id
+        self._interval_deadlines: Dict[str, int] = {}
         self._check_interval_seconds: float = 1.0
+        self.clock = clock or DEFAULT_CLOCK
 
     # ---------------- Public API ---------------- #
     def start(self) -> None:
@@ -62,6 +68,7 @@ class MacroScheduler:
             self.schedules = [self._normalize_schedule(s) for s in schedules]
             # reset cache to recompute
             self._next_run_cache = {s['id']: None for s in self.schedules}
+            self._interval_deadlines = {}
 
     def get_schedules(self) -> List[Dict[str, Any]]:
         # Return a copy without transient fields
@@ -84,9 +91,14 @@ class MacroScheduler:
         """For UI: returns ISO strings of next run per schedule id."""
         with self._lock:
             out: Dict[str, Optional[str]] = {}
+            now_ns = self.clock.now_ns()
             for s in self.schedules:
                 nid = s['id']
-                nr = self._next_run_cache.get(nid) or self._compute_next_run(s)
+                deadline = self._interval_deadlines.get(nid)
+                if s['type'] == 'interval' and deadline is not None:
+                    nr = datetime.now() + timedelta(seconds=max(0, deadline - now_ns) / NS_PER_SECOND)
+                else:
+                    nr = self._next_run_cache.get(nid) or self._compute_next_run(s)
                 out[nid] = nr.isoformat(sep=' ') if nr else None
             return out
 
@@ -94,13 +106,25 @@ class MacroScheduler:
     def _run_loop(self) -> None:
         while not self._stop_event.is_set():
             try:
+                wait_seconds = self._check_interval_seconds
                 if self.enabled:
                     due: List[Dict[str, Any]] = []
                     now = datetime.now()
+                    now_ns = self.clock.now_ns()
                     with self._lock:
                         for s in self.schedules:
                             if not s.get('enabled', True):
                                 continue
+                            if s['type'] == 'interval':
+                                deadline = self._next_interval_deadline(s, now_ns)
+                                if deadline is None:
+                                    continue
+                                if now_ns >= deadline:
+                                    due.append(s)
+                                else:
+                                    # Wake up right at the deadline instead of on the next 1s tick
+                                    wait_seconds = min(wait_seconds, (deadline - now_ns) / NS_PER_SECOND)
+                                continue
                             nr = self._next_run_cache.get(s['id'])
                             if nr is None:
                                 nr = self._compute_next_run(s)
@@ -115,11 +139,13 @@ class MacroScheduler:
                             if s['type'] == 'once':
                                 s['enabled'] = False
                                 self._next_run_cache[s['id']] = None
+                            elif s['type'] == 'interval':
+                                self._advance_interval_deadline(s)
                             else:
                                 # compute next after now
                                 self._next_run_cache[s['id']] = self._compute_next_run(s, base=datetime.now())
                 # Sleep with stopable wait
-                self._stop_event.wait(self._check_interval_seconds)
+                self._stop_event.wait(wait_seconds)
             except Exception as e:
                 # Do not crash scheduler thread; log minimal
                 try:
@@ -129,6 +155,30 @@ class MacroScheduler:
                 # small backoff to avoid tight loop
                 self._stop_event.wait(1.0)
 
+    def _next_interval_deadline(self, s: Dict[str, Any], now_ns: int) -> Optional[int]:
+        """Monotonic deadline of an interval schedule, armed one interval from now on first use"""
+        interval_ns = int(float(s.get('interval_seconds') or 0) * NS_PER_SECOND)
+        if interval_ns <= 0:
+            return None
+        deadline = self._interval_deadlines.get(s['id'])
+        if deadline is None:
+            deadline = now_ns + interval_ns
+            self._interval_deadlines[s['id']] = deadline
+        return deadline
+
+    def _advance_interval_deadline(self, s: Dict[str, Any]) -> None:
+        """Move an interval deadline forward by whole periods so runs stay on a fixed grid"""
+        interval_ns = int(float(s.get('interval_seconds') or 0) * NS_PER_SECOND)
+        deadline = self._interval_deadlines.get(s['id'])
+        if interval_ns <= 0 or deadline is None:
+            return
+        now_ns = self.clock.now_ns()
+        deadline += interval_ns
+        if deadline <= now_ns:
+            # Fell behind (e.g. machine suspended): skip missed runs rather than bursting
+            deadline += ((now_ns - deadline) // interval_ns + 1) * interval_ns
+        self._interval_deadlines[s['id']] = deadline
+
     def _trigger_if_allowed(self, schedule: Dict[str, Any]) -> None:
         allow_overlap = bool(schedule.get('allow_overlap', False))
         # If not allowing overlap and currently playing, skip
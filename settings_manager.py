@@ -28,6 +28,40 @@ class SettingsManager:
                 "enabled": False,
                 "schedules": []
             },
+            "recording": {
+                "simplify_mode": "off",
+                "simplify_tolerance_px": 2.0,
+                "simplify_tolerance_ms": 30.0,
+                "journal": False,
+                "journal_format": "binary",
+                "journal_dir": "journals",
+                "mrec_encoding": "records"
+            },
+            "playback": {
+                "timing_mode": "power_saving",
+                "spin_margin_ms": 2.0,
+                "loop_mode": "fixed_delay",
+                "overrun_policy": "skip",
+                "speed": 1.0,
+                "gap_threshold_s": 0.0,
+                "compressed_gap_s": 1.0,
+                "max_move_rate_hz": 0
+            },
+            "input": {
+                "backend": "pynput"
+            },
+            "library": {
+                # None until a library is opened from the Library tab; nothing is created before that
+                "folder": None,
+                "watch": True,
+                "poll_interval_s": 2.0
+            },
+            "cache": {
+                "max_mb": 128
+            },
+            "editor": {
+                "undo_max_mb": 32
+            },
             "last_saved": None
         }
         self.current_settings = self.default_settings.copy()
@@ -184,3 +218,56 @@ class SettingsManager:
             "enabled": bool(enabled),
             "schedules": schedules or []
         }
+
+    # Recording settings helpers
+    def get_recording_settings(self):
+        return self.current_settings.get("recording", self.default_settings["recording"]).copy()
+
+    # Playback settings helpers
+    def get_playback_settings(self):
+        return self.current_settings.get("playback", self.default_settings["playback"]).copy()
+
+    def set_playback_timing(self, timing_mode: str, spin_margin_ms=None):
+        playback = self.current_settings.get("playback", self.default_settings["playback"]).copy()
+        playback["timing_mode"] = timing_mode
+        if spin_margin_ms is not None:
+            playback["spin_margin_ms"] = float(spin_margin_ms)
+        self.current_settings["playback"] = playback
+
+    def set_playback_loop(self, loop_mode: str, overrun_policy: str):
+        playback = self.current_settings.get("playback", self.default_settings["playback"]).copy()
+        playback["loop_mode"] = loop_mode
+        playback["overrun_policy"] = overrun_policy
+        self.current_settings["playback"] = playback
+
+    def set_playback_warp(self, speed, gap_threshold_s, compressed_gap_s):
+        playback = self.current_settings.get("playback", self.default_settings["playback"]).copy()
+        playback["speed"] = float(speed)
+        playback["gap_threshold_s"] = float(gap_threshold_s)
+        playback["compressed_gap_s"] = float(compressed_gap_s)
+        self.current_settings["playback"] = playback
+
+    def set_playback_move_rate(self, max_move_rate_hz):
+        playback = self.current_settings.get("playback", self.default_settings["playback"]).copy()
+        playback["max_move_rate_hz"] = float(max_move_rate_hz or 0)
+        self.current_settings["playback"] = playback
+
+    # Library settings helpers
+    def get_library_settings(self):
+        return self.current_settings.get("library", self.default_settings["library"]).copy()
+
+    def set_library_folder(self, folder):
+        library = self.get_library_settings()
+        library["folder"] = folder
+        self.current_settings["library"] = library
+
+    # Cache and editor settings helpers
+    def get_cache_settings(self):
+        return self.current_settings.get("cache", self.default_settings["cache"]).copy()
+
+    def get_editor_settings(self):
+        return self.current_settings.get("editor", self.default_settings["editor"]).copy()
+
+    # Input backend helpers
+    def get_input_backend(self):
+        return self.current_settings.get("input", self.default_settings["input"]).get("backend", "pynput")
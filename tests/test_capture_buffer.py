@@ -0,0 +1,120 @@
+"""
+Capture ring stress tests: synthetic listener callbacks at 20k events/s
+"""
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from capture_buffer import CaptureDrain, CaptureRing
+from event_store import KEY_PRESS, MOUSE_MOVE
+from input_backends import NullBackend
+from macro_recorder import MacroRecorder
+
+RATE = 20_000
+SECONDS = 0.5
+
+
+def produce(push, count, rate, source):
+    """Call push((source, timestamp_ns, sequence)) count times at about rate per second"""
+    started = time.perf_counter()
+    for i in range(count):
+        if i % 100 == 0:
+            ahead = started + i / rate - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+        push((source, time.perf_counter_ns(), i))
+
+
+def run_producers(producers):
+    threads = [threading.Thread(target=target, args=args) for target, args in producers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class CaptureRingTest(unittest.TestCase):
+    def test_undersized_ring_counts_exactly(self):
+        ring = CaptureRing(6)
+        self.assertEqual(ring.capacity, 8)
+        accepted = [ring.push(i) for i in range(20)]
+        self.assertEqual(accepted, [True] * 8 + [False] * 12)
+        self.assertEqual((ring.overflow_count, ring.high_water), (12, 8))
+        self.assertEqual(ring.drain(), list(range(8)))
+        # Wraps around the end of the slots
+        for i in range(5):
+            ring.push(100 + i)
+        self.assertEqual(ring.drain(), [100, 101, 102, 103, 104])
+        self.assertEqual(ring.stats(), {'capacity': 8, 'pushed': 13, 'pending': 0,
+                                        'overflow': 12, 'high_water': 8})
+
+    def test_no_loss_or_reordering_at_rate(self):
+        rings = [CaptureRing(65536), CaptureRing(65536)]
+        received = []
+        drain = CaptureDrain(rings, received.extend)
+        per_ring = int(RATE * SECONDS) // 2
+        drain.start()
+        run_producers([(produce, (ring.push, per_ring, RATE / 2, source)) for source, ring in enumerate(rings)])
+        drain.stop()
+
+        self.assertEqual(drain.stats()['overflow'], 0)
+        for source in range(len(rings)):
+            sequence = [item[2] for item in received if item[0] == source]
+            self.assertEqual(sequence, list(range(per_ring)))
+
+    def test_overflow_is_exact_under_load(self):
+        ring = CaptureRing(64)
+        received = []
+        # A slow drain, so the small ring fills up between passes
+        drain = CaptureDrain([ring], received.extend, interval=0.02)
+        total = int(RATE * SECONDS)
+        drain.start()
+        run_producers([(produce, (ring.push, total, RATE, 0))])
+        drain.stop()
+
+        stats = ring.stats()
+        self.assertGreater(stats['overflow'], 0)
+        self.assertEqual(stats['high_water'], ring.capacity)
+        self.assertEqual(len(received) + stats['overflow'], total)
+        self.assertEqual(stats['pushed'], len(received))
+        sequence = [item[2] for item in received]
+        self.assertEqual(sequence, sorted(sequence))
+
+
+class RecorderCaptureTest(unittest.TestCase):
+    def test_recorded_timestamps_never_go_backwards(self):
+        recorder = MacroRecorder(backend=NullBackend())
+        # The whole capture is shorter than the 2 s trimmed off to drop the stop key
+        recorder.remove_last_seconds = lambda seconds: None
+        with contextlib.redirect_stdout(io.StringIO()):
+            recorder.start_recording()
+            moves = int(RATE * SECONDS * 0.9)
+            keys = int(RATE * SECONDS) - moves
+            run_producers([
+                (produce, (lambda item: recorder.on_mouse_move(item[2] & 1023, 0), moves, RATE * 0.9, 0)),
+                (produce, (lambda item: recorder.on_key_press('a'), keys, RATE * 0.1, 1)),
+            ])
+            recorder.stop_recording()
+
+        events = recorder.events
+        self.assertEqual(recorder.capture_drain.stats()['overflow'], 0)
+        self.assertEqual(len(events), moves + keys)
+        self.assertEqual(sum(1 for code in events.types if code == KEY_PRESS), keys)
+        timestamps = events.timestamps
+        self.assertTrue(all(a <= b for a, b in zip(timestamps, timestamps[1:])))
+
+    def test_merge_clamps_late_stamped_events(self):
+        recorder = MacroRecorder(backend=NullBackend())
+        recorder.events.clear()
+        recorder.start_ns = 0
+        recorder._last_capture_us = 0
+        # A key stamped before a mouse batch that was already stored
+        recorder._store_captured([(MOUSE_MOVE, 5_000_000, 1, 1), (MOUSE_MOVE, 6_000_000, 2, 2)])
+        recorder._store_captured([(KEY_PRESS, 5_500_000, 'a'), (MOUSE_MOVE, 7_000_000, 3, 3)])
+        self.assertEqual(list(recorder.events.timestamps), [5_000, 6_000, 6_000, 7_000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+"""
+Tests for the editor's search index
+"""
+import unittest
+from types import SimpleNamespace
+
+from event_editor import EventEditor
+from event_index import EventIndex
+from event_store import EventStore
+
+
+class IncrementalIndexTest(unittest.TestCase):
+    def test_remove_among_equal_timestamps(self):
+        events = [{'type': 'mouse_move', 'x': i, 'y': 0, 'timestamp': 1.0} for i in range(3)]
+        events.append({'type': 'mouse_move', 'x': 3, 'y': 0, 'timestamp': 2.0})
+        editor = EventEditor(SimpleNamespace(events=EventStore(events)))
+        index = EventIndex(editor)
+        self.assertEqual(index.query(start_s=1.0, end_s=1.0), [0, 1, 2])
+        editor.remove(1)
+        self.assertEqual(index.query(start_s=1.0, end_s=1.0), [0, 1])
+        self.assertEqual(index.query(start_s=2.0), [2])
+        self.assertEqual(index.rebuilds, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
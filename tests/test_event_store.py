@@ -0,0 +1,59 @@
+"""
+Tests for the EventStore extras side table
+Run: python -m pytest tests  (or python -m unittest discover tests)
+"""
+import os
+import tempfile
+import unittest
+
+from event_store import EventStore
+from macro_file import load_events, save_events
+
+
+class ExtrasTableTest(unittest.TestCase):
+    def _edited_delay(self, updates=1000):
+        store = EventStore([{'type': 'delay', 'duration': 0.5, 'timestamp': 0.0},
+                            {'type': 'mouse_move', 'x': 1, 'y': 2, 'timestamp': 0.1}])
+        for i in range(updates):
+            store[0] = {'type': 'delay', 'duration': i / 100, 'description': 'wait', 'timestamp': 0.0}
+        return store
+
+    def test_copy_keeps_only_used_extras(self):
+        store = self._edited_delay()
+        copy = store.copy()
+        self.assertEqual(len(copy._extras), 1)
+        self.assertEqual(copy.to_dicts(), store.to_dicts())
+
+    def test_saved_files_keep_only_used_extras(self):
+        store = self._edited_delay()
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ('macro.mrec', 'macro.mrec.gz'):
+                path = os.path.join(folder, name)
+                save_events(store, path)
+                loaded = load_events(path)
+                self.assertEqual(len(loaded._extras), 1)
+                self.assertEqual(loaded.to_dicts(), store.to_dicts())
+            self.assertLess(os.path.getsize(os.path.join(folder, 'macro.mrec')), 1024)
+            self.assertEqual(len(EventStore.unpack_delta(store.pack_delta())._extras), 1)
+
+    def test_cut_rows_keep_their_extras(self):
+        store = self._edited_delay(updates=1)
+        old = store.cut(0, 1)
+        store[0] = {'type': 'delay', 'duration': 9.0, 'timestamp': 0.0}
+        store.copy()
+        store.write_rows(0, old)
+        self.assertEqual(store[0]['duration'], 0.0)
+
+    def test_cuts_survive_clear(self):
+        store = EventStore([{'type': 'delay', 'duration': 1.0, 'timestamp': 0.0}])
+        before = store.cut(0, 1)
+        store.clear()
+        store.append({'type': 'delay', 'duration': 2.0, 'timestamp': 0.0})
+        after = store.cut(0, 1)
+        store.insert_rows(1, before)
+        store.insert_rows(2, after)
+        self.assertEqual([event['duration'] for event in store], [2.0, 1.0, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests for macro file loading and saving
+"""
+import json
+import os
+import tempfile
+import unittest
+from array import array
+
+from event_store import EventStore
+from macro_file import JSON_CHUNK, MAPPED_CHUNK, load_events, load_json, save_events
+
+EVENTS = [
+    {'type': 'mouse_move', 'x': 10, 'y': 20, 'timestamp': 0.5},
+    {'type': 'mouse_click', 'x': 10, 'y': 20, 'button': 'Button.left', 'pressed': True, 'timestamp': 0.75},
+    {'type': 'key_press', 'key': 'a', 'timestamp': 1.0},
+    {'type': 'delay', 'duration': 2.0, 'description': 'wait, then "go"', 'timestamp': 1.25},
+]
+
+
+class JsonMacroTest(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = self._folder.name
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def test_round_trip(self):
+        events = EVENTS * (JSON_CHUNK // 2 + 1)
+        for name in ('macro.json', 'macro.json.gz', 'empty.json'):
+            store = EventStore([] if name == 'empty.json' else events)
+            path = os.path.join(self.folder, name)
+            save_events(store, path)
+            self.assertEqual(load_events(path).to_dicts(), store.to_dicts())
+
+    def test_pretty_printed_version_1(self):
+        path = os.path.join(self.folder, 'old.json')
+        with open(path, 'w') as f:
+            json.dump({'total_events': len(EVENTS), 'events': EVENTS}, f, indent=2)
+        self.assertEqual(load_json(path).to_dicts(), EventStore(EVENTS).to_dicts())
+
+    def test_interrupted_save_keeps_old_file(self):
+        path = os.path.join(self.folder, 'macro.json')
+        save_events(EventStore(EVENTS), path)
+
+        class Failing(EventStore):
+            def iter_dicts(self, integer_timestamps=False):
+                yield from list(super().iter_dicts(integer_timestamps))[:2]
+                raise OSError("disk full")
+
+        with self.assertRaises(OSError):
+            save_events(Failing(EVENTS), path)
+        self.assertEqual(load_events(path).to_dicts(), EventStore(EVENTS).to_dicts())
+        self.assertEqual(os.listdir(self.folder), ['macro.json'])
+
+    def test_interrupted_mrec_save_leaves_no_temp_file(self):
+        path = os.path.join(self.folder, 'macro.mrec')
+        save_events(EventStore(EVENTS), path)
+
+        class FailingColumn(array):
+            def __getitem__(self, index):
+                raise OSError("disk full")
+
+        store = EventStore(EVENTS)
+        store.x = FailingColumn(store.x.typecode, store.x)
+        with self.assertRaises(OSError):
+            save_events(store, path)
+        self.assertEqual(load_events(path).to_dicts(), EventStore(EVENTS).to_dicts())
+        self.assertEqual(os.listdir(self.folder), ['macro.mrec'])
+
+
+class MappedMacroTest(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._folder.name, 'macro.mrec')
+        save_events(EventStore(EVENTS * MAPPED_CHUNK), self.path)
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def test_materialize_closes_the_mapping(self):
+        store = load_events(self.path, mapped=True)
+        mapping = store._map
+        store[0] = {'type': 'delay', 'duration': 1.0, 'timestamp': 0.0}
+        self.assertTrue(mapping.closed)
+        save_events(store, self.path)
+        self.assertEqual(len(load_events(self.path)), len(EVENTS) * MAPPED_CHUNK)
+
+    def test_close_unmaps_without_copying(self):
+        store = load_events(self.path, mapped=True)
+        mapping = store._map
+        store.close()
+        self.assertTrue(mapping.closed)
+        self.assertEqual(len(store), 0)
+
+    def test_running_stream_closes_the_mapping_when_done(self):
+        store = load_events(self.path, mapped=True)
+        mapping = store._map
+        rows = store.rows()
+        first = next(rows)
+        store.materialize()
+        self.assertFalse(mapping.closed)
+        self.assertEqual(1 + sum(1 for _ in rows), len(store))
+        self.assertTrue(mapping.closed)
+        self.assertEqual(first, next(store.rows()))
+
+
+if __name__ == '__main__':
+    unittest.main()
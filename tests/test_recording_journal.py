@@ -0,0 +1,51 @@
+"""
+Tests for recording through a journal that fails part-way
+"""
+import contextlib
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from input_backends import NullBackend
+from macro_recorder import MacroRecorder
+
+CHUNK = 100
+
+
+class JournalFailureTest(unittest.TestCase):
+    def record_with_failing_journal(self, journal_format, fail_on='write'):
+        recorder = MacroRecorder(backend=NullBackend())
+        # The whole capture is shorter than the 2 s trimmed off to drop the stop key
+        recorder.remove_last_seconds = lambda seconds: None
+        with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()):
+            recorder.set_journal(folder, journal_format)
+            recorder.start_recording()
+            journal = recorder.journal
+            x = 0
+            for chunk in range(3):
+                if chunk == 1:
+                    def fail(*args):
+                        raise OSError("disk full")
+                    setattr(journal, '_write' if fail_on == 'write' else '_flush', fail)
+                for _ in range(CHUNK):
+                    recorder.on_mouse_move(x, 0)
+                    x += 1
+                # Let the drain thread hand the chunk to the journal
+                time.sleep(0.1)
+            recorder.stop_recording()
+            self.assertIsNotNone(journal.error)
+            self.assertTrue(os.path.exists(journal.path))
+        return recorder
+
+    def test_rows_after_a_journal_error_are_kept(self):
+        for journal_format in ('binary', 'jsonl'):
+            for fail_on in ('write', 'flush'):
+                recorder = self.record_with_failing_journal(journal_format, fail_on)
+                self.assertEqual(list(recorder.events.x), list(range(3 * CHUNK)), (journal_format, fail_on))
+                self.assertEqual(recorder.last_journal_stats['events'], CHUNK)
+
+
+if __name__ == '__main__':
+    unittest.main()
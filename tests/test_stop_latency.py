@@ -0,0 +1,99 @@
+"""
+Stop latency tests: a stop must interrupt any wait within STOP_BOUND
+"""
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from clock import MonotonicClock, NS_PER_SECOND, VirtualClock
+from event_store import MOUSE_MOVE
+from input_backends import NullBackend
+from macro_recorder import MacroRecorder
+
+# Target is 5 ms; the bound leaves room for loaded CI machines
+STOP_BOUND = 0.05
+ROUNDS = 5
+
+
+def stop_latency(start, stop):
+    """Run start() in a thread, call stop() once it is waiting and return how long start() took to return"""
+    thread = threading.Thread(target=start, daemon=True)
+    thread.start()
+    time.sleep(0.05)
+    stopped = time.perf_counter()
+    stop()
+    thread.join(timeout=5)
+    if thread.is_alive():
+        raise AssertionError("did not return after stop")
+    return time.perf_counter() - stopped
+
+
+class ClockStopTest(unittest.TestCase):
+    def test_wait_until_returns_on_stop(self):
+        clock = MonotonicClock()
+        for spin_margin_ns in (0, 2_000_000):
+            for _ in range(ROUNDS):
+                stop_event = threading.Event()
+                result = []
+                deadline_ns = clock.now_ns() + 60 * NS_PER_SECOND
+                latency = stop_latency(
+                    lambda: result.append(clock.wait_until(deadline_ns, stop_event, spin_margin_ns)),
+                    stop_event.set)
+                self.assertEqual(result, [False])
+                self.assertLess(latency, STOP_BOUND)
+
+    def test_wait_until_reaches_deadline(self):
+        clock = MonotonicClock()
+        deadline_ns = clock.now_ns() + 10_000_000
+        self.assertTrue(clock.wait_until(deadline_ns, threading.Event(), 1_000_000))
+        self.assertGreaterEqual(clock.now_ns(), deadline_ns)
+
+    def test_virtual_clock_honours_stop(self):
+        clock = VirtualClock()
+        stop_event = threading.Event()
+        self.assertTrue(clock.wait_until(NS_PER_SECOND, stop_event))
+        self.assertEqual(clock.now_ns(), NS_PER_SECOND)
+        stop_event.set()
+        self.assertFalse(clock.wait_until(2 * NS_PER_SECOND, stop_event))
+        self.assertEqual(clock.now_ns(), NS_PER_SECOND)
+
+
+class PlaybackStopTest(unittest.TestCase):
+    def setUp(self):
+        self.recorder = MacroRecorder(backend=NullBackend())
+        # The recorder reports every run on stdout
+        self._quiet = contextlib.redirect_stdout(io.StringIO())
+        self._quiet.__enter__()
+
+    def tearDown(self):
+        self.recorder.stop_all()
+        self._quiet.__exit__(None, None, None)
+
+    def assert_stops_quickly(self, start):
+        for _ in range(ROUNDS):
+            self.assertLess(stop_latency(start, self.recorder.stop_all), STOP_BOUND)
+
+    def test_stop_during_long_delay_event(self):
+        self.recorder.events.append({'type': 'mouse_move', 'x': 0, 'y': 0, 'timestamp': 0.0})
+        self.recorder.events.append({'type': 'delay', 'duration': 60.0, 'timestamp': 0.001})
+        self.recorder.events.append({'type': 'mouse_move', 'x': 1, 'y': 1, 'timestamp': 0.002})
+        self.assert_stops_quickly(self.recorder.play_macro)
+
+    def test_stop_during_gap(self):
+        self.recorder.events.append_raw(MOUSE_MOVE, 0, 0, 0)
+        self.recorder.events.append_raw(MOUSE_MOVE, 60_000_000, 1, 1)
+        self.assert_stops_quickly(self.recorder.play_macro)
+
+    def test_stop_during_repeat_wait(self):
+        self.recorder.events.append_raw(MOUSE_MOVE, 0, 0, 0)
+        self.assert_stops_quickly(lambda: self.recorder.play_macro(repeat_interval=60, loop=True))
+
+    def test_trigger_teardown(self):
+        self.recorder.events.append_raw(MOUSE_MOVE, 0, 0, 0)
+        self.assert_stops_quickly(lambda: self.recorder.play_macro_with_trigger('f1'))
+
+
+if __name__ == '__main__':
+    unittest.main()